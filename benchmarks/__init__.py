@@ -0,0 +1,6 @@
+# -------------------------------------------------------------------------------------------------
+# Benchmarks for the hot paths of the application.
+#
+# Each module can be run on its own, e.g. `python -m benchmarks.ranking`. They require the same
+# setup as the application itself, including `lego/config.py`.
+# -------------------------------------------------------------------------------------------------
@@ -0,0 +1,89 @@
+# -------------------------------------------------------------------------------------------------
+# Compare benchmark results against a baseline.
+#
+# Takes two JSON files saved by `python -m benchmarks.suite --output` and flags any benchmark that
+# got slower by more than the threshold. Exits with a non-zero status if there are any regressions
+# so it can be used in scripts.
+#
+# Usage: python -m benchmarks.compare BASELINE RESULTS [--threshold 0.2]
+# -------------------------------------------------------------------------------------------------
+
+import json
+
+import click
+from tabulate import tabulate
+
+
+def load_results(fh) -> dict:
+    '''
+    Load a results file, keyed by (name, size).
+    '''
+    data = json.load(fh)
+    return {(r['name'], r['size']): r['seconds'] for r in data['results']}
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list:
+    '''
+    Compare results against a baseline.
+
+    :param threshold: The fraction slower a benchmark can be before it counts as a regression,
+        e.g. 0.2 for 20%.
+
+    :return: A list of (name, size, baseline seconds, seconds, ratio, status) tuples for each
+        benchmark in either file. The status is one of `ok`, `faster`, `REGRESSION`, `new` or
+        `missing`.
+    '''
+    rows = []
+
+    for key in sorted(set(baseline) | set(results), key=lambda k: (k[1] or 0, k[0])):
+        name, size = key
+        old = baseline.get(key)
+        new = results.get(key)
+
+        if old is None:
+            rows.append((name, size, None, new, None, 'new'))
+            continue
+
+        if new is None:
+            rows.append((name, size, old, None, None, 'missing'))
+            continue
+
+        ratio = new / old
+
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        else:
+            status = 'ok'
+
+        rows.append((name, size, old, new, ratio, status))
+
+    return rows
+
+
+@click.command()
+@click.argument('baseline', type=click.File())
+@click.argument('results', type=click.File())
+@click.option('--threshold', default=0.2, show_default=True,
+              help='The fraction slower a benchmark can be before it is flagged.')
+def main(baseline, results, threshold: float):
+    rows = compare(load_results(baseline), load_results(results), threshold)
+
+    def ms(seconds):
+        return '-' if seconds is None else '{:.3f}'.format(seconds * 1000)
+
+    table = [(name, size or '-', ms(old), ms(new), '-' if ratio is None else '{:.2f}'.format(ratio),
+              status) for name, size, old, new, ratio, status in rows]
+    click.echo(tabulate(table, headers=['Benchmark', 'Teams', 'Baseline (ms)', 'Now (ms)',
+                                        'Ratio', 'Status'], tablefmt='orgtbl'))
+
+    regressions = sum(1 for row in rows if row[-1] == 'REGRESSION')
+
+    if regressions:
+        click.echo('{:d} regression(s) found.'.format(regressions), err=True)
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
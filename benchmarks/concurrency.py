@@ -0,0 +1,213 @@
+# -------------------------------------------------------------------------------------------------
+# Benchmark for reading the scoreboard while judges submit scores.
+#
+# Reader threads render the scoreboard over and over, first on their own and then while judge
+# threads submit scores as fast as they can, and the read latency of each is compared. This is
+# run with the rollback journal and each judge committing their own score, as before, then with
+# WAL and the writer thread, see `lego.storage`. With WAL the latency should stay about the same
+# while judging, as the readers no longer wait for commits.
+#
+# The database is a temporary file, as an in-memory database can't be shared between threads or
+# use WAL, so the application's own data is never touched.
+#
+# Usage: python -m benchmarks.concurrency [--teams 200] [--readers 8] [--judges 8]
+# -------------------------------------------------------------------------------------------------
+
+import os
+import random
+import tempfile
+import threading
+import time
+
+import click
+from sqlalchemy import text
+from tabulate import tabulate
+
+from benchmarks.suite import seed_database
+from lego import app, db
+from lego.metrics import QUANTILES, Summary
+from lego.models import Score
+from lego.routes import _set_score
+
+
+# (name, whether to use WAL, whether to write through `app.writer`)
+MODES = (
+    ('rollback journal, direct commits', False, False),
+    ('WAL, writer thread', True, True),
+)
+
+
+def _reader(client, stop: threading.Event, latency: Summary, errors: list):
+    while not stop.is_set():
+        # the page cache would otherwise serve every read but the first after each score
+        app.page_cache.clear()
+
+        start = time.perf_counter()
+        response = client.get('/scoreboard/')
+        latency.observe(time.perf_counter() - start)
+
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+def _judge(team_ids: list, rng: random.Random, submitted: list, errors: list):
+    # as in a request, for the writes committed by this thread when the writer is disabled
+    with app.app_context():
+        for team_id in team_ids:
+            points = rng.randint(0, 20) * 10
+
+            try:
+                app.writer.submit(_set_score, team_id, (points, '{}'), None)
+            except Exception as exc:
+                errors.append(exc)
+            else:
+                submitted.append(team_id)
+
+        db.session.remove()
+
+
+def read_latency(readers: int, seconds: float=None, judges: list=None) -> dict:
+    '''
+    Render the scoreboard from `readers` threads, either for `seconds` or until every judge thread
+    has finished.
+
+    :param judges: Lists of team ids, one per judge, to submit a score for in turn.
+
+    :return: A dict of the read latencies, submissions made and errors.
+    '''
+    stop = threading.Event()
+    latency = Summary(window=1000000)
+    read_errors = []
+    submitted = []
+    write_errors = []
+
+    threads = [threading.Thread(target=_reader, args=(app.test_client(), stop, latency,
+                                                      read_errors))
+               for _ in range(readers)]
+
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+
+    if judges:
+        judge_threads = [threading.Thread(target=_judge,
+                                          args=(team_ids, random.Random(i), submitted,
+                                                write_errors))
+                         for i, team_ids in enumerate(judges)]
+
+        for thread in judge_threads:
+            thread.start()
+
+        for thread in judge_threads:
+            thread.join()
+    else:
+        time.sleep(seconds)
+
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    for thread in threads:
+        thread.join()
+
+    return {
+        'latency': dict(latency.quantiles()),
+        'reads': latency.count,
+        'read_errors': len(read_errors),
+        'submitted': len(submitted),
+        'write_errors': len(write_errors),
+        'seconds': elapsed,
+    }
+
+
+def run_modes(teams: int, readers: int, judges: int, idle: float, seed: int) -> list:
+    '''
+    Measure the read latency with and without judges submitting scores in each of `MODES`.
+
+    :return: A list of (mode, journal mode, load, result) tuples, see `read_latency`.
+    '''
+    results = []
+    config = {key: app.config.get(key) for key in ('LEGO_SQLITE_WAL', 'SQLALCHEMY_DATABASE_URI')}
+    enabled = app.writer.enabled
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+
+    try:
+        for name, wal, writer in MODES:
+            app.config['LEGO_SQLITE_WAL'] = wal
+            app.writer.enabled = writer
+
+            # reconnect so every connection has this mode's pragmas
+            db.session.remove()
+            db.engine.dispose()
+
+            with db.engine.connect() as conn:
+                journal = conn.execute(text('PRAGMA journal_mode = {!s}'
+                                            .format('WAL' if wal else 'DELETE'))).scalar()
+
+            # every team starts without a round 1 score, so each judge's scores are new attempts
+            seed_database(teams, random.Random(seed), 0)
+            Score.query.delete()
+            db.session.commit()
+            app.leaderboard.invalidate()
+
+            # each judge scores a share of the teams' three round 1 attempts
+            team_ids = list(range(1, teams + 1)) * 3
+            shares = [team_ids[i::judges] for i in range(judges)]
+
+            results.append((name, journal, 'idle', read_latency(readers, seconds=idle)))
+            results.append((name, journal, 'judging', read_latency(readers, judges=shares)))
+
+            app.writer.stop()
+    finally:
+        app.config.update(config)
+        app.writer.enabled = enabled
+        db.session.remove()
+        db.engine.dispose()
+
+        for path in (db_path, db_path + '-wal', db_path + '-shm', db_path + '-journal'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return results
+
+
+@click.command()
+@click.option('--teams', default=200, show_default=True,
+              help='Number of teams, each is scored three times.')
+@click.option('--readers', default=8, show_default=True,
+              help='Number of threads rendering the scoreboard.')
+@click.option('--judges', default=8, show_default=True,
+              help='Number of threads submitting scores.')
+@click.option('--idle', default=5.0, show_default=True,
+              help='Seconds to measure the read latency for without judges.')
+@click.option('--seed', default=0, show_default=True, help='Seed for the generated scores.')
+def main(teams: int, readers: int, judges: int, idle: float, seed: int):
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        results = run_modes(teams, readers, judges, idle, seed)
+        stats = app.writer.stats
+
+    rows = []
+
+    for name, journal, load, result in results:
+        latency = result['latency']
+        rows.append([name, journal, load, result['reads']]
+                    + [latency.get(q, 0) * 1000 for q in QUANTILES]
+                    + [result['read_errors'], result['submitted'] / result['seconds'],
+                       result['write_errors']])
+
+    headers = (['Mode', 'Journal', 'Load', 'Reads']
+               + ['p{:g} (ms)'.format(q * 100) for q in QUANTILES]
+               + ['Read errors', 'Scores/s', 'Write errors'])
+
+    click.echo(tabulate(rows, headers=headers, floatfmt='.1f', tablefmt='orgtbl'))
+    click.echo('Writer thread: {:d} commits for {:d} scores'
+               .format(stats['commits'], stats['writes']))
+
+
+if __name__ == '__main__':
+    main()
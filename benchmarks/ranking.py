@@ -0,0 +1,93 @@
+# -------------------------------------------------------------------------------------------------
+# Benchmark for ranking teams.
+#
+# Compares sorting with `cmp_to_key(util.compare_teams)`, which reloads the stage from disk for
+# every comparison, against sorting with the precomputed keys from `lego.ranking`.
+#
+# Usage: python -m benchmarks.ranking [--sizes 50,500,5000] [--repeat 3]
+# -------------------------------------------------------------------------------------------------
+
+from functools import cmp_to_key
+import os
+import random
+import tempfile
+import timeit
+
+import click
+from tabulate import tabulate
+
+from lego import app
+from lego.models import Score, Team
+from lego.models.score import score_keys
+from lego.ranking import sort_teams
+import lego.util as util
+
+
+def generate_teams(count: int, stage: int, rng: random.Random) -> list:
+    '''
+    Generate unsaved teams with scores for every stage up to and including `stage`.
+
+    Scores are multiples of 10 so there are plenty of ties for the team number to break.
+    '''
+    teams = []
+
+    for i in range(1, count + 1):
+        team = Team(id=i, number=i, name='Team {!s}'.format(i))
+
+        for score_stage, attempt_no in score_keys():
+            # leave some scores unset to cover teams that haven't competed yet
+            if score_stage <= stage and rng.random() < 0.9:
+                team.scores.append(Score(stage=score_stage, attempt_no=attempt_no,
+                                         points=rng.randint(0, 20) * 10))
+
+        teams.append(team)
+
+    rng.shuffle(teams)
+    return teams
+
+
+@click.command()
+@click.option('--sizes', default='50,500,5000', help='Comma separated numbers of teams.')
+@click.option('--stages', default='0,4', help='Comma separated stages to rank at.')
+@click.option('--repeat', default=3, help='Number of times to run each sort, the best is kept.')
+@click.option('--seed', default=0, help='Seed for the generated scores.')
+def main(sizes: str, stages: str, repeat: int, seed: int):
+    rng = random.Random(seed)
+    rows = []
+
+    fd, stage_path = tempfile.mkstemp()
+    os.close(fd)
+
+    # the old path reads the stage file for every comparison, as `app.load_stage` did
+    app.load_stage = lambda: util.load_stage(stage_path)
+
+    try:
+        for stage in [int(s) for s in stages.split(',')]:
+            with open(stage_path, 'w') as fh:
+                fh.write(str(stage))
+
+            for size in [int(s) for s in sizes.split(',')]:
+                teams = generate_teams(size, stage, rng)
+
+                old = sorted(teams, key=cmp_to_key(util.compare_teams))
+                new = sort_teams(teams)
+
+                if [t.id for t in old] != [t.id for t in new]:
+                    raise click.ClickException('Orders differ for {!s} teams at stage {!s}.'
+                                               .format(size, stage))
+
+                old_time = min(timeit.repeat(
+                    lambda: sorted(teams, key=cmp_to_key(util.compare_teams)),
+                    number=1, repeat=repeat))
+                new_time = min(timeit.repeat(lambda: sort_teams(teams), number=1, repeat=repeat))
+
+                rows.append([stage, size, old_time * 1000, new_time * 1000, old_time / new_time])
+    finally:
+        os.remove(stage_path)
+
+    click.echo(tabulate(rows, headers=['Stage', 'Teams', 'cmp_to_key (ms)', 'rank_key (ms)',
+                                       'Speed up'], floatfmt='.2f', tablefmt='orgtbl'))
+
+
+if __name__ == '__main__':
+    main()
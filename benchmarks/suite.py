@@ -0,0 +1,284 @@
+# -------------------------------------------------------------------------------------------------
+# Benchmarks for the hot paths of the application.
+#
+# Each size gets a fresh in-memory SQLite database seeded with that many teams with random scores,
+# so the application's own database and stage are never touched.
+# The best time of several runs is kept for each benchmark and the results can be saved as JSON
+# to compare later runs against with `python -m benchmarks.compare`.
+#
+# Usage: python -m benchmarks.suite [--sizes 20,200,2000] [--repeat 5] [--output results.json]
+# -------------------------------------------------------------------------------------------------
+
+from collections import OrderedDict
+from datetime import datetime
+from functools import cmp_to_key
+import json
+import platform
+import random
+import timeit
+
+import click
+from sqlalchemy.orm import subqueryload
+from tabulate import tabulate
+
+from lego import app, db
+from lego.forms.score_round_form import parse_json
+from lego.models import Score, State, Team
+from lego.models.score import score_keys
+from lego.ranking import sort_teams, update_ranks
+import lego.scoring as scoring
+import lego.util as util
+
+
+# (name, function, number of calls per run, whether it depends on the number of teams), filled in
+# by `benchmark`
+BENCHMARKS = []
+
+
+def benchmark(name: str, number: int=1, sized: bool=True):
+    '''
+    Register a benchmark. The function is called once the database is seeded and returns the
+    function to time, so any setup isn't included in the timing.
+
+    :param number: The number of calls to time per run, for benchmarks too quick to time once.
+    :param sized: Whether the benchmark depends on the number of teams. Those that don't are only
+        run once, at the first size.
+    '''
+    def decorator(func):
+        BENCHMARKS.append((name, func, number, sized))
+        return func
+
+    return decorator
+
+
+def seed_database(size: int, rng: random.Random, stage: int):
+    '''
+    Create an empty database with `size` teams with scores for every stage up to `stage`.
+    '''
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+    keys = [(s, a) for s, a in score_keys() if s <= stage]
+    rows = []
+    scores = []
+
+    for i in range(1, size + 1):
+        rows.append({'id': i, 'number': i, 'name': 'Team {:d}'.format(i), 'active': True,
+                     'is_practice': False})
+
+        for score_stage, attempt_no in keys:
+            # leave some scores unset to cover teams that haven't competed yet
+            if rng.random() < 0.9:
+                scores.append({'team_id': i, 'stage': score_stage, 'attempt_no': attempt_no,
+                               'points': rng.randint(0, 20) * 10})
+
+    with db.engine.begin() as conn:
+        conn.execute(Team.__table__.insert(), rows)
+
+        if scores:
+            conn.execute(Score.__table__.insert(), scores)
+
+        conn.execute(State.__table__.insert(), {'id': 1, 'version': 0, 'stage': stage})
+        update_ranks(conn, stage)
+
+    app.stage.invalidate()
+    app.leaderboard.invalidate()
+
+
+def score_form_data() -> dict:
+    '''
+    Form data for the score form that completes every mission, as the most expensive case.
+    '''
+    missions = scoring.load_missions()[0]
+    data = {'small_home_zone': 'y', 'team': '1'}
+
+    for key, tasks in missions.items():
+        for task_no, task in enumerate(tasks):
+            name = scoring.field_name(key, task_no)
+
+            if task['type'] in ('BooleanField', 'CheckboxField'):
+                data[name] = 'y'
+            elif task['type'] in ('RadioField', 'SelectField'):
+                data[name] = task['choices'][-1]['value']
+
+    return data
+
+
+@benchmark('sort teams with compare_teams')
+def bench_compare_teams():
+    teams = Team.query.filter_by(is_practice=False).options(subqueryload(Team.scores)).all()
+    return lambda: sorted(teams, key=cmp_to_key(util.compare_teams))
+
+
+@benchmark('sort teams with rank_key')
+def bench_sort_teams():
+    teams = Team.query.filter_by(is_practice=False).options(subqueryload(Team.scores)).all()
+    return lambda: sort_teams(teams)
+
+
+@benchmark('Team.highest_score for all teams')
+def bench_highest_score():
+    teams = Team.query.filter_by(is_practice=False).options(subqueryload(Team.scores)).all()
+    return lambda: [t.highest_score for t in teams]
+
+
+@benchmark('ScoreRoundForm.points_scored', number=20, sized=False)
+def bench_points_scored():
+    data = score_form_data()
+
+    def run():
+        with app.test_request_context(method='POST', data=data):
+            form = app.missions.form()
+            form.points_scored()
+
+    return run
+
+
+@benchmark('ScoringPlan.evaluate', number=200, sized=False)
+def bench_evaluate():
+    data = score_form_data()
+    plan = scoring.compile_missions()
+    return lambda: plan.evaluate(data)
+
+
+@benchmark('compile_missions of missions.json', number=20, sized=False)
+def bench_compile_missions():
+    return scoring.compile_missions
+
+
+@benchmark('MissionRegistry.get', number=1000, sized=False)
+def bench_mission_registry():
+    app.missions.get()
+    return app.missions.get
+
+
+@benchmark('parse_json of missions.json', number=20, sized=False)
+def bench_parse_json():
+    return parse_json
+
+
+@benchmark('set stage to the quarter final with qualification')
+def bench_qualify_teams():
+    table = Team.__table__
+    stage = app.load_stage()
+
+    def run():
+        app.stage.set(2, qualify=True)
+
+        # undo the changes for the next run, this is included in the time but is a single
+        # statement and a stage change
+        db.session.execute(table.update().values(active=True))
+        app.stage.set(stage)
+
+    return run
+
+
+def _render(path: str, app_type: str):
+    client = app.test_client()
+
+    def run():
+        app.config['LEGO_APP_TYPE'] = app_type
+
+        # the page cache would otherwise serve every run after the first
+        app.page_cache.clear()
+        response = client.get(path)
+
+        if response.status_code != 200:
+            raise click.ClickException('{!s} returned {:d}'.format(path, response.status_code))
+
+    return run
+
+
+@benchmark('render scoreboard_uk.html')
+def bench_scoreboard_uk():
+    return _render('/scoreboard/', 'uk')
+
+
+@benchmark('render scoreboard_bristol.html')
+def bench_scoreboard_bristol():
+    return _render('/scoreboard/', 'bristol')
+
+
+@benchmark('render top_ten.html')
+def bench_top_ten():
+    return _render('/top_ten', 'uk')
+
+
+def run_benchmarks(sizes: list, stage: int, repeat: int, seed: int, names: list=None) -> list:
+    '''
+    Run the benchmarks at each size.
+
+    :param names: Only run the benchmarks whose names contain one of these strings.
+
+    :return: A list of dicts with the name, size and best time per call in seconds of each
+        benchmark.
+    '''
+    rng = random.Random(seed)
+    results = []
+    app_type = app.config['LEGO_APP_TYPE']
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    try:
+        for i, size in enumerate(sizes):
+            seed_database(size, rng, stage)
+
+            for name, func, number, sized in BENCHMARKS:
+                if names and not any(n in name for n in names):
+                    continue
+
+                if not sized and i > 0:
+                    continue
+
+                timer = func()
+                best = min(timeit.repeat(timer, number=number, repeat=repeat)) / number
+                results.append(OrderedDict([
+                    ('name', name),
+                    ('size', size if sized else None),
+                    ('seconds', best),
+                ]))
+    finally:
+        app.config['LEGO_APP_TYPE'] = app_type
+
+    return results
+
+
+@click.command()
+@click.option('--sizes', default='20,200,2000', show_default=True,
+              help='Comma separated numbers of teams.')
+@click.option('--stage', type=click.IntRange(0, 4), default=0, show_default=True,
+              help='The stage to run at.')
+@click.option('--repeat', default=5, show_default=True,
+              help='Number of times to run each benchmark, the best is kept.')
+@click.option('--seed', default=0, show_default=True, help='Seed for the generated scores.')
+@click.option('--only', multiple=True,
+              help='Only run benchmarks whose name contains this. Can be given more than once.')
+@click.option('--output', type=click.File('w'), default=None,
+              help='Save the results as JSON to this file.')
+def main(sizes: str, stage: int, repeat: int, seed: int, only: tuple, output):
+    sizes = [int(s) for s in sizes.split(',')]
+
+    with app.app_context():
+        results = run_benchmarks(sizes, stage, repeat, seed, list(only))
+
+    rows = [(r['name'], r['size'] or '-', r['seconds'] * 1000) for r in results]
+    click.echo(tabulate(rows, headers=['Benchmark', 'Teams', 'Time (ms)'], floatfmt='.3f',
+                        tablefmt='orgtbl'))
+
+    if output is not None:
+        data = OrderedDict([
+            ('created', datetime.utcnow().isoformat()),
+            ('python', platform.python_version()),
+            ('stage', stage),
+            ('repeat', repeat),
+            ('seed', seed),
+            ('results', results),
+        ])
+        json.dump(data, output, indent=2)
+        output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# -------------------------------------------------------------------------------------------------
+# gunicorn settings for serving the application with a worker process per core, see `lego.wsgi`.
+# gunicorn is optional, install it with `pip install gunicorn` and run from the repository root:
+#
+#     gunicorn --config gunicorn.conf.py lego.wsgi:app
+#
+# Every display holds a scoreboard stream open for as long as it is shown. With gevent installed
+# the workers serve each request and stream on a greenlet, so hundreds of displays are cheap.
+# Otherwise each worker has a fixed number of threads and every open stream takes one of them, so
+# each worker only holds `LEGO_THREADS` less `LEGO_STREAM_RESERVED_THREADS` streams open, keeping
+# the rest of its threads for the other pages. Further displays are turned away and reload every
+# few seconds instead.
+#
+# Each setting can be changed with an environment variable:
+# - LEGO_BIND: The address to listen on. Defaults to 0.0.0.0:5000.
+# - LEGO_WORKERS: The number of worker processes. Defaults to the number of cores.
+# - LEGO_THREADS: The number of threads in each worker, unused by gevent workers. Defaults to 8.
+# - LEGO_WORKER_CLASS: The gunicorn worker class. Defaults to gevent if it is installed, otherwise
+#   gthread.
+# -------------------------------------------------------------------------------------------------
+
+import importlib.util
+import multiprocessing
+import os
+
+
+bind = os.environ.get('LEGO_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('LEGO_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('LEGO_THREADS', 8))
+worker_class = os.environ.get('LEGO_WORKER_CLASS',
+                              'gevent' if importlib.util.find_spec('gevent') else 'gthread')
+
+# the application is imported by each worker rather than once before forking, so no database
+# connection or background thread is shared between processes
+preload_app = False
+
+
+def post_worker_init(worker):
+    from gunicorn.workers.base_async import AsyncWorker
+
+    # gevent and eventlet workers aren't limited by their threads
+    if not isinstance(worker, AsyncWorker):
+        from lego import app
+
+        app.score_events.limit_threads(worker.cfg.threads)
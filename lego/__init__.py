@@ -2,8 +2,8 @@
 #
 # -------------------------------------------------------------------------------------------------
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
 import os
 import sys
 
@@ -11,6 +11,9 @@ from flask import Flask
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 
+from lego.cache import PageCache
+from lego.mission_registry import MissionRegistry
+from lego.stage import StageService
 import lego.util as util
 
 # use a helpful error message here as it can be a bit confusing otherwise
@@ -25,8 +28,17 @@ except ImportError:
 app = Flask(__name__)
 app.config.from_object(config)
 
-# initialise logging
-app.logger.addHandler(util.create_log_handler('app'))
+# initialise logging, written to the file and console by a background thread so requests only
+# have to queue each record
+del app.logger.handlers[:]
+console = logging.StreamHandler()
+console.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+app.log_listener = util.queue_logging(
+    app.logger,
+    util.create_log_handler('app', structured=app.config.get('LEGO_LOG_JSON', True)),
+    console)
+app.logger.propagate = False
+util.set_log_levels(app.config.get('LEGO_LOG_LEVELS', {'lego': 'INFO'}))
 
 # database
 db = SQLAlchemy(app)
@@ -36,11 +48,54 @@ lm = LoginManager()
 lm.init_app(app)
 lm.login_view = 'login'
 
-app.load_stage = util.load_stage
+# the current stage, stored in the database and read once per request as most requests need it
+app.stage = StageService()
+app.load_stage = app.stage.get
+
+# the missions, compiled for scoring and as the score form when first needed and whenever
+# `missions.json` changes
+app.missions = MissionRegistry()
+
+# rendered public pages, see `routes.cached_page`
+app.page_cache = PageCache(app.config.get('LEGO_PAGE_CACHE_SIZE', 128))
 
 # imports of modules that require app
 from lego import cli, routes
+from lego.events import ScoreEvents
+from lego.inspection import QueryInspector
+from lego.leaderboard import Leaderboard
+from lego.metrics import RequestMetrics, TimedTemplate
 from lego.models import User
+from lego.storage import WriteQueue, configure_sqlite
+
+# the ranking of the teams kept in memory, rebuilt from the database whenever the stage changes
+app.leaderboard = Leaderboard()
+app.stage.subscribe(app.leaderboard.invalidate)
+
+# latency, query and render time of each endpoint, served at `/metrics`
+app.metrics = RequestMetrics(app.config.get('LEGO_METRICS_WINDOW', 1000))
+app.jinja_env.template_class = TimedTemplate
+
+# statements run by each request, checked against these budgets when `LEGO_QUERY_INSPECTION` is on
+app.query_inspector = QueryInspector(app.config.get('LEGO_QUERY_BUDGET', 20),
+                                     app.config.get('LEGO_QUERY_TIME_BUDGET', 100) / 1000,
+                                     app.config.get('LEGO_QUERY_REPEAT_THRESHOLD', 5),
+                                     app.config.get('LEGO_REQUEST_TIME_BUDGET', 1000) / 1000)
+
+# pushes changes to the scores and stage to the public pages, see `routes.scoreboard_stream`
+app.score_events = ScoreEvents(app.config.get('LEGO_STREAM_POLL_INTERVAL', 2.0),
+                               app.config.get('LEGO_STREAM_MAX_CLIENTS', 500),
+                               app.config.get('LEGO_STREAM_RESERVED_THREADS', 4))
+
+# WAL and the other pragmas on every connection, and a single thread per process writing the scores
+with app.app_context():
+    configure_sqlite(db.engine)
+
+app.writer = WriteQueue(app.config.get('LEGO_WRITE_BATCH_SIZE', 32),
+                        app.config.get('LEGO_WAL_CHECKPOINT_INTERVAL', 60.0),
+                        app.config.get('LEGO_WRITE_QUEUE', True),
+                        app.config.get('LEGO_WRITE_TIMEOUT', 30.0))
+atexit.register(app.writer.stop)
 
 @lm.user_loader
 def load_user(id):
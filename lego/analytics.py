@@ -0,0 +1,79 @@
+# -------------------------------------------------------------------------------------------------
+# Questions about the missions across all teams, e.g. how often M12 is completed in round 1.
+#
+# Each is a single aggregate query over `MissionScore` using the (stage, mission) index, rather
+# than a loop over every team parsing its breakdowns. Practice teams are never included.
+# -------------------------------------------------------------------------------------------------
+
+from collections import namedtuple
+
+from sqlalchemy import Integer, cast, func
+
+from lego import db
+from lego.models import MissionScore, Score, Team
+from lego.models.score import score_key
+
+
+__all__ = ['MissionStats', 'mission_stats', 'teams_scoring']
+
+# how a mission was scored at a stage
+# - scores: the number of scores, e.g. each of a team's round 1 attempts
+# - successes: the number of those that scored any points for the mission
+MissionStats = namedtuple('MissionStats', ('stage', 'mission', 'scores', 'successes',
+                                           'success_rate', 'mean', 'max'))
+
+
+def _scores():
+    return db.session.query(MissionScore) \
+        .join(Team, Team.id == MissionScore.team_id) \
+        .filter(Team.is_practice == False)
+
+
+def mission_stats(stage: int=None, mission: str=None) -> list:
+    '''
+    Get the success rate and mean points of each mission at each stage, e.g. the success rate of
+    M12 in round 1 is `mission_stats(0, 'M12 - Design & Build')[0].success_rate`.
+
+    :param stage: Only include this stage.
+    :param mission: Only include this mission.
+
+    :return: A list of `MissionStats` ordered by stage then mission.
+    '''
+    successes = func.sum(cast(MissionScore.points > 0, Integer))
+    query = _scores().with_entities(MissionScore.stage, MissionScore.mission,
+                                    func.count(MissionScore.id), successes,
+                                    func.avg(MissionScore.points), func.max(MissionScore.points))
+
+    if stage is not None:
+        query = query.filter(MissionScore.stage == stage)
+
+    if mission is not None:
+        query = query.filter(MissionScore.mission == mission)
+
+    query = query.group_by(MissionScore.stage, MissionScore.mission) \
+        .order_by(MissionScore.stage, MissionScore.mission)
+
+    return [MissionStats(stage_, mission_, count, success, success / count, mean, max_)
+            for stage_, mission_, count, success, mean, max_ in query]
+
+
+def teams_scoring(mission: str, stage: int=None) -> list:
+    '''
+    Get the teams that scored any points for a mission, e.g. which teams scored M08.
+
+    :param stage: Only include scores at this stage.
+
+    :return: A list of (team number, team name, score, points) tuples ordered by team number, where
+        score is the team's score the points are part of, e.g. `attempt_2`.
+    '''
+    query = _scores().join(Score, Score.id == MissionScore.score_id) \
+        .with_entities(Team.number, Team.name, Score.stage, Score.attempt_no, MissionScore.points) \
+        .filter(MissionScore.mission == mission, MissionScore.points > 0)
+
+    if stage is not None:
+        query = query.filter(MissionScore.stage == stage)
+
+    query = query.order_by(Team.number, Score.stage, Score.attempt_no)
+
+    return [(number, name, score_key(score_stage, attempt_no), points)
+            for number, name, score_stage, attempt_no, points in query]
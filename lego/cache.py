@@ -0,0 +1,68 @@
+# -------------------------------------------------------------------------------------------------
+# Cache of rendered pages.
+#
+# The public scoreboard pages are refreshed every few seconds by every display but only change
+# when a score or the stage does. Rendered pages are cached against the version in the `state`
+# table, which every process sees, so a cached page is never served once anything has changed.
+# -------------------------------------------------------------------------------------------------
+
+from collections import OrderedDict
+import threading
+
+
+__all__ = ['PageCache']
+
+
+class PageCache:
+    '''
+    A bounded cache of rendered pages that evicts the least recently used page when full.
+
+    :param max_size: The maximum number of pages to keep.
+    '''
+
+    def __init__(self, max_size: int=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+
+    def get(self, key):
+        '''
+        Get a page, counting the hit or miss.
+
+        :return: The page, or None if it isn't cached.
+        '''
+        with self._lock:
+            page = self._pages.get(key)
+
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._pages.move_to_end(key)
+
+            return page
+
+    def set(self, key, page):
+        '''
+        Cache a page, evicting the least recently used page if the cache is full.
+        '''
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+
+            while len(self._pages) > self.max_size:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self) -> dict:
+        '''
+        Get the number of hits, misses and pages currently cached.
+        '''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._pages)}
@@ -4,30 +4,39 @@
 # Provides the following commands:
 # - init: Initialises the application database, creates the default users, creates the practice
 #       team and sets the stage.
+# - migrate: Upgrades a database created by an earlier version of the application.
+# - update-ranks: Recalculates the stored team ranks after the database or stage file were edited.
+# - check-leaderboard: Checks the in-memory leaderboard ranks teams the same as the database.
 # - secret: Generates a secret key to be used in config.py.
 # - add-teams: Add teams to the database.
 # - list-teams: List the teams currently in the database.
+# - mission-stats: Show how often each mission is scored, or which teams scored a mission.
+# - export: Export the teams and their scores as CSV or JSON Lines.
 # - reset-teams: Remove all non-practice teams from the database.
 # - stage: Move the stage forwards or backwards. This is for advanced usage only and should not be
 #       required while running the event itself.
 # -------------------------------------------------------------------------------------------------
 
 from base64 import b64encode
+from contextlib import contextmanager
 import os
-from random import randint, seed
+import random
+import time
 
 import bcrypt
 import click
-from sqlalchemy import asc
+from sqlalchemy import asc, event
 
 from lego import app, db
-from lego.models import User, Team
-from lego.routes import set_active_teams
+import lego.analytics as analytics
+import lego.export as export
+import lego.migrations as migrations
+import lego.team_import as team_import
+from lego.models import MissionScore, Score, User, Team, State
+from lego.ranking import update_ranks
+from lego.stage import STAGES
 from tabulate import tabulate
 
-# seed random number generation
-seed()
-
 
 @app.cli.command('init', short_help='Initialise the application.',
     help='Initialise the application by creating the database and the default '
@@ -37,6 +46,7 @@ seed()
 def init_app(admin_password, judge_password):
     click.echo('Initialising application...')
     db.create_all()
+    migrations.stamp(db.engine)
     click.echo('Database created.')
 
     admin = 'Admin'
@@ -50,6 +60,8 @@ def init_app(admin_password, judge_password):
 
     practice_team = Team(number=-1, name='Practice', is_practice=True)
     db.session.add(practice_team)
+
+    db.session.add(State(id=1, version=0))
     
     db.session.commit()
     click.echo('Default users created.')
@@ -58,6 +70,18 @@ def init_app(admin_password, judge_password):
     _set_stage()
 
 
+@app.cli.command('migrate', short_help='Upgrade the database to the latest schema.',
+    help='Upgrade a database created by an earlier version of the application to the latest '
+         'schema. Does nothing if the database is already up to date.')
+def migrate():
+    applied = migrations.upgrade(db.engine)
+
+    for name in applied:
+        click.echo('Applied migration: {!s}'.format(name))
+
+    click.echo('Database is up to date.')
+
+
 @app.cli.command('secret',
     short_help='Generate a secret key to set in config.py.',
     help='Generate a secret key to set in config.py. The key is used to encrypt '
@@ -69,43 +93,114 @@ def secret():
 
 @app.cli.command('add-teams',
     short_help='Add teams to the database from a file.',
-    help='Add teams to the database from a file. The file should contain one team per line.')
-@click.argument('file', type=click.File())
-def add_teams(file: str):
-    _add_teams(file)
-
-def _add_teams(file: str):
-    for line in file:
-        line = line.strip()
-
-        if not line:
-            continue
-
-        number, name = line.split(',', 2)
-        name = name.strip()
-
-        try:
-            number = int(number.strip())
-            assert number > 0
-        except (ValueError, AssertionError):
-            click.echo('Invalid number: {!s}'.format(number))
+    help='Add teams to the database from a file, or stdin if FILE is -. The file should contain '
+         'one `number, name` pair per line, or be CSV with a header row naming the number and '
+         'name columns. The whole file is checked first and either every team is added or none '
+         'are.')
+@click.argument('file', type=click.File(encoding='utf-8'))
+@click.option('--upsert', is_flag=True,
+              help='Rename existing teams with the same number instead of failing.')
+@click.option('--dry-run', is_flag=True, help='Check the file without adding any teams.')
+def add_teams(file, upsert: bool, dry_run: bool):
+    _add_teams(file, upsert, dry_run)
+
+
+def _add_teams(file, upsert: bool=False, dry_run: bool=False):
+    try:
+        records = team_import.parse_teams(file)
+
+        if dry_run:
+            click.echo('{:d} team(s) read, no problems found.'.format(len(records)))
             return
 
-        click.echo('Adding team: {!s} (number: {!s}).'.format(name, number))
+        result = team_import.import_teams(records, upsert)
+        db.session.commit()
 
-        team = Team(number=number, name=name)
-        
-        db.session.add(team)
-        try:
-            db.session.commit()
-        except:
-            click.echo('ERROR: ONE OR MORE TEAMS/TEAM_NUM ALREADY EXIST')
-            click.echo(' ')
-            click.echo('Have you tried \'flask reset-teams\'? ')
-            return
-        else:
-            click.echo('Team successfully added.')
+    except team_import.InvalidTeams as e:
+        db.session.rollback()
+
+        for line_no, msg in e.errors:
+            click.echo('Line {:d}: {!s}'.format(line_no, msg), err=True)
+
+        click.echo('No teams were added. {!s}.'.format(e), err=True)
+
+        if not upsert:
+            click.echo('Use --upsert to rename existing teams, or \'flask reset-teams\' to '
+                       'start again.', err=True)
+
+        raise click.Abort()
+
+    app.leaderboard.invalidate()
+    click.echo('{:d} team(s) added, {:d} updated.'.format(result.added, result.updated))
+
+
+@app.cli.command('reset-teams', short_help='Remove all non-practice teams.',
+    help='Remove all non-practice teams and their scores from the database, e.g. to import the '
+         'teams again. This can\'t be undone.')
+@click.confirmation_option(prompt='Remove every team and its scores?')
+def reset_teams():
+    _remove_teams()
+    click.echo('All non-practice teams removed.')
+
+
+@app.cli.command('update-ranks', short_help='Recalculate the stored team ranks.',
+    help='Recalculate the stored team ranks for the current stage. Only needed if the scores or '
+         'the stage file were edited outside of the application.')
+def update_ranks_command():
+    conn = db.session.connection()
+    count = update_ranks(conn, version=State.bump(conn))
+    db.session.commit()
+    click.echo('Updated the rank of {!s} team(s).'.format(count))
+
+
+@app.cli.command('check-leaderboard',
+    short_help='Check the in-memory leaderboard against the database.',
+    help='Build the in-memory leaderboard and check it ranks the teams in the same order as the '
+         'database.')
+def check_leaderboard():
+    mismatches = app.leaderboard.check_consistency()
+
+    for rank, expected, actual in mismatches:
+        click.echo('Rank {!s}: expected team id {!s}, found {!s}.'.format(rank, expected, actual))
+
+    if mismatches:
+        raise click.ClickException('The leaderboard is inconsistent with the database.')
+
+    click.echo('The leaderboard is consistent with the database.')
+
+
+@app.cli.command('mission-stats',
+    short_help='Show how often each mission is scored.',
+    help='Show the success rate and mean points of each mission at each stage, or with --teams the '
+         'teams that scored MISSION. MISSION can be the start of the name, e.g. M08.')
+@click.argument('mission', required=False)
+@click.option('--stage', type=click.IntRange(0, 4), default=None,
+              help='Only include this stage, see the Stages section of the manual.')
+@click.option('--teams', is_flag=True, help='List the teams that scored MISSION.')
+def mission_stats(mission: str, stage: int, teams: bool):
+    if mission is not None:
+        names = [m for m in app.missions.get().missions if m.startswith(mission)]
+
+        if len(names) != 1:
+            raise click.BadParameter('Matches {:d} missions.'.format(len(names)),
+                                     param_hint='MISSION')
+
+        mission = names[0]
+
+    if teams:
+        if mission is None:
+            raise click.UsageError('MISSION is required with --teams.')
 
+        rows = analytics.teams_scoring(mission, stage)
+        click.echo(tabulate(rows, headers=['Number', 'Name', 'Score', 'Points'],
+                            tablefmt='orgtbl'))
+        return
+
+    rows = [(STAGES[s.stage], s.mission, s.scores, '{:.0%}'.format(s.success_rate),
+             '{:.1f}'.format(s.mean), s.max)
+            for s in analytics.mission_stats(stage, mission)]
+    click.echo(tabulate(rows, headers=['Stage', 'Mission', 'Scores', 'Success', 'Mean', 'Max'],
+                        tablefmt='orgtbl'))
 
 
 @app.cli.command('list-teams',
@@ -130,6 +225,25 @@ def list_teams(no_practice: bool, active: bool):
         click.echo('  {:<6}   {!s}'.format(t.number, t.name))
 
 
+@app.cli.command('export', short_help='Export the teams and their scores.',
+    help='Export the teams and their scores in rank order, as on the judges\' export page. Writes '
+         'to OUTPUT, or stdout if not given.')
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(list(export.FORMATS)), default='csv',
+              show_default=True)
+@click.option('--breakdowns', is_flag=True, help='Include the points scored for each mission.')
+def export_teams(output, fmt: str, breakdowns: bool):
+    rows = export.export_rows(breakdowns)
+
+    if fmt == 'csv':
+        lines = export.iter_csv(rows, breakdowns)
+    else:
+        lines = export.iter_jsonl(rows)
+
+    for line in lines:
+        output.write(line)
+
+
 #@app.cli.command('stage', short_help='Set the current stage.',
 #    help='Set the current stage. this is for advanced usage only and may cause issues if used '
 #         'during a live event. See the manual for when this should be used.')
@@ -143,46 +257,19 @@ def stage():
 
 @stage.command("reset")
 def reset_stage():
-    stage_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tmp', '.stage')
-    stage = 0
-    stages = ('round_1', 'round_2', 'quarter_final', 'semi_final', 'final')
-    stage_txt = stages[stage]
-
-
-    click.echo('You have chosen {!s} ({!s}).'.format(stage_txt, stage))
-
-    try:
-        with open(stage_file_path, 'w') as fh:
-            fh.write(str(stage))
-    except IOError as e:
-        click.echo('Could not save stage to file. ({!s})'.format(e))
-        raise click.Abort()
-
+    _set_stage(0)
     click.echo('Successfully reset stage.')
 
 
 @stage.command("set")
 @click.argument("stage", type=click.IntRange(0, 4))
 def set_stage(stage: int=None):
-    stage_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tmp', '.stage')
-
-    stages = ('round_1', 'round_2', 'quarter_final', 'semi_final', 'final')
-    stage_txt = stages[stage]
-
     if app.config['LEGO_APP_TYPE'] == 'bristol' and stage == 1:
         click.echo('Round 2 is only available during UK final.\n'
                    'If this is not an error, please change your config.py and try again.')
         raise click.Abort()
 
-    click.echo('You have chosen {!s} ({!s}).'.format(stage_txt, stage))
-
-    try:
-        with open(stage_file_path, 'w') as fh:
-            fh.write(str(stage))
-    except IOError as e:
-        click.echo('Could not save stage to file. ({!s})'.format(e))
-        raise click.Abort()
-
+    _set_stage(stage)
     click.echo('Successfully set stage.')
 
 # flask stage get
@@ -190,97 +277,134 @@ def set_stage(stage: int=None):
 
 @stage.command("get", short_help='Get user stage')
 def get_stage():
-    stage_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tmp', '.stage')
+    stage = app.load_stage()
+    print(stage, STAGES[stage])
 
-    with open(stage_file_path) as fh:
-        content = fh.read()
 
-    stage = int(content.strip())
+def _set_stage(stage: int=0, quiet: bool=False, qualify: bool=False):
+    '''
+    Save the stage through the stage service so the change is picked up by the running
+    application, and rank the teams for the new stage.
 
-    stages = ('round_1', 'round_2', 'quarter_final', 'semi_final', 'final')
-    stage_txt = stages[stage]
+    :param qualify: Knock out the teams that didn't qualify for the new stage, as the Manage Stage
+        admin page does.
+    '''
+    if not quiet:
+        click.echo('You have chosen {!s} ({!s}).'.format(STAGES[stage], stage))
 
-    print(stage, stage_txt)
+    app.stage.set(stage, qualify)
 
-    #return bcrypt.hashpw(stage_txt.encode('utf-8')
 
+@app.cli.command('simulate', short_help='Simulate a run through the comptition.',
+    help='Simulate a run through the competition with generated teams and random scores, then '
+         'report how long each phase took and how many queries it made. Will pause at the end '
+         'of each round unless --headless is given. WARNING: This will remove any existing teams '
+         'from the database.')
+@click.option('--teams', 'team_count', type=click.IntRange(1), default=40, show_default=True,
+              help='The number of teams to generate.')
+@click.option('--seed', type=int, default=None, help='Seed for the scores, for repeatable runs.')
+@click.option('--app-type', type=click.Choice(['uk', 'bristol']), default=None,
+              help='The competition format to simulate. Defaults to LEGO_APP_TYPE.')
+@click.option('--headless', is_flag=True, help='Don\'t pause at the end of each round.')
+@click.option('--keep-teams', is_flag=True, help='Leave the teams in the database afterwards.')
+def simulate(team_count: int, seed: int, app_type: str, headless: bool, keep_teams: bool):
+    rng = random.Random(seed)
+    previous_app_type = app.config['LEGO_APP_TYPE']
+
+    if app_type is not None:
+        app.config['LEGO_APP_TYPE'] = app_type
+
+    stages = [0, 1, 2, 3, 4] if app.config['LEGO_APP_TYPE'] == 'uk' else [0, 2, 3, 4]
+    phases = []
+
+    def pause():
+        if not headless:
+            click.pause()
+
+    def score_round(name: str):
+        with _phase(phases, name):
+            teams = Team.query.filter_by(is_practice=False, active=True).all()
+
+            for t in teams:
+                t.set_score((rng.randint(0, 20) * 10, ''))
 
+            db.session.commit()
 
+        pause()
 
+    try:
+        with _phase(phases, 'Reset teams'):
+            _remove_teams()
 
+        with _phase(phases, 'Add {:d} teams'.format(team_count)):
+            records = [team_import.TeamRecord(i, i, 'Team {:d}'.format(i))
+                       for i in range(1, team_count + 1)]
+            team_import.import_teams(records)
+            db.session.commit()
 
-@app.cli.command('simulate', short_help='Simulate a run through the comptition.',
-    help='Simulate a run through the competition. Will pause at the end of each round. '
-         'WARNING: This will remove any existing teams from the database.')
-def simulate():
-    # empty the teams first
-    click.echo('Resetting teams')
-    Team.query.filter_by(is_practice=False).delete()
-    db.session.commit()
+        with _phase(phases, 'Set stage {!s}'.format(STAGES[0])):
+            _set_stage(0, True)
 
-    # add teams from example file
-    click.echo('Adding example teams')
-    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../teams_example.txt')
+        for i in range(1, 4):
+            score_round('{!s} - attempt {:d}'.format(STAGES[0], i))
 
-    with open(file_path) as fh:
-        _add_teams(fh)
+        for stage in stages[1:]:
+            # teams are knocked out on the results of the previous stage, as on the admin page
+            with _phase(phases, 'Set stage {!s}'.format(STAGES[stage])):
+                _set_stage(stage, True, qualify=True)
 
-    # set the initial stage
-    _set_stage(0, True)
+            score_round(STAGES[stage])
 
-    teams = Team.query.filter_by(is_practice=False, active=True).all()
+        if not keep_teams:
+            with _phase(phases, 'Remove teams'):
+                _remove_teams()
 
-    # round 1
-    for _ in range(3):
-        for t in teams:
-            t.set_score((randint(0, 20) * 10,""))
+    finally:
+        app.config['LEGO_APP_TYPE'] = previous_app_type
 
-        db.session.commit()
-        click.pause()
+    rows = [(name, '{:.3f}'.format(seconds), queries) for name, seconds, queries in phases]
+    rows.append(('Total', '{:.3f}'.format(sum(p[1] for p in phases)), sum(p[2] for p in phases)))
+    click.echo(tabulate(rows, headers=['Phase', 'Seconds', 'Queries'], tablefmt='orgtbl'))
+    click.echo('Complete!')
 
-    # round 2
-    if app.config['LEGO_APP_TYPE'] == 'uk':
-        _set_stage(1, True)
-        set_active_teams(1)
-        teams = Team.query.filter_by(is_practice=False, active=True).all()
 
-        for t in teams:
-            t.set_score((randint(0, 20) * 10,""))
+@contextmanager
+def _phase(phases: list, name: str):
+    '''
+    Time a phase of the simulation and count the queries it makes, appending
+    (name, seconds, queries) to `phases` once it completes.
+    '''
+    queries = [0]
 
-        db.session.commit()
-        click.pause()
+    def count(*args):
+        queries[0] += 1
 
-    _set_stage(2, True)
-    set_active_teams(2)
-    teams = Team.query.filter_by(is_practice=False, active=True).all()
+    event.listen(db.engine, 'before_cursor_execute', count)
+    start = time.perf_counter()
 
-    # quarter + semi
-    for i in range(2):
-        for t in teams:
-            t.set_score((randint(0, 20) * 10,""))
+    try:
+        yield
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
 
-        db.session.commit()
-        click.pause()
+    phases.append((name, time.perf_counter() - start, queries[0]))
 
-        _set_stage(3 + i, True)
-        set_active_teams(3 + i)
-        teams = Team.query.filter_by(is_practice=False, active=True).all()
 
-    # final
-    for i in range(2):
-        for t in teams:
-            t.set_score((randint(0, 20) * 10,""))
+def _remove_teams():
+    '''
+    Remove all non-practice teams.
+    '''
+    teams = db.session.query(Team.id).filter_by(is_practice=False)
 
-        db.session.commit()
-        click.pause()
+    for model in (MissionScore, Score):
+        model.query.filter(model.team_id.in_(teams.subquery())).delete(synchronize_session=False)
 
+    Team.query.filter_by(is_practice=False).delete(synchronize_session=False)
 
-    # remove the used teams
-    click.echo('Resetting teams')
-    Team.query.filter_by(is_practice=False).delete()
+    # a bulk delete skips the flush listeners and the cascade to the scores
+    State.bump(db.session.connection(), reset=True)
     db.session.commit()
-
-    click.echo('Complete!')
+    app.leaderboard.invalidate()
 
 
 @app.cli.group()
@@ -0,0 +1,155 @@
+# -------------------------------------------------------------------------------------------------
+# Live score events.
+#
+# The public displays used to reload every few seconds whether or not anything had changed. They
+# now hold a Server-Sent Events stream (`/scoreboard/stream`) and only reload when they are told
+# the state version has moved, i.e. a score was submitted, edited or reset or the stage changed.
+#
+# A single background poller per process watches the version in the `state` table, so changes made
+# by other processes (the CLI or other workers) are seen too. Commits made by this process wake the
+# poller straight away rather than waiting for the next poll. Each stream waits on a shared
+# condition, which costs a greenlet rather than a thread when served with gevent, see
+# `gunicorn.conf.py`.
+# -------------------------------------------------------------------------------------------------
+
+import json
+import threading
+
+from sqlalchemy import event
+
+from lego import app, db
+from lego.models import State
+
+
+__all__ = ['ScoreEvents', 'format_event']
+
+
+class ScoreEvents:
+    '''
+    Broadcasts the latest (version, stage) pair to every open stream.
+
+    :param poll_interval: The number of seconds between checks of the database for changes made by
+        other processes.
+    :param max_clients: The maximum number of streams to hold open at once. Further clients are
+        turned away and fall back to polling.
+    :param reserved_threads: The number of threads kept for other requests when each stream takes
+        a thread, see `limit_threads`.
+    '''
+
+    def __init__(self, poll_interval: float=2.0, max_clients: int=500, reserved_threads: int=4):
+        self.poll_interval = poll_interval
+        self.max_clients = max_clients
+        self.reserved_threads = reserved_threads
+
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._latest = None
+        self._clients = 0
+        self._poller = None
+
+    @property
+    def clients(self) -> int:
+        '''
+        The number of streams currently open.
+        '''
+        return self._clients
+
+    def limit_threads(self, threads: int):
+        '''
+        Hold fewer streams open than the process has threads to serve requests with, for servers
+        where each open stream takes a thread, e.g. gunicorn's gthread workers.
+        '''
+        self.max_clients = min(self.max_clients, max(threads - self.reserved_threads, 0))
+
+    def latest(self) -> tuple:
+        '''
+        Get the latest (version, stage) pair, or None if it hasn't been read yet.
+        '''
+        return self._latest
+
+    def publish(self, version: int, stage: int):
+        '''
+        Send a new (version, stage) pair to all streams if it differs from the last one.
+        '''
+        with self._cond:
+            if (version, stage) != self._latest:
+                self._latest = (version, stage)
+                self._cond.notify_all()
+
+    def poke(self):
+        '''
+        Ask the poller to check for changes now rather than at the next interval.
+        '''
+        self._wake.set()
+
+    def connect(self) -> bool:
+        '''
+        Register a new stream, starting the poller if it isn't running yet.
+
+        :return: False if there are already too many streams open.
+        '''
+        with self._cond:
+            if self._clients >= self.max_clients:
+                return False
+
+            self._clients += 1
+
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='score-events',
+                                                daemon=True)
+                self._poller.start()
+
+        return True
+
+    def disconnect(self):
+        with self._cond:
+            self._clients -= 1
+
+    def wait(self, last: tuple, timeout: float) -> tuple:
+        '''
+        Wait until the latest (version, stage) pair differs from `last`.
+
+        :return: The latest pair, which is still `last` if the timeout expired.
+        '''
+        with self._cond:
+            self._cond.wait_for(lambda: self._latest != last, timeout)
+            return self._latest
+
+    def check(self):
+        '''
+        Read the current version and stage and publish them if they changed.
+        '''
+        with app.app_context():
+            try:
+                version = State.current_version()
+
+                if version is not None:
+                    self.publish(version, app.load_stage())
+            finally:
+                db.session.remove()
+
+    def _poll(self):
+        while True:
+            # cleared before checking so a commit made during the check isn't missed
+            self._wake.clear()
+
+            try:
+                self.check()
+            except Exception as exc:
+                app.logger.exception(exc)
+
+            self._wake.wait(self.poll_interval)
+
+
+def format_event(version: int, stage: int) -> str:
+    '''
+    Format a (version, stage) pair as a Server-Sent Event.
+    '''
+    data = json.dumps({'version': version, 'stage': stage}, separators=(',', ':'))
+    return 'id: {:d}\nevent: scores\ndata: {!s}\n\n'.format(version, data)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _poke_after_commit(session):
+    # cheap enough to do on every commit, the poller only reads the version once per wake
+    app.score_events.poke()
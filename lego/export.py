@@ -0,0 +1,216 @@
+# -------------------------------------------------------------------------------------------------
+# Export of the teams and their scores.
+#
+# The export is generated a row at a time so memory use doesn't grow with the number of teams and
+# the first rows can be sent before the rest have been read. Rows can be written as CSV, quoted by
+# the `csv` module, or JSON Lines, optionally with each stored score breakdown expanded into a
+# value per mission.
+# -------------------------------------------------------------------------------------------------
+
+from collections import OrderedDict
+import csv
+import io
+from itertools import islice
+import json
+
+from sqlalchemy.orm import undefer
+
+from lego import app, db
+from lego.models import Score, Team
+from lego.models.score import score_key, score_keys, score_label
+import lego.scoring as scoring
+import lego.util as util
+
+
+__all__ = ['FORMATS', 'columns', 'export_rows', 'iter_csv', 'iter_jsonl', 'mission_names',
+           'score_columns']
+
+# the content type of each supported format
+FORMATS = OrderedDict([
+    ('csv', 'text/csv'),
+    ('jsonl', 'application/x-ndjson'),
+])
+
+# the number of teams loaded from the database at a time
+BATCH_SIZE = 100
+
+
+def mission_names(path: str=None) -> list:
+    '''
+    Get the names of the missions in the order they are scored.
+
+    :param path: The path to the missions file. Defaults to the current version of
+        `lego/missions.json`.
+    '''
+    if path is None:
+        return list(app.missions.get().missions)
+
+    return list(scoring.load_missions(path)[0])
+
+
+def score_columns(stage: int=None) -> list:
+    '''
+    Get the (key, CSV header) pairs for each score a team can make, e.g. `('attempt_1', 'Round 1 -
+    Attempt 1')`, from the attempts configured for each stage.
+
+    :param stage: Only include the scores made at this stage.
+    '''
+    return [(score_key(s, a), score_label(s, a)) for s, a in score_keys()
+            if stage is None or s == stage]
+
+
+def columns(breakdowns: bool=False, missions: list=None) -> list:
+    '''
+    Get the (key, CSV header) pairs for each column of the export.
+
+    :param breakdowns: Include a column for each mission of each score.
+    :param missions: The mission names. Defaults to those in `lego/missions.json`.
+    '''
+    round_1 = score_columns(0)
+    cols = [('rank', 'Rank'), ('number', 'Number'), ('name', 'Name')]
+    cols.extend(round_1)
+    cols.append(('best_attempt', 'Round 1 - Best'))
+    cols.extend(score_columns()[len(round_1):])
+
+    if breakdowns:
+        if missions is None:
+            missions = mission_names()
+
+        for key, header in score_columns():
+            for mission in missions:
+                cols.append(('{!s}_breakdown.{!s}'.format(key, mission),
+                             '{!s} - {!s}'.format(header, mission)))
+
+    return cols
+
+
+def export_rows(breakdowns: bool=False):
+    '''
+    Generate a row for each non-practice team in rank order.
+
+    :param breakdowns: Include the breakdown of each score as an ordered dict of the points scored
+        for each mission, keyed by e.g. `attempt_1_breakdown`, and the version of the missions that
+        scored it, keyed by e.g. `attempt_1_ruleset`.
+
+    :return: A generator of ordered dicts.
+    '''
+    query = db.session.query(Team.id, Team.number, Team.name) \
+        .filter(Team.is_practice == False) \
+        .order_by(Team.rank) \
+        .yield_per(BATCH_SIZE)
+    query = iter(query)
+    keys = score_keys()
+    round_1 = [key for key in keys if key[0] == 0]
+    rank = 0
+
+    while True:
+        teams = list(islice(query, BATCH_SIZE))
+
+        if not teams:
+            break
+
+        scores = _scores([team_id for team_id, _, _ in teams], breakdowns)
+
+        for team_id, number, name in teams:
+            rank += 1
+            made = scores.get(team_id, {})
+            row = OrderedDict()
+            row['rank'] = rank
+            row['number'] = number
+            row['name'] = name
+
+            for key in round_1:
+                row[score_key(*key)] = _points(made.get(key))
+
+            best = max([_points(made.get(key)) or -1 for key in round_1], default=-1)
+            row['best_attempt'] = None if best == -1 else best
+
+            for key in keys[len(round_1):]:
+                row[score_key(*key)] = _points(made.get(key))
+
+            if breakdowns:
+                for key in keys:
+                    score = made.get(key)
+                    row[score_key(*key) + '_breakdown'] = _breakdown(score, number)
+                    row[score_key(*key) + '_ruleset'] = score.ruleset if score else None
+
+            yield row
+
+
+def iter_csv(rows, breakdowns: bool=False):
+    '''
+    Write rows from `export_rows` as CSV, a line at a time.
+
+    :param breakdowns: Whether the rows include breakdowns, which are expanded into a column per
+        mission.
+
+    :return: A generator of strings.
+    '''
+    cols = columns(breakdowns)
+    buffer = io.StringIO()
+    # the same line endings as earlier exports
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def line(values) -> str:
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(header for _, header in cols)
+
+    for row in rows:
+        values = []
+
+        for key, _ in cols:
+            if '.' in key:
+                score, mission = key.split('.', 1)
+                value = row[score].get(mission)
+            else:
+                value = row[key]
+
+            values.append('' if value is None else value)
+
+        yield line(values)
+
+
+def iter_jsonl(rows):
+    '''
+    Write rows from `export_rows` as JSON Lines.
+
+    :return: A generator of strings.
+    '''
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def _scores(team_ids: list, breakdowns: bool) -> dict:
+    # the scores of a batch of teams, by team id then (stage, attempt number)
+    query = Score.query.filter(Score.team_id.in_(team_ids))
+
+    if breakdowns:
+        query = query.options(undefer(Score.breakdown))
+
+    scores = {}
+
+    for score in query:
+        scores.setdefault(score.team_id, {})[(score.stage, score.attempt_no)] = score
+
+    return scores
+
+
+def _points(score: Score):
+    return None if score is None else score.points
+
+
+def _breakdown(score: Score, number: int) -> OrderedDict:
+    if score is None:
+        return OrderedDict()
+
+    try:
+        return util.parse_breakdown(score.breakdown)
+    except ValueError:
+        app.logger.warning('Could not parse %s breakdown for team %s: %r', score.key, number,
+                           score.breakdown)
+        return OrderedDict()
@@ -12,14 +12,9 @@ from wtforms.validators import DataRequired, NumberRange
 
 class EditTeamScoreForm(FlaskForm):
     id = HiddenField('Id', validators=[DataRequired()])
+    # the scores that can be made, set by the view as they depend on `LEGO_STAGE_ATTEMPTS`
     stage = SelectField('Stage',
-                        choices=[('attempt_1', 'Round 1 - Attempt 1'),
-                                 ('attempt_2', 'Round 1 - Attempt 2'),
-                                 ('attempt_3', 'Round 1 - Attempt 3'),
-                                 ('round_2', 'Round 2'),
-                                 ('quarter', 'Quarter Final'),
-                                 ('semi', 'Semi Final'),
-                                 ('final', 'Final')],
+                        choices=[],
                         default='attempt_1',
                         validators=[DataRequired()])
     score = IntegerField('Score', validators=[NumberRange(min=0)])
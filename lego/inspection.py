@@ -0,0 +1,234 @@
+# -------------------------------------------------------------------------------------------------
+# Query inspection for development and staging.
+#
+# When `LEGO_QUERY_INSPECTION` is enabled, every SQL statement run by a request is recorded with
+# where in the application it came from. Statements with the same shape, i.e. the same SQL apart
+# from the values bound to it, are grouped so a query run once per team (an N+1) stands out.
+# Requests that run too many queries, spend too long in them or in total, or repeat a statement too
+# often are logged to `lego/logs/queries.log` and listed on the admin queries page.
+#
+# Recording the origin of every statement is slow, so this is off by default and shouldn't be
+# enabled during an event.
+# -------------------------------------------------------------------------------------------------
+
+from collections import deque, OrderedDict
+from datetime import datetime
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from lego import app
+import lego.util as util
+
+
+__all__ = ['QueryInspector', 'statement_shape']
+
+# the application's own files, including templates, that statements can be traced back to
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# files whose frames are never the origin of a statement
+_SKIP_FILES = {os.path.join(_APP_DIR, 'inspection.py'), os.path.join(_APP_DIR, 'metrics.py')}
+
+_IN_LIST_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+logger = logging.getLogger('lego.queries')
+logger.propagate = False
+
+# writes the reports to `queries.log`, see `_start_logging`
+_log_listener = None
+_log_lock = threading.Lock()
+
+
+def statement_shape(statement: str) -> str:
+    '''
+    Normalise a statement so that statements that only differ in the values bound to them, or the
+    number of values in an `IN` list, are the same.
+    '''
+    shape = _WHITESPACE_RE.sub(' ', statement).strip()
+    return _IN_LIST_RE.sub('(?, ...)', shape)
+
+
+class QueryInspector:
+    '''
+    Checks the statements each request runs against budgets and keeps the most recent reports of
+    requests that went over them.
+
+    :param max_queries: The number of statements a request can run before it is reported.
+    :param max_time: The number of seconds a request can spend running statements before it is
+        reported.
+    :param max_repeats: The number of times a request can run statements with the same shape before
+        it is reported as a likely N+1.
+    :param max_request_time: The number of seconds a request can take in total before it is
+        reported, e.g. rendering a template that is slow without running many statements.
+    :param keep: The number of reports to keep for the admin page.
+    '''
+
+    def __init__(self, max_queries: int=20, max_time: float=0.1, max_repeats: int=5,
+                 max_request_time: float=1.0, keep: int=50):
+        self.max_queries = max_queries
+        self.max_time = max_time
+        self.max_repeats = max_repeats
+        self.max_request_time = max_request_time
+
+        self._lock = threading.Lock()
+        self._reports = deque(maxlen=keep)
+
+    def reports(self) -> list:
+        '''
+        Get the kept reports, most recent first.
+        '''
+        with self._lock:
+            return list(reversed(self._reports))
+
+    def check(self, method: str, path: str, duration: float, statements: list) -> dict:
+        '''
+        Check the statements run by a request, logging and keeping a report if any budget was
+        exceeded.
+
+        :param duration: The number of seconds the request took.
+        :param statements: A list of (statement, seconds, origin) tuples in the order they ran.
+
+        :return: The report, or None if the request was within budget.
+        '''
+        groups = OrderedDict()
+
+        for statement, seconds, origin in statements:
+            shape = statement_shape(statement)
+            group = groups.get(shape)
+
+            if group is None:
+                group = groups[shape] = {'shape': shape, 'count': 0, 'seconds': 0.0,
+                                         'origins': OrderedDict()}
+
+            group['count'] += 1
+            group['seconds'] += seconds
+            group['origins'][origin] = group['origins'].get(origin, 0) + 1
+
+        query_time = sum(s[1] for s in statements)
+        problems = []
+
+        if len(statements) > self.max_queries:
+            problems.append('{:d} queries, budget is {:d}'.format(len(statements),
+                                                                  self.max_queries))
+
+        if query_time > self.max_time:
+            problems.append('{:.1f}ms in queries, budget is {:.1f}ms'
+                            .format(query_time * 1000, self.max_time * 1000))
+
+        if duration > self.max_request_time:
+            problems.append('{:.1f}ms in total, budget is {:.1f}ms'
+                            .format(duration * 1000, self.max_request_time * 1000))
+
+        for group in groups.values():
+            if group['count'] > self.max_repeats:
+                origins = ', '.join(group['origins'])
+                problems.append('Same statement run {:d} times, possible N+1, from {!s}'
+                                .format(group['count'], origins))
+
+        if not problems:
+            return None
+
+        report = {
+            'time': datetime.now(),
+            'method': method,
+            'path': path,
+            'duration': duration,
+            'queries': len(statements),
+            'query_time': query_time,
+            'problems': problems,
+            'groups': sorted(groups.values(), key=lambda grp: -grp['count']),
+        }
+
+        with self._lock:
+            self._reports.append(report)
+
+        _start_logging()
+        logger.warning('%s %s: %s', method, path, '; '.join(problems))
+
+        for group in report['groups']:
+            logger.info('  %dx %.1fms %s [from %s]', group['count'], group['seconds'] * 1000,
+                        group['shape'], ', '.join(group['origins']))
+
+        return report
+
+
+def _start_logging():
+    '''
+    Send reports to their own log rather than the application's. Only done once there is a report
+    to log, so `queries.log` and the thread writing it aren't created unless inspection is used.
+    '''
+    global _log_listener
+
+    with _log_lock:
+        if _log_listener is None:
+            handler = util.create_log_handler('queries', logging.INFO,
+                                              structured=app.config.get('LEGO_LOG_JSON', True))
+            _log_listener = util.queue_logging(logger, handler)
+
+
+def _origin() -> str:
+    '''
+    Find the innermost frame in the application, including templates, that isn't this module.
+    '''
+    frame = sys._getframe(2)
+
+    while frame is not None:
+        filename = frame.f_code.co_filename
+
+        if filename.startswith(_APP_DIR) and filename not in _SKIP_FILES:
+            return '{!s}:{:d} in {!s}'.format(os.path.relpath(filename, _APP_DIR),
+                                              frame.f_lineno, frame.f_code.co_name)
+
+        frame = frame.f_back
+
+    return 'unknown'
+
+
+def _statements() -> list:
+    if not has_app_context():
+        return None
+
+    return g.get('_statements')
+
+
+@app.before_request
+def _start_inspection():
+    if app.config.get('LEGO_QUERY_INSPECTION'):
+        g._statements = []
+        g._inspection_start = time.perf_counter()
+
+
+@app.after_request
+def _check_inspection(response):
+    statements = _statements()
+
+    if statements is not None:
+        duration = time.perf_counter() - g._inspection_start
+        app.query_inspector.check(request.method, request.full_path, duration, statements)
+
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    # on the execution context, which is dropped along with a failed statement
+    if _statements() is not None and context is not None:
+        context._inspection_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    statements = _statements()
+    start = getattr(context, '_inspection_start', None)
+
+    if statements is not None and start is not None:
+        statements.append((statement, time.perf_counter() - start, _origin()))
+
@@ -0,0 +1,536 @@
+# -------------------------------------------------------------------------------------------------
+# In-memory leaderboard.
+#
+# Holds the teams in rank order in an indexable skip list so that looking up a team's rank, reading
+# a range of ranks and moving a team after a new attempt each take O(log n) rather than a reload
+# and sort of the whole table.
+#
+# The Team score mutators queue their changes on the session, which are applied once the session
+# commits and discarded if it rolls back, or only those queued since a savepoint if just the
+# savepoint rolls back. Changes to the roster, e.g. adding teams or changing
+# which teams are active, and changes of stage cause a rebuild from the database on next use.
+#
+# Each process has its own leaderboard, which knows the state version it is up to date with. Once
+# per request the version is read, and if another process has committed since, only the teams
+# stamped with a later version (see `Team.version`) are reloaded.
+# -------------------------------------------------------------------------------------------------
+
+from collections import namedtuple
+from itertools import chain
+from math import log
+import random
+import threading
+
+from flask import g
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Query, object_session
+
+from lego import app, db
+from lego.models import Score, State, Team
+from lego.models.score import STAGE_KEYS, stage_attempts
+from lego.ranking import rank_key, rank_order
+
+
+__all__ = ['IndexedSkipList', 'Leaderboard']
+
+# the columns that change which teams are on the leaderboard
+ROSTER_COLUMNS = ('number', 'active', 'is_practice')
+
+# the keys of `Session.info` holding the changes queued until the session commits
+_QUEUED = ('leaderboard', 'leaderboard_rebuild', 'state_versions')
+
+
+class _End:
+    '''
+    Sentinel that compares greater than every key, marking the end of each level of a skip list.
+    '''
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __ge__(self, other):
+        return True
+
+
+_END = _End()
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next = [None] * levels
+        # the number of positions each link skips over
+        self.width = [None] * levels
+
+
+class IndexedSkipList:
+    '''
+    A sorted list of unique keys with O(log n) expected insertion, removal, lookup of a key's
+    position and lookup of the key at a position.
+
+    Based on <https://code.activestate.com/recipes/576930/>.
+
+    :param expected_size: The number of keys the list is sized for. Larger lists still work but
+        lose the O(log n) guarantee.
+    '''
+
+    def __init__(self, expected_size: int=65536):
+        self._size = 0
+        self._levels = int(1 + log(expected_size, 2))
+
+        end = _Node(_END, 0)
+        self._head = _Node(None, self._levels)
+        self._head.next = [end] * self._levels
+        self._head.width = [1] * self._levels
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        return self.islice(0, self._size)
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += self._size
+
+        if not 0 <= i < self._size:
+            raise IndexError('Index out of range: {!s}'.format(i))
+
+        return self._node_at(i).key
+
+    def insert(self, key):
+        '''
+        Insert a key, which must not already be in the list.
+        '''
+        path = [None] * self._levels
+        steps_at_level = [0] * self._levels
+        node = self._head
+
+        for level in reversed(range(self._levels)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+
+            path[level] = node
+
+        levels = min(self._levels, 1 - int(log(1.0 - random.random(), 2.0)))
+        new = _Node(key, levels)
+        steps = 0
+
+        for level in range(levels):
+            prev = path[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+
+        for level in range(levels, self._levels):
+            path[level].width[level] += 1
+
+        self._size += 1
+
+    def remove(self, key):
+        '''
+        Remove a key.
+
+        :raises KeyError: If the key is not in the list.
+        '''
+        path = [None] * self._levels
+        node = self._head
+
+        for level in reversed(range(self._levels)):
+            while node.next[level].key < key:
+                node = node.next[level]
+
+            path[level] = node
+
+        target = path[0].next[0]
+
+        if target.key is _END or target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            prev = path[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+
+        for level in range(len(target.next), self._levels):
+            path[level].width[level] -= 1
+
+        self._size -= 1
+
+    def index(self, key) -> int:
+        '''
+        Get the position of a key, starting from 0.
+
+        :raises KeyError: If the key is not in the list.
+        '''
+        node = self._head
+        position = 0
+
+        for level in reversed(range(self._levels)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+
+        if node.next[0].key is _END or node.next[0].key != key:
+            raise KeyError(key)
+
+        return position
+
+    def islice(self, start: int, stop: int):
+        '''
+        Iterate over the keys from position `start` up to but not including `stop`.
+        '''
+        stop = min(stop, self._size)
+
+        if start >= stop:
+            return
+
+        node = self._node_at(start)
+
+        for _ in range(stop - start):
+            yield node.key
+            node = node.next[0]
+
+    def _node_at(self, i: int) -> _Node:
+        node = self._head
+        # the head is position 0 so the keys start from 1
+        i += 1
+
+        for level in reversed(range(self._levels)):
+            while node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+
+        return node
+
+
+class _Scores(namedtuple('_Scores', ('id', 'number', 'active', 'is_practice', 'stages'))):
+    '''
+    A snapshot of what is needed to rank a team, taken when the team is changed. `stages` holds
+    the points of each attempt at each stage, as `Team.stage_scores`.
+    '''
+    __slots__ = ()
+
+    def stage_scores(self, stage: int) -> tuple:
+        return self.stages[stage]
+
+    @classmethod
+    def from_team(cls, team):
+        stages = tuple(tuple(team.stage_scores(s)) for s in range(len(STAGE_KEYS)))
+        return cls(team.id, team.number, team.active, team.is_practice, stages)
+
+
+class Leaderboard:
+    '''
+    The ranking of all non-practice teams, and of the active teams, for the current stage.
+    '''
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._stage = None
+        # the state version the leaderboard is up to date with
+        self._version = None
+        self._scores = {}
+        self._ranked = None
+        self._active = None
+
+    def invalidate(self, *args):
+        '''
+        Discard the leaderboard so it is rebuilt from the database on next use. Accepts and ignores
+        any arguments so it can be used as a stage listener.
+        '''
+        with self._lock:
+            self._stage = None
+
+    def rebuild(self, stage: int=None):
+        '''
+        Load all teams from the database and rank them.
+
+        :param stage: The stage to rank for. Defaults to the current stage.
+        '''
+        if stage is None:
+            stage = app.load_stage()
+
+        # read first, so a change committed while loading is reloaded by the next `sync`
+        version = State.current_version()
+        teams = _load(Team.is_practice == False)
+
+        with self._lock:
+            self._stage = stage
+            self._version = version
+            self._scores = {}
+            self._ranked = IndexedSkipList()
+            self._active = IndexedSkipList()
+
+            for scores in teams:
+                self._add(scores)
+
+    def sync(self):
+        '''
+        Reload the teams changed by other processes since the leaderboard was last up to date, or
+        rebuild it if the stage changed or teams were removed. Only checks once per application
+        context, i.e. once per request.
+        '''
+        if g.get('leaderboard_synced'):
+            return
+
+        g.leaderboard_synced = True
+
+        # notices a change of stage, which invalidates the leaderboard
+        app.load_stage()
+
+        with self._lock:
+            since = self._version
+
+        if self._stage is None or since is None:
+            return
+
+        version = State.current_version()
+
+        if version is None or version == since:
+            return
+
+        teams = _load(Team.version > since)
+        count = db.session.query(func.count(Team.id)).filter(Team.is_practice == False).scalar()
+
+        with self._lock:
+            if self._stage is None or self._version != since:
+                # rebuilt or synced by another thread in the meantime
+                return
+
+            for scores in teams:
+                self.update(scores)
+
+            self._version = version
+
+            if len(self._scores) != count:
+                self._stage = None
+
+    def advance(self, previous: int, version: int):
+        '''
+        Mark the leaderboard as up to date with a transaction committed by this process, which
+        moved the state version from `previous` to `version`, once its changes have been applied.
+        If it wasn't up to date with `previous`, the next `sync` reloads the teams changed since.
+        '''
+        with self._lock:
+            if self._version == previous:
+                self._version = version
+
+    def queue(self, team):
+        '''
+        Queue an update for a team that has been changed in its session. The update is applied
+        when the session commits.
+        '''
+        session = object_session(team)
+
+        if session is None:
+            self.update(team)
+        else:
+            session.info.setdefault('leaderboard', {})[team.id] = _Scores.from_team(team)
+
+    def update(self, team):
+        '''
+        Move a team to its new position, or add it if it isn't on the leaderboard yet.
+        '''
+        scores = team if isinstance(team, _Scores) else _Scores.from_team(team)
+
+        with self._lock:
+            if self._stage is None:
+                # the next rebuild will include the change
+                return
+
+            self._discard(scores.id)
+
+            if not scores.is_practice:
+                self._add(scores)
+
+    def rank(self, team_id: int, active: bool=False) -> int:
+        '''
+        Get the rank of a team, starting from 1.
+
+        :param active: Rank among the active teams rather than all teams.
+
+        :return: The rank, or None if the team isn't on the leaderboard.
+        '''
+        with self._lock:
+            self._ensure_built()
+            scores = self._scores.get(team_id)
+
+            if scores is None or (active and not scores.active):
+                return None
+
+            ranked = self._active if active else self._ranked
+            return ranked.index(self._key(scores)) + 1
+
+    def page(self, start: int, stop: int, active: bool=False) -> list:
+        '''
+        Get the ids of the teams ranked from `start` up to but not including `stop`, starting
+        from 1, e.g. `page(30, 41)` for ranks 30 to 40.
+
+        :param active: Rank among the active teams rather than all teams.
+        '''
+        with self._lock:
+            self._ensure_built()
+            ranked = self._active if active else self._ranked
+            return [key[-1] for key in ranked.islice(start - 1, stop - 1)]
+
+    def check_consistency(self) -> list:
+        '''
+        Compare the leaderboard against the order given by the database.
+
+        :return: A list of (rank, expected team id, leaderboard team id) tuples for each position
+            that differs. Empty if the leaderboard is consistent.
+        '''
+        with self._lock:
+            self._ensure_built()
+            stage = self._stage
+            actual = [key[-1] for key in self._ranked]
+
+        query = Query([Team.id]).filter(Team.is_practice == False).order_by(*rank_order(stage))
+        expected = [row[0] for row in db.session.execute(query.statement)]
+
+        mismatches = []
+
+        for i in range(max(len(expected), len(actual))):
+            e = expected[i] if i < len(expected) else None
+            a = actual[i] if i < len(actual) else None
+
+            if e != a:
+                mismatches.append((i + 1, e, a))
+
+        return mismatches
+
+    def _ensure_built(self):
+        self.sync()
+
+        if self._stage is None:
+            self.rebuild()
+
+    def _key(self, scores: _Scores) -> tuple:
+        # the id makes the key unique even if two teams were to share a number
+        return rank_key(scores, self._stage) + (scores.id,)
+
+    def _add(self, scores: _Scores):
+        key = self._key(scores)
+        self._scores[scores.id] = scores
+        self._ranked.insert(key)
+
+        if scores.active:
+            self._active.insert(key)
+
+    def _discard(self, team_id: int):
+        scores = self._scores.pop(team_id, None)
+
+        if scores is None:
+            return
+
+        key = self._key(scores)
+        self._ranked.remove(key)
+
+        if scores.active:
+            self._active.remove(key)
+
+
+def _load(criterion) -> list:
+    # the snapshots of the teams matching the criterion, with their scores
+    rows = db.session.query(Team.id, Team.number, Team.active, Team.is_practice) \
+        .filter(criterion).all()
+    stages = {row[0]: [[None] * stage_attempts(s) for s in range(len(STAGE_KEYS))]
+              for row in rows}
+    scores = db.session.query(Score.team_id, Score.stage, Score.attempt_no, Score.points) \
+        .join(Team, Team.id == Score.team_id) \
+        .filter(criterion)
+
+    for team_id, score_stage, attempt_no, points in scores:
+        attempts = stages[team_id][score_stage]
+
+        if attempt_no <= len(attempts):
+            attempts[attempt_no - 1] = points
+
+    return [_Scores(*row, tuple(tuple(a) for a in stages[row[0]])) for row in rows]
+
+
+def _changes_roster(session, obj) -> bool:
+    if not isinstance(obj, Team):
+        return False
+
+    if obj in session.new or obj in session.deleted:
+        return True
+
+    attrs = inspect(obj).attrs
+    return any(attrs[c].history.has_changes() for c in ROSTER_COLUMNS)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _check_roster_after_flush(session, flush_context):
+    if any(_changes_roster(session, obj)
+           for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['leaderboard_rebuild'] = True
+
+
+def _in_savepoint(session) -> bool:
+    # `Session.transaction` is the innermost transaction until SQLAlchemy 1.4, which replaced it
+    if hasattr(session, 'in_nested_transaction'):
+        return session.in_nested_transaction()
+
+    return session.transaction is not None and session.transaction.nested
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_after_commit(session):
+    # also sent as a savepoint is released, when nothing has been committed yet
+    if _in_savepoint(session):
+        return
+
+    session.info.pop('leaderboard_savepoints', None)
+    updates = session.info.pop('leaderboard', {})
+    versions = session.info.pop('state_versions', None)
+
+    if session.info.pop('leaderboard_rebuild', False):
+        app.leaderboard.invalidate()
+        return
+
+    for scores in updates.values():
+        app.leaderboard.update(scores)
+
+    if versions is not None:
+        app.leaderboard.advance(*versions)
+
+
+@event.listens_for(db.session, 'after_transaction_create')
+def _snapshot_savepoint(session, transaction):
+    '''
+    Keep what is queued when a savepoint starts, so only what was queued within it is discarded if
+    it rolls back. Anything pending has already been flushed by then.
+    '''
+    if transaction.nested:
+        snapshot = {key: session.info[key] for key in _QUEUED if key in session.info}
+
+        if 'leaderboard' in snapshot:
+            snapshot['leaderboard'] = dict(snapshot['leaderboard'])
+
+        session.info.setdefault('leaderboard_savepoints', {})[transaction] = snapshot
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_after_rollback(session, previous_transaction):
+    savepoints = session.info.pop('leaderboard_savepoints', {})
+    snapshot = savepoints.pop(previous_transaction, None) if previous_transaction.nested else None
+
+    for key in _QUEUED:
+        session.info.pop(key, None)
+
+    if snapshot is not None:
+        session.info.update(snapshot)
+        session.info['leaderboard_savepoints'] = savepoints
@@ -0,0 +1,217 @@
+# -------------------------------------------------------------------------------------------------
+# Request metrics.
+#
+# Records how long each request takes, how many SQL queries it runs and how long those queries and
+# template rendering take, per endpoint. The metrics are kept in memory by each process and served
+# in the Prometheus text format at `/metrics`, see `routes.metrics`.
+#
+# Quantiles are calculated over a sliding window of the most recent requests to each endpoint so
+# they reflect current load rather than the whole day.
+# -------------------------------------------------------------------------------------------------
+
+from collections import deque
+import threading
+import time
+
+from flask import g, has_app_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from lego import app
+
+
+__all__ = ['QUANTILES', 'Summary', 'RequestMetrics', 'TimedTemplate']
+
+# the quantiles reported for each summary
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Summary:
+    '''
+    The count and total of all observations, plus a window of the most recent observations to
+    calculate quantiles from.
+
+    :param window: The number of recent observations to keep.
+    '''
+
+    def __init__(self, window: int=1000):
+        self.count = 0
+        self.total = 0.0
+        self._window = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self._window.append(value)
+
+    def quantiles(self, quantiles=QUANTILES) -> list:
+        '''
+        Get the value at each quantile of the recent observations, using the nearest rank.
+
+        :return: A list of (quantile, value) tuples. Empty if there are no observations.
+        '''
+        values = sorted(self._window)
+
+        if not values:
+            return []
+
+        return [(q, values[min(len(values) - 1, int(q * len(values)))]) for q in quantiles]
+
+
+class RequestMetrics:
+    '''
+    Per-endpoint summaries of request duration, query count, query time and render time.
+
+    :param window: The number of recent requests to each endpoint to calculate quantiles from.
+    '''
+
+    # (name, help) of each summary, in the order they are reported
+    SUMMARIES = (
+        ('lego_request_duration_seconds', 'Time taken to handle a request.'),
+        ('lego_request_queries', 'Number of SQL queries run by a request.'),
+        ('lego_request_query_seconds', 'Time spent running SQL queries in a request.'),
+        ('lego_request_render_seconds', 'Time spent rendering templates in a request.'),
+    )
+
+    def __init__(self, window: int=1000):
+        self.window = window
+
+        self._lock = threading.Lock()
+        # endpoint -> list of summaries, in the same order as `SUMMARIES`
+        self._summaries = {}
+        # (endpoint, status) -> count
+        self._responses = {}
+
+    def observe(self, endpoint: str, status: int, duration: float, queries: int,
+                query_time: float, render_time: float):
+        '''
+        Record a finished request.
+        '''
+        with self._lock:
+            summaries = self._summaries.get(endpoint)
+
+            if summaries is None:
+                summaries = [Summary(self.window) for _ in self.SUMMARIES]
+                self._summaries[endpoint] = summaries
+
+            for summary, value in zip(summaries, (duration, queries, query_time, render_time)):
+                summary.observe(value)
+
+            key = (endpoint, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def render(self, gauges: list=(), counters: list=()) -> str:
+        '''
+        Format the metrics in the Prometheus text format.
+
+        :param gauges: Extra (name, help, value) tuples to report as gauges.
+        :param counters: Extra (name, help, value) tuples to report as counters, for values that
+            only ever go up. Each name should end in `_total`.
+        '''
+        lines = []
+
+        with self._lock:
+            endpoints = sorted(self._summaries)
+
+            for i, (name, help_text) in enumerate(self.SUMMARIES):
+                lines.append('# HELP {!s} {!s}'.format(name, help_text))
+                lines.append('# TYPE {!s} summary'.format(name))
+
+                for endpoint in endpoints:
+                    summary = self._summaries[endpoint][i]
+                    label = _escape(endpoint)
+
+                    for q, value in summary.quantiles():
+                        lines.append('{!s}{{endpoint="{!s}",quantile="{!s}"}} {!r}'
+                                     .format(name, label, q, float(value)))
+
+                    lines.append('{!s}_sum{{endpoint="{!s}"}} {!r}'
+                                 .format(name, label, float(summary.total)))
+                    lines.append('{!s}_count{{endpoint="{!s}"}} {:d}'
+                                 .format(name, label, summary.count))
+
+            lines.append('# HELP lego_responses_total Number of responses sent.')
+            lines.append('# TYPE lego_responses_total counter')
+
+            for (endpoint, status), count in sorted(self._responses.items()):
+                lines.append('lego_responses_total{{endpoint="{!s}",status="{:d}"}} {:d}'
+                             .format(_escape(endpoint), status, count))
+
+        for kind, metrics in (('counter', counters), ('gauge', gauges)):
+            for name, help_text, value in metrics:
+                lines.append('# HELP {!s} {!s}'.format(name, help_text))
+                lines.append('# TYPE {!s} {!s}'.format(name, kind))
+                lines.append('{!s} {!r}'.format(name, value))
+
+        return '\n'.join(lines) + '\n'
+
+
+class TimedTemplate(Template):
+    '''
+    Template that adds the time it takes to render to the current request's metrics.
+    '''
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            state = _request_state()
+
+            if state is not None:
+                state['render_time'] += time.perf_counter() - start
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _request_state() -> dict:
+    if not has_app_context():
+        return None
+
+    return g.get('_metrics')
+
+
+@app.before_request
+def _start_request_metrics():
+    g._metrics = {
+        'start': time.perf_counter(),
+        'queries': 0,
+        'query_time': 0.0,
+        'render_time': 0.0,
+    }
+
+
+@app.after_request
+def _record_request_metrics(response):
+    state = _request_state()
+
+    if state is not None:
+        state['duration'] = time.perf_counter() - state['start']
+        app.metrics.observe(request.endpoint or 'unknown', response.status_code,
+                            state['duration'], state['queries'], state['query_time'],
+                            state['render_time'])
+
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    state = _request_state()
+
+    # kept with the statement rather than the connection, so nothing is left behind if it fails
+    if state is not None and context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    state = _request_state()
+    start = getattr(context, '_metrics_start', None)
+
+    if state is not None and start is not None:
+        state['queries'] += 1
+        state['query_time'] += time.perf_counter() - start
@@ -0,0 +1,292 @@
+# -------------------------------------------------------------------------------------------------
+# Database migrations.
+#
+# `flask init` creates the latest schema directly with `db.create_all()`, these bring databases
+# created by earlier versions of the application up to date. The number of migrations applied is
+# stored in SQLite's `user_version` pragma. Migrations must be safe to run against a database that
+# already has the change, e.g. by using `IF NOT EXISTS`, as DDL is not always transactional.
+#
+# Migrations only use SQL written for the schema as it is at that point in the history, never the
+# models or application code, which expect the latest schema. The stored ranks are recalculated
+# once all of them have been applied.
+# -------------------------------------------------------------------------------------------------
+
+import json
+import sqlite3
+
+from sqlalchemy import text
+
+
+__all__ = ['MIGRATIONS', 'TEAM_SCORE_COLUMNS', 'current_version', 'has_column', 'stamp',
+           'upgrade']
+
+# the migrations in the order they are applied
+MIGRATIONS = []
+
+# the score columns teams had before `add_scores`, with the stage and attempt of each
+TEAM_SCORE_COLUMNS = (
+    ('attempt_1', 0, 1),
+    ('attempt_2', 0, 2),
+    ('attempt_3', 0, 3),
+    ('round_2', 1, 1),
+    ('quarter', 2, 1),
+    ('semi', 3, 1),
+    ('final', 4, 1),
+)
+
+
+def migration(func):
+    '''
+    Register a function as the next migration. It is called with a connection within a
+    transaction.
+    '''
+    MIGRATIONS.append(func)
+    return func
+
+
+def current_version(conn) -> int:
+    '''
+    Get the number of migrations that have been applied to a database.
+    '''
+    return conn.execute(text('PRAGMA user_version')).scalar()
+
+
+def stamp(engine):
+    '''
+    Mark a database as having all migrations applied, e.g. after it was created by `create_all`.
+    '''
+    with engine.begin() as conn:
+        conn.execute(text('PRAGMA user_version = {:d}'.format(len(MIGRATIONS))))
+
+
+def has_column(conn, table: str, column: str) -> bool:
+    '''
+    Check whether a table already has a column.
+    '''
+    rows = conn.execute(text('PRAGMA table_info({!s})'.format(table))).fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def upgrade(engine) -> list:
+    '''
+    Apply any migrations that haven't been applied to a database yet, then rank the teams with the
+    latest schema.
+
+    :return: The names of the migrations that were applied.
+    '''
+    applied = []
+
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+        for i, func in enumerate(MIGRATIONS[version:], start=version + 1):
+            func(conn)
+            conn.execute(text('PRAGMA user_version = {:d}'.format(i)))
+            applied.append(func.__name__)
+
+        if applied:
+            _rank_teams(conn)
+
+    return applied
+
+
+def _rank_teams(conn):
+    # imported here as ranking needs the application
+    from lego.ranking import update_ranks
+
+    # read through this connection, as the application's session may not see the upgraded schema
+    stage = conn.execute(text('SELECT stage FROM state WHERE id = 1')).scalar()
+    update_ranks(conn, stage or 0)
+
+
+@migration
+def add_team_is_practice_active_index(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_team_is_practice_active '
+                      'ON team (is_practice, active)'))
+
+
+@migration
+def add_team_ranks(conn):
+    # filled in by `upgrade` once the rest of the schema is up to date
+    for column in ('rank', 'stage_rank'):
+        if not has_column(conn, 'team', column):
+            conn.execute(text('ALTER TABLE team ADD COLUMN {!s} INTEGER'.format(column)))
+
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_team_{0!s} ON team ({0!s})'
+                          .format(column)))
+
+
+@migration
+def add_state(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS state ('
+                      'id INTEGER NOT NULL PRIMARY KEY, '
+                      'version INTEGER NOT NULL)'))
+    conn.execute(text('INSERT OR IGNORE INTO state (id, version) VALUES (1, 0)'))
+
+
+@migration
+def add_team_version(conn):
+    if not has_column(conn, 'team', 'version'):
+        conn.execute(text('ALTER TABLE team ADD COLUMN version INTEGER NOT NULL DEFAULT 0'))
+
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_team_version ON team (version)'))
+
+
+@migration
+def add_team_rulesets(conn):
+    for score in ('attempt_1', 'attempt_2', 'attempt_3', 'round_2', 'quarter', 'semi', 'final'):
+        column = '{!s}_ruleset'.format(score)
+
+        if not has_column(conn, 'team', column):
+            conn.execute(text('ALTER TABLE team ADD COLUMN {!s} VARCHAR(12)'.format(column)))
+
+
+@migration
+def add_mission_scores(conn):
+    # imported here as util is loaded with the application
+    import lego.util as util
+
+    conn.execute(text('CREATE TABLE IF NOT EXISTS mission_score ('
+                      'id INTEGER NOT NULL PRIMARY KEY, '
+                      'team_id INTEGER NOT NULL REFERENCES team (id) ON DELETE CASCADE, '
+                      'score VARCHAR(16) NOT NULL, '
+                      'stage INTEGER NOT NULL, '
+                      'mission VARCHAR(80) NOT NULL, '
+                      'points INTEGER NOT NULL, '
+                      'UNIQUE (team_id, score, mission))'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_mission_score_stage_mission '
+                      'ON mission_score (stage, mission)'))
+    conn.execute(text('DELETE FROM mission_score'))
+
+    # breakdowns were stored as the repr of an ordered dict, rewrite them as JSON and fill in the
+    # table from them
+    columns = ', '.join('{!s}_breakdown'.format(score) for score, _, _ in TEAM_SCORE_COLUMNS)
+    rows = conn.execute(text('SELECT id, {!s} FROM team'.format(columns))).fetchall()
+    inserts = []
+
+    for row in rows:
+        team_id, breakdowns = row[0], row[1:]
+        updates = {}
+
+        for (score, stage, _), breakdown in zip(TEAM_SCORE_COLUMNS, breakdowns):
+            if not breakdown:
+                continue
+
+            try:
+                points = util.parse_breakdown(breakdown)
+            except ValueError:
+                # left as it is, the export logs it
+                continue
+
+            updates['{!s}_breakdown'.format(score)] = json.dumps(points)
+
+            for mission, value in points.items():
+                inserts.append({'team_id': team_id, 'score': score, 'stage': stage,
+                                'mission': mission, 'points': value})
+
+        if updates:
+            assignments = ', '.join('{0!s} = :{0!s}'.format(column) for column in updates)
+            conn.execute(text('UPDATE team SET {!s} WHERE id = :id'.format(assignments)),
+                         dict(updates, id=team_id))
+
+    if inserts:
+        conn.execute(text('INSERT INTO mission_score (team_id, score, stage, mission, points) '
+                          'VALUES (:team_id, :score, :stage, :mission, :points)'), inserts)
+
+
+@migration
+def add_scores(conn):
+    # imported here as util is loaded with the application
+    import lego.util as util
+
+    conn.execute(text('CREATE TABLE IF NOT EXISTS score ('
+                      'id INTEGER NOT NULL PRIMARY KEY, '
+                      'team_id INTEGER NOT NULL REFERENCES team (id) ON DELETE CASCADE, '
+                      'stage INTEGER NOT NULL, '
+                      'attempt_no INTEGER NOT NULL, '
+                      'points INTEGER NOT NULL, '
+                      'breakdown VARCHAR, '
+                      'ruleset VARCHAR(12), '
+                      'UNIQUE (team_id, stage, attempt_no))'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_score_stage_team_points '
+                      'ON score (stage, team_id, points)'))
+
+    # the scores move from a column for each on the team to a row each
+    if has_column(conn, 'team', 'attempt_1'):
+        conn.execute(text('DELETE FROM score'))
+
+        for score, stage, attempt_no in TEAM_SCORE_COLUMNS:
+            conn.execute(text('INSERT INTO score '
+                              '(team_id, stage, attempt_no, points, breakdown, ruleset) '
+                              'SELECT id, :stage, :attempt_no, {0!s}, {0!s}_breakdown, '
+                              '{0!s}_ruleset FROM team WHERE {0!s} IS NOT NULL'.format(score)),
+                         {'stage': stage, 'attempt_no': attempt_no})
+
+    # the mission scores belong to a score rather than a column, so are rebuilt from the
+    # breakdowns
+    conn.execute(text('DROP TABLE IF EXISTS mission_score'))
+    conn.execute(text('CREATE TABLE mission_score ('
+                      'id INTEGER NOT NULL PRIMARY KEY, '
+                      'score_id INTEGER NOT NULL REFERENCES score (id) ON DELETE CASCADE, '
+                      'team_id INTEGER NOT NULL REFERENCES team (id) ON DELETE CASCADE, '
+                      'stage INTEGER NOT NULL, '
+                      'mission VARCHAR(80) NOT NULL, '
+                      'points INTEGER NOT NULL, '
+                      'UNIQUE (score_id, mission))'))
+    conn.execute(text('CREATE INDEX ix_mission_score_stage_mission '
+                      'ON mission_score (stage, mission)'))
+
+    rows = conn.execute(text('SELECT id, team_id, stage, breakdown FROM score '
+                             'WHERE breakdown IS NOT NULL')).fetchall()
+    inserts = []
+
+    for score_id, team_id, stage, breakdown in rows:
+        try:
+            points = util.parse_breakdown(breakdown)
+        except ValueError:
+            # left as it is, the export logs it
+            continue
+
+        for mission, value in points.items():
+            inserts.append({'score_id': score_id, 'team_id': team_id, 'stage': stage,
+                            'mission': mission, 'points': value})
+
+    if inserts:
+        conn.execute(text('INSERT INTO mission_score (score_id, team_id, stage, mission, points) '
+                          'VALUES (:score_id, :team_id, :stage, :mission, :points)'), inserts)
+
+    # SQLite can only drop columns from 3.35, older versions leave them unused
+    if has_column(conn, 'team', 'attempt_1') and sqlite3.sqlite_version_info >= (3, 35, 0):
+        for score, _, _ in TEAM_SCORE_COLUMNS:
+            for column in (score, score + '_breakdown', score + '_ruleset'):
+                conn.execute(text('ALTER TABLE team DROP COLUMN {!s}'.format(column)))
+
+
+@migration
+def add_state_stage(conn):
+    # imported here as util is loaded with the application
+    import lego.util as util
+
+    if has_column(conn, 'state', 'stage'):
+        return
+
+    conn.execute(text('ALTER TABLE state ADD COLUMN stage INTEGER NOT NULL DEFAULT 0'))
+
+    # carry over the stage from the file it was kept in before
+    try:
+        stage = util.load_stage()
+    except (OSError, ValueError):
+        stage = 0
+
+    conn.execute(text('UPDATE state SET stage = :stage WHERE id = 1'), {'stage': stage})
+
+
+@migration
+def add_state_reset_version(conn):
+    if has_column(conn, 'state', 'reset_version'):
+        return
+
+    conn.execute(text('ALTER TABLE state ADD COLUMN reset_version INTEGER NOT NULL DEFAULT 0'))
+
+    # teams may have been deleted before this was recorded
+    conn.execute(text('UPDATE state SET reset_version = version'))
@@ -0,0 +1,136 @@
+# -------------------------------------------------------------------------------------------------
+# In-process cache of the missions, compiled for scoring and as the score form.
+#
+# `missions.json` is loaded the first time it is needed rather than on import, and reloaded when
+# the file changes, so a mission can be corrected during an event without restarting. Each version
+# of the file is compiled once into a `Ruleset`, which is swapped in as a whole so a request always
+# scores with the same version it rendered the form with. The version is a hash of the file, so it
+# is the same in every process and is stored with each score to show which rules scored it.
+# -------------------------------------------------------------------------------------------------
+
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import lego.scoring as scoring
+
+
+__all__ = ['MissionRegistry', 'Ruleset']
+
+# a compiled version of the missions file
+# - version: the first 12 hex digits of the SHA-1 of the file
+# - missions: the missions and their tasks, from `scoring.load_missions`
+# - plan: the `scoring.ScoringPlan`
+# - form_class: the score form class, from `score_round_form.score_form`
+Ruleset = namedtuple('Ruleset', ('version', 'missions', 'plan', 'form_class'))
+
+logger = logging.getLogger('lego.missions')
+
+
+class MissionRegistry:
+    '''
+    Keeps the compiled missions in memory, recompiling them when the missions file changes.
+
+    :param path: The path to the missions file. Defaults to `lego/missions.json`.
+    :param check_interval: The minimum number of seconds between checks of the missions file for
+        changes.
+    '''
+
+    def __init__(self, path: str=None, check_interval: float=1.0):
+        if path is None:
+            cur_path = os.path.dirname(os.path.abspath(__file__))
+            path = os.path.join(cur_path, 'missions.json')
+
+        self.path = path
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+
+        # (ruleset, file signature, time last checked) replaced as a whole so that threads reading
+        # without the lock always see a consistent snapshot
+        self._state = (None, None, 0.0)
+
+    def get(self) -> Ruleset:
+        '''
+        Get the current version of the missions, loading them if the file has changed.
+
+        If the file has changed but can't be compiled, e.g. while it is being edited, the previous
+        version is kept and the error logged.
+
+        :raises ValueError: If the missions have never been loaded and the file is invalid.
+        '''
+        ruleset, _, checked = self._state
+
+        if ruleset is not None and time.monotonic() - checked < self.check_interval:
+            return ruleset
+
+        return self._refresh()
+
+    def form(self, *args, **kwargs):
+        '''
+        Create a score form for the current version of the missions.
+        '''
+        return self.get().form_class(*args, **kwargs)
+
+    def invalidate(self):
+        '''
+        Force the file to be checked for changes on the next call to `get`.
+        '''
+        with self._lock:
+            self._state = (self._state[0], None, 0.0)
+
+    def _refresh(self) -> Ruleset:
+        with self._lock:
+            ruleset, old_signature, _ = self._state
+            signature = self._signature()
+
+            if ruleset is None or signature is None or signature != old_signature:
+                try:
+                    ruleset = self._load(ruleset)
+                except (OSError, ValueError, KeyError, TypeError):
+                    if ruleset is None:
+                        raise
+
+                    logger.exception('Could not reload %s, still using version %s', self.path,
+                                     ruleset.version)
+
+            self._state = (ruleset, signature, time.monotonic())
+
+        return ruleset
+
+    def _load(self, previous: Ruleset) -> Ruleset:
+        # imported here as the forms need the application
+        from lego.forms.score_round_form import score_form
+
+        with open(self.path, 'rb') as fh:
+            content = fh.read()
+
+        version = hashlib.sha1(content).hexdigest()[:12]
+
+        # touched or replaced with the same contents
+        if previous is not None and previous.version == version:
+            return previous
+
+        missions, bonuses = scoring.split_missions(json.loads(content.decode('utf-8')))
+        plan = scoring.compile_plan(missions, bonuses)
+        form_class = score_form(missions, plan, version)
+
+        if previous is not None:
+            logger.warning('Reloaded %s, version %s replaces %s', self.path, version,
+                           previous.version)
+
+        return Ruleset(version, missions, plan, form_class)
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+
+        # the inode changes when the file is replaced, the modification time catches the file
+        # being edited in place
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
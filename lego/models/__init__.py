@@ -3,4 +3,7 @@
 # -----------------------------------------------------------------------------
 
 from lego.models.user import User
+from lego.models.mission_score import MissionScore
+from lego.models.score import Score
 from lego.models.team import Team
+from lego.models.state import State
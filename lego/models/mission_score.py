@@ -0,0 +1,37 @@
+# -----------------------------------------------------------------------------
+# The model for the points a team scored for a mission in the database.
+# -----------------------------------------------------------------------------
+
+from lego import db
+
+
+__all__ = ['MissionScore']
+
+
+class MissionScore(db.Model):
+    '''
+    One row of a score's breakdown, e.g. the points scored for M01 in a team's second attempt.
+
+    The same breakdown is stored as JSON on the score, see `Score.breakdown`. This table is written
+    alongside it so questions about a mission across all teams can be answered by the database,
+    see `lego.analytics`. The team and stage are copied from the score so those questions don't
+    need to join it.
+    '''
+    __tablename__ = 'mission_score'
+    __table_args__ = (
+        db.UniqueConstraint('score_id', 'mission'),
+        db.Index('ix_mission_score_stage_mission', 'stage', 'mission'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    score_id = db.Column(db.Integer, db.ForeignKey('score.id', ondelete='CASCADE'),
+                         nullable=False)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id', ondelete='CASCADE'),
+                        nullable=False)
+    stage = db.Column(db.Integer, nullable=False)
+    mission = db.Column(db.String(80), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return '<MissionScore score_id={!r}, mission={!r}, points={!r}>' \
+            .format(self.score_id, self.mission, self.points)
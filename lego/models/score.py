@@ -0,0 +1,147 @@
+# -----------------------------------------------------------------------------
+# The model for a score a team made in the database.
+# -----------------------------------------------------------------------------
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Query, deferred
+
+from lego import app, db
+from lego.models.mission_score import MissionScore
+
+
+__all__ = ['NoAttemptsLeft', 'Score', 'parse_score_key', 'score_key', 'score_keys',
+           'score_label', 'stage_attempts']
+
+# the number of attempts each team has at each stage, indexed by stage, unless set by
+# `LEGO_STAGE_ATTEMPTS`
+DEFAULT_ATTEMPTS = (3, 1, 1, 1, 1)
+
+# the names used in score keys and labels for each stage, see `score_key` and `score_label`
+STAGE_KEYS = ('attempt', 'round_2', 'quarter', 'semi', 'final')
+STAGE_LABELS = ('Round 1', 'Round 2', 'Quarter Final', 'Semi Final', 'Final')
+
+
+class NoAttemptsLeft(Exception):
+    '''
+    Raised when a score is added for a team that has made all of its attempts at a stage.
+    '''
+
+    def __init__(self):
+        super().__init__('All attempts have been made for this stage.')
+
+
+def stage_attempts(stage: int) -> int:
+    '''
+    Get the number of attempts each team has at a stage.
+    '''
+    return app.config.get('LEGO_STAGE_ATTEMPTS', DEFAULT_ATTEMPTS)[stage]
+
+
+def score_key(stage: int, attempt_no: int) -> str:
+    '''
+    Get the name of a score as used in forms and exports, e.g. `attempt_2` for the second attempt
+    in round 1, `quarter` for the quarter final and `quarter_2` for a second attempt at it.
+    '''
+    if stage == 0:
+        return 'attempt_{:d}'.format(attempt_no)
+
+    if attempt_no == 1:
+        return STAGE_KEYS[stage]
+
+    return '{!s}_{:d}'.format(STAGE_KEYS[stage], attempt_no)
+
+
+def parse_score_key(key: str) -> (int, int):
+    '''
+    Get the (stage, attempt number) of a score from its name, see `score_key`.
+
+    :raises ValueError: If the name isn't of a score that can be made.
+    '''
+    for stage, name in enumerate(STAGE_KEYS):
+        if key == name and stage > 0:
+            attempt_no = 1
+        elif key.startswith(name + '_') and key[len(name) + 1:].isdigit():
+            attempt_no = int(key[len(name) + 1:])
+        else:
+            continue
+
+        if 1 <= attempt_no <= stage_attempts(stage):
+            return stage, attempt_no
+
+    raise ValueError('Unknown score: {!s}'.format(key))
+
+
+def score_keys() -> list:
+    '''
+    Get the (stage, attempt number) of every score a team can make, in order.
+    '''
+    return [(stage, attempt_no)
+            for stage in range(len(STAGE_KEYS))
+            for attempt_no in range(1, stage_attempts(stage) + 1)]
+
+
+def score_label(stage: int, attempt_no: int) -> str:
+    '''
+    Get the name of a score as shown to judges, e.g. `Round 1 - Attempt 2`.
+    '''
+    if stage_attempts(stage) == 1:
+        return STAGE_LABELS[stage]
+
+    return '{!s} - Attempt {:d}'.format(STAGE_LABELS[stage], attempt_no)
+
+
+class Score(db.Model):
+    '''
+    A score made by a team, e.g. their second attempt in round 1.
+
+    Kept apart from the team so listing the teams doesn't load their scores, and loading the
+    scores doesn't load their breakdowns, which are only needed by the export.
+    '''
+    __tablename__ = 'score'
+    __table_args__ = (
+        db.UniqueConstraint('team_id', 'stage', 'attempt_no'),
+        # the best score of each team at a stage is read from the index alone
+        db.Index('ix_score_stage_team_points', 'stage', 'team_id', 'points'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id', ondelete='CASCADE'),
+                        nullable=False)
+    stage = db.Column(db.Integer, nullable=False)
+    # from 1, up to `stage_attempts(stage)`
+    attempt_no = db.Column(db.Integer, nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    # the JSON object of the points scored for each mission, see `util.parse_breakdown`
+    breakdown = deferred(db.Column(db.String, nullable=True))
+    # the version of the missions that scored it, see `mission_registry.Ruleset`
+    ruleset = db.Column(db.String(12), nullable=True)
+    # the breakdown as rows, so deleted with the score
+    mission_scores = db.relationship(MissionScore, cascade='all, delete-orphan')
+
+    @property
+    def key(self) -> str:
+        return score_key(self.stage, self.attempt_no)
+
+    @staticmethod
+    def free_attempt(team_id: int, stage: int):
+        '''
+        Build a SQL expression for a team's first attempt at a stage that hasn't been made, or
+        NULL if they all have.
+
+        Assigned to `attempt_no` of a new score, the attempt is chosen by the INSERT itself, so two
+        scores submitted for a team at the same time can't both take the same attempt.
+        '''
+        made = Query([Score.attempt_no]).filter(Score.team_id == team_id, Score.stage == stage)
+        # the first attempt, and the one after each that was made
+        slots = Query([literal(1).label('slot')]) \
+            .union(Query([(Score.attempt_no + 1).label('slot')])
+                   .filter(Score.team_id == team_id, Score.stage == stage)) \
+            .subquery()
+
+        return Query([func.min(slots.c.slot)]) \
+            .filter(slots.c.slot <= stage_attempts(stage), ~slots.c.slot.in_(made)) \
+            .as_scalar()
+
+    def __repr__(self):
+        return '<Score team_id={!r}, stage={!r}, attempt_no={!r}, points={!r}>' \
+            .format(self.team_id, self.stage, self.attempt_no, self.points)
@@ -0,0 +1,98 @@
+# -----------------------------------------------------------------------------
+# The model for the competition state shared between processes.
+# -----------------------------------------------------------------------------
+
+from itertools import chain
+
+from sqlalchemy import event, text
+
+from lego import db
+from lego.models.score import Score
+from lego.models.team import Team
+
+
+__all__ = ['State']
+
+
+class State(db.Model):
+    '''
+    A single row holding the state of the competition.
+
+    `version` is incremented within the same transaction as every change to a team and every change
+    of stage, so anything derived from the teams can be cached against it.
+    '''
+    __tablename__ = 'state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    # the current stage, see `StageService`
+    stage = db.Column(db.Integer, default=0, nullable=False)
+    # the version at which teams were last deleted or the stage changed, which the versions stamped
+    # on the remaining teams can't show, so anything cached before it must be rebuilt in full
+    reset_version = db.Column(db.Integer, default=0, nullable=False)
+
+    @staticmethod
+    def current_version(conn=None) -> int:
+        '''
+        Get the current version.
+
+        :param conn: The connection to use. Defaults to the session.
+
+        :return: The version, or None if the state row hasn't been created.
+        '''
+        if conn is None:
+            return db.session.query(State.version).filter_by(id=1).scalar()
+
+        return conn.execute(text('SELECT version FROM state WHERE id = 1')).scalar()
+
+    @staticmethod
+    def bump(conn, reset: bool=False) -> int:
+        '''
+        Increment the version.
+
+        :param conn: The connection to use. Pass `db.session.connection()` to increment the version
+            within the current transaction.
+        :param reset: Also record the new version as `reset_version`, e.g. when teams are deleted.
+
+        :return: The new version.
+        '''
+        if reset:
+            conn.execute(text('UPDATE state SET version = version + 1, reset_version = version + 1 '
+                              'WHERE id = 1'))
+        else:
+            conn.execute(text('UPDATE state SET version = version + 1 WHERE id = 1'))
+
+        return State.current_version(conn)
+
+    def __repr__(self):
+        return '<State id={!r}, version={!r}, stage={!r}>'.format(self.id, self.version, self.stage)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_version_after_flush(session, flush_context):
+    '''
+    Increment the version and stamp the teams that changed with it, including those whose scores
+    changed.
+
+    Registered before `ranking`'s listener, which runs after this one and stamps any teams whose
+    rank moved with the same version. The versions before and after the transaction are kept in
+    `session.info['state_versions']` for the leaderboard, see `Leaderboard.advance`.
+    '''
+    modified = [obj for obj in session.dirty if session.is_modified(obj)]
+    changed = [obj.id for obj in chain(session.new, modified) if isinstance(obj, Team)]
+    changed += [obj.team_id for obj in chain(session.new, modified, session.deleted)
+                if isinstance(obj, Score)]
+    deleted = any(isinstance(obj, Team) for obj in session.deleted)
+
+    if not changed and not deleted:
+        return
+
+    conn = session.connection()
+    version = State.bump(conn, reset=deleted)
+
+    previous = session.info.get('state_versions', (version - 1, None))[0]
+    session.info['state_versions'] = (previous, version)
+
+    if changed:
+        table = Team.__table__
+        conn.execute(table.update().where(table.c.id.in_(changed)).values(version=version))
@@ -2,9 +2,13 @@
 # The model for a team in the database.
 # -----------------------------------------------------------------------------
 
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
 
 from lego import app, db
+from lego.models.mission_score import MissionScore
+from lego.models.score import STAGE_KEYS, NoAttemptsLeft, Score, parse_score_key, stage_attempts
+import lego.util as util
 
 
 __all__ = ['Team']
@@ -12,26 +16,27 @@ __all__ = ['Team']
 
 class Team(db.Model):
     __tablename__ = 'team'
+    __table_args__ = (
+        # the scoreboard and top ten filter on these on every refresh
+        db.Index('ix_team_is_practice_active', 'is_practice', 'active'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     number = db.Column(db.Integer, unique=True, nullable=False)
     name = db.Column(db.String(80), index=True, unique=True, nullable=False)
     active = db.Column(db.Boolean, default=True, nullable=False)
     is_practice = db.Column(db.Boolean, default=False, nullable=False)
-    attempt_1 = db.Column(db.Integer, nullable=True)
-    attempt_1_breakdown = db.Column(db.String, nullable=True)
-    attempt_2 = db.Column(db.Integer, nullable=True)
-    attempt_2_breakdown = db.Column(db.String, nullable=True)
-    attempt_3 = db.Column(db.Integer, nullable=True)
-    attempt_3_breakdown = db.Column(db.String, nullable=True)
-    round_2 = db.Column(db.Integer, nullable=True)
-    round_2_breakdown = db.Column(db.String, nullable=True)
-    quarter = db.Column(db.Integer, nullable=True)
-    quarter_breakdown = db.Column(db.String, nullable=True)
-    semi = db.Column(db.Integer, nullable=True)
-    semi_breakdown = db.Column(db.String, nullable=True)
-    final = db.Column(db.Integer, nullable=True)
-    final_breakdown = db.Column(db.String, nullable=True)
+    # positions maintained by `ranking.update_ranks` whenever scores or the stage change. `rank` is
+    # among all non-practice teams, `stage_rank` among the active ones
+    rank = db.Column(db.Integer, index=True, nullable=True)
+    stage_rank = db.Column(db.Integer, index=True, nullable=True)
+    # the state version at which the team's details, scores or rank last changed, so clients can
+    # ask for only the teams that changed since a version they already have
+    version = db.Column(db.Integer, index=True, default=0, nullable=False)
+    # the scores made at every stage, only loaded when used. List views load them up front with
+    # `subqueryload(Team.scores)`
+    scores = db.relationship(Score, cascade='all, delete-orphan',
+                             order_by=(Score.stage, Score.attempt_no))
 
 
     def __repr__(self):
@@ -43,204 +48,146 @@ class Team(db.Model):
         return self.id == other.id
 
     def __lt__(self, other):
-        stage = app.load_stage()
-
-        if stage == 4:
-            if (self.final or -1) < (other.final or -1):
-                return True
-
-            if (self.final or -1) > (other.final or -1):
-                return False
-            
-        if stage >= 3:
-            if (self.semi or -1) < (other.semi or -1):
-                return True
-
-            if (self.semi or -1) > (other.semi or -1):
-                return False
-
-        if stage >= 2:
-            if (self.quarter or -1) < (other.quarter or -1):
-                return True
-
-            if (self.quarter or -1) > (other.quarter or -1):
-                return False
-
-        if stage >= 1:
-            if (self.round_2 or -1) < (other.round_2 or -1):
-                return True
-
-            if (self.round_2 or -1) > (other.round_2 or -1):
-                return False
-
-        if stage >= 0:
-            s_attempt = [a if a is not None else -1 for a in self.attempts]
-            o_attempt = [a if a is not None else -1 for a in other.attempts]
-
-            s_attempt.sort(reverse=True)
-            o_attempt.sort(reverse=True)
-
-            for s, o in zip(s_attempt, o_attempt):
-                if s < o:
-                    return True
-
-                if s > o:
-                    return False
-
-        # we want to order by score highest to lowest
-        # but if we fall back to this, we order by lowest number to highest
-        if self.number > other.number:
-            return True
+        # imported here as ranking needs the models
+        from lego.ranking import rank_key
 
-        return False
-
-    def __gt__(self, other):
+        # we want to order by score highest to lowest, then by lowest number to highest, which is
+        # the order of the rank keys
         stage = app.load_stage()
+        return rank_key(self, stage) > rank_key(other, stage)
 
-        if stage == 4:
-            if (self.final or -1) > (other.final or -1):
-                return True
-
-            if (self.final or -1) < (other.final or -1):
-                return False
-
-        if stage >= 3:
-            if (self.semi or -1) > (other.semi or -1):
-                return True
-
-            if (self.semi or -1) < (other.semi or -1):
-                return False
-
-        if stage >= 2:
-            if (self.quarter or -1) > (other.quarter or -1):
-                return True
-
-            if (self.quarter or -1) < (other.quarter or -1):
-                return False
-
-        if stage >= 1:
-            if (self.round_2 or -1) > (other.round_2 or -1):
-                return True
-
-            if (self.round_2 or -1) < (other.round_2 or -1):
-                return False
-
-        if stage >= 0:
-            s_attempt = [a if a is not None else -1 for a in self.attempts]
-            o_attempt = [a if a is not None else -1 for a in other.attempts]
-
-            s_attempt.sort(reverse=True)
-            o_attempt.sort(reverse=True)
-
-            for s, o in zip(s_attempt, o_attempt):
-                if s > o:
-                    return True
-
-                if s < o:
-                    return False
-
-        # we want to order by score highest to lowest
-        # but if we fall back to this, we order by lowest number to highest
-        if self.number < other.number:
-            return True
-
-        return False
+    def __gt__(self, other):
+        from lego.ranking import rank_key
 
-    @hybrid_property
+        stage = app.load_stage()
+        return rank_key(self, stage) < rank_key(other, stage)
+
+    def get_score(self, stage: int, attempt_no: int) -> Score:
+        '''
+        Get one of the team's scores, or None if it hasn't been made.
+        '''
+        for score in self.scores:
+            if score.stage == stage and score.attempt_no == attempt_no:
+                return score
+
+        return None
+
+    def stage_scores(self, stage: int) -> list:
+        '''
+        Get the points of each of the team's attempts at a stage, in order, with None for each
+        attempt that hasn't been made.
+        '''
+        points = [None] * stage_attempts(stage)
+
+        for score in self.scores:
+            if score.stage == stage and score.attempt_no <= len(points):
+                points[score.attempt_no - 1] = score.points
+
+        return points
+
+    def best_score(self, stage: int):
+        '''
+        Get the team's best score at a stage, or None if they haven't made one.
+        '''
+        return max((s.points for s in self.scores if s.stage == stage), default=None)
+
+    @property
     def attempts(self):
-        return [self.attempt_1, self.attempt_2, self.attempt_3]
-
+        return self.stage_scores(0)
 
-    @hybrid_property
+    @property
     def best_attempt(self):
-        ret = max(self.attempt_1 or -1, self.attempt_2 or -1, self.attempt_3 or -1)
+        ret = max([a or -1 for a in self.attempts], default=-1)
         return None if ret == -1 else ret
 
-
-    @hybrid_property
+    @property
     def round_1_total(self):
         return sum([a or 0 for a in self.attempts])
 
-    @hybrid_property
+    @property
     def highest_score(self):
         stage = app.load_stage()
-        if stage == 0:
-            return max(self.attempt_1 or 0, self.attempt_2 or 0, self.attempt_3 or 0)
 
-        if stage == 1:
-            return self.round_2 or 0
+        if stage == 0:
+            return max([a or 0 for a in self.attempts], default=0)
 
-        if stage == 2:
-            return self.quarter or 0
+        return self.best_score(stage) or 0
 
-        if stage == 3:
-            return self.semi or 0
+    def set_score(self, score, ruleset=None):
+        '''
+        Add a score for the team's next attempt at the current stage.
 
-        if stage == 4:
-            return self.final or 0
+        The attempt is chosen by the database as the score is inserted, see `Score.free_attempt`,
+        so the score is flushed straight away within a savepoint. If another score took the last
+        attempt first only the savepoint is rolled back, so the session can still be used. In a
+        batch of `app.writer` the error fails the batch, which is rolled back and each of its
+        writes run again on its own, see `WriteQueue._commit`.
 
-    def set_score(self, score):
+        :raises NoAttemptsLeft: If all attempts have been made for the stage.
+        '''
         stage = app.load_stage()
-        app.logger.debug('Stage: %s', stage)
-        app.logger.debug('Team: %s', str(self.__dict__))
+        app.logger.debug('Setting score at stage %s for team: %r', stage, self)
         # score is a tuple holding the total score and a breakdown of all previous scores
+        # ruleset is the version of the missions that scored it, see `mission_registry.Ruleset`
         score_total, score_breakdown = score
 
-        # first round
-        if stage == 0:
-            if self.attempt_1 is None:
-                self.attempt_1 = score_total
-                self.attempt_1_breakdown = score_breakdown
-            elif self.attempt_2 is None:
-                self.attempt_2 = score_total
-                self.attempt_2_breakdown = score_breakdown
-            elif self.attempt_3 is None:
-                self.attempt_3 = score_total
-                self.attempt_3_breakdown = score_breakdown
-            else:
-                raise Exception('All attempts have been made for this stage.')
-
-        # second round
-        elif stage == 1:
-            if self.round_2 is None:
-                self.round_2 = score_total
-                self.round_2_breakdown = score_breakdown
-            else:
-                raise Exception('All attempts have been made for this stage.')
-
-        # quarter finals
-        elif stage == 2:
-            if self.quarter is None:
-                self.quarter = score_total
-                self.quarter_breakdown = score_breakdown
-            else:
-                raise Exception('All attempts have been made for this stage.')
-
-        # semi finals
-        elif stage == 3:
-            if self.semi is None:
-                self.semi = score_total
-                self.semi_breakdown = score_breakdown
-            else:
-                raise Exception('All attempts have been made for this stage.')
-
-        # finals
-        elif stage == 4:
-            if self.final is None:
-                self.final = score_total
-                self.final_breakdown = score_breakdown
-            else:
-                raise Exception('All attempts have been made for this stage.')
-
-        else:
+        if not 0 <= stage < len(STAGE_KEYS):
             raise Exception('Invalid value for stage.')
 
+        # saves a failed insert in the usual case, the database has the final say
+        if len([s for s in self.scores if s.stage == stage]) >= stage_attempts(stage):
+            raise NoAttemptsLeft()
+
+        session = object_session(self)
+
+        try:
+            # anything already pending is flushed before the savepoint is started
+            with session.begin_nested():
+                self._add_score(stage, Score.free_attempt(self.id, stage), score_total,
+                                score_breakdown, ruleset)
+        except IntegrityError:
+            # no attempt was left, so the attempt number was NULL
+            raise NoAttemptsLeft()
+
+        app.leaderboard.queue(self)
+
+    def _add_score(self, stage: int, attempt_no, points: int, breakdown: str=None,
+                   ruleset: str=None) -> Score:
+        '''
+        Add a score, along with a row of `MissionScore` for each mission in its breakdown.
+
+        :param attempt_no: The attempt number, or a SQL expression for it.
+        '''
+        score = Score(stage=stage, attempt_no=attempt_no, points=points, breakdown=breakdown,
+                      ruleset=ruleset)
+
+        for mission, mission_points in util.parse_breakdown(breakdown).items():
+            score.mission_scores.append(MissionScore(team_id=self.id, stage=stage,
+                                                     mission=mission, points=mission_points))
+
+        self.scores.append(score)
+        return score
+
 
     def edit_round_score(self, key, score):
         app.logger.info('Setting %s to %d for team: %s (%d)', key, score, self.name, self.number)
-        setattr(self, key, int(score))
+        stage, attempt_no = parse_score_key(key)
+        existing = self.get_score(stage, attempt_no)
+
+        if existing is None:
+            self._add_score(stage, attempt_no, int(score))
+        else:
+            existing.points = int(score)
+
+        app.leaderboard.queue(self)
 
 
     def reset_round_score(self, key):
         app.logger.info('Resetting %s for team: %s (%d)', key, self.name, self.number)
-        setattr(self, key, None)
+        existing = self.get_score(*parse_score_key(key))
+
+        # deleted along with its mission scores as an orphan
+        if existing is not None:
+            self.scores.remove(existing)
+
+        app.leaderboard.queue(self)
@@ -0,0 +1,355 @@
+# -------------------------------------------------------------------------------------------------
+# Ranking of teams.
+#
+# Teams are ranked by building one stage-aware key per team and sorting on it, rather than
+# comparing pairs of teams with `util.compare_teams`, which reloads the stage and rebuilds the
+# attempt lists for every comparison. The same order is available as SQL ORDER BY clauses so the
+# database can sort and paginate the teams itself.
+#
+# The resulting positions are also stored on each team (`Team.rank` and `Team.stage_rank`) and kept
+# up to date as part of every flush that changes a score, so read paths can order by them directly.
+# As that runs for every score submitted, a flush that only changes the scores of one team moves
+# just that team, finding its new place with a binary search over the stored ranks, and shifts
+# the teams between its old and new place, rather than ranking every team again.
+# -------------------------------------------------------------------------------------------------
+
+from itertools import chain
+
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy import func
+from sqlalchemy.orm import Query
+
+from lego import app, db
+from lego.models import Score, State, Team
+from lego.models.score import stage_attempts
+
+
+__all__ = ['qualify_teams', 'rank_key', 'rank_order', 'sort_teams', 'stage_cutoff',
+           'update_ranks']
+
+# the columns of a team that can move it when they change, as can any change to its scores
+RANKED_COLUMNS = ('number', 'active', 'is_practice')
+
+# the number of ranked teams and whether their stored ranks run from 1 without gaps or repeats
+_STORED_RANKS = text('SELECT count(*), count(*) = count(DISTINCT rank) AND min(rank) = 1 '
+                     'AND max(rank) = count(*) FROM team WHERE is_practice = 0')
+
+# a team and its scores up to a stage, by id or by rank, for `_stored_key`
+_TEAM_SCORES = 'SELECT t.number, s.stage, s.attempt_no, s.points FROM team t ' \
+    'LEFT JOIN score s ON s.team_id = t.id AND s.stage <= :stage WHERE t.is_practice = 0 AND {!s}'
+_TEAM_SCORES_BY_ID = text(_TEAM_SCORES.format('t.id = :id'))
+_TEAM_SCORES_BY_RANK = text(_TEAM_SCORES.format('t.rank = :rank'))
+
+# the number of teams that qualify for each stage, indexed by stage, for each competition format,
+# unless set by `LEGO_STAGE_CUTOFFS`. None if every active team goes through
+STAGE_CUTOFFS = {
+    'uk': (None, 12, 8, 4, 2),
+    'bristol': (None, None, 6, 4, 2),
+}
+
+
+def rank_key(team, stage: int) -> tuple:
+    '''
+    Build the sort key for a team at the given stage.
+
+    Sorting teams by this key in ascending order gives the same order as sorting with
+    `cmp_to_key(util.compare_teams)`: the attempts at the latest stage are compared first from best
+    to worst, then those at each earlier stage and finally the team number, lowest first.
+
+    :param team: The team to build the key for. Anything with `number` and `stage_scores`.
+    :param stage: The stage to rank for. See `util.load_stage` for the possible values.
+
+    :return: A tuple of integers.
+    '''
+    key = []
+
+    # a score of 0 is treated the same as no score for the later stages
+    for earlier in range(stage, 0, -1):
+        attempts = sorted((a or -1 for a in team.stage_scores(earlier)), reverse=True)
+        key.extend(-a for a in attempts)
+
+    attempts = sorted((a if a is not None else -1 for a in team.stage_scores(0)), reverse=True)
+    key.extend(-a for a in attempts)
+
+    key.append(team.number)
+
+    return tuple(key)
+
+
+def sort_teams(teams, stage: int=None) -> list:
+    '''
+    Sort teams from highest ranked to lowest.
+
+    :param teams: An iterable of teams.
+    :param stage: The stage to rank for. Defaults to the current stage.
+
+    :return: A new list of the teams in rank order.
+    '''
+    if stage is None:
+        stage = app.load_stage()
+
+    return sorted(teams, key=lambda t: rank_key(t, stage))
+
+
+def rank_order(stage: int=None) -> list:
+    '''
+    Build the ORDER BY clauses that rank teams in the database in the same order as `rank_key`.
+
+    :param stage: The stage to rank for. Defaults to the current stage.
+
+    :return: A list of clauses to pass to `Query.order_by`.
+    '''
+    if stage is None:
+        stage = app.load_stage()
+
+    clauses = []
+
+    for earlier in range(stage, -1, -1):
+        for n in range(stage_attempts(earlier)):
+            points = _nth_best(earlier, n)
+
+            if earlier > 0:
+                points = func.nullif(points, 0)
+
+            clauses.append(func.coalesce(points, -1).desc())
+
+    clauses.append(Team.number.asc())
+
+    return clauses
+
+
+def _nth_best(stage: int, n: int):
+    # the team's nth best score at the stage, from 0, looked up with the (team, stage, attempt)
+    # unique index
+    return Query([Score.points]) \
+        .filter(Score.team_id == Team.id, Score.stage == stage) \
+        .order_by(Score.points.desc()) \
+        .limit(1).offset(n) \
+        .as_scalar()
+
+
+def update_ranks(conn, stage: int=None, version: int=None, changed=None) -> int:
+    '''
+    Recalculate the stored ranks of all teams, only updating the teams whose position moved.
+
+    :param conn: The connection to use. Pass `db.session.connection()` to update the ranks within
+        the current transaction.
+    :param stage: The stage to rank for. Defaults to the current stage.
+    :param version: The state version to stamp on the teams that moved, see `Team.version`. The
+        teams are left as they are if not given.
+    :param changed: The ids of the teams whose scores changed, if nothing else changed since the
+        ranks were stored for this stage. A single team is moved on its own, see `_move_team`.
+
+    :return: The number of teams that were updated.
+    '''
+    if stage is None:
+        stage = app.load_stage()
+
+    if changed is not None and len(changed) == 1:
+        moved = _move_team(conn, stage, next(iter(changed)), version)
+
+        if moved is not None:
+            return moved
+
+    query = Query([Team.id, Team.active, Team.rank, Team.stage_rank]) \
+        .filter(Team.is_practice == False) \
+        .order_by(*rank_order(stage))
+
+    changes = []
+    stage_rank = 0
+
+    for rank, (team_id, active, old_rank, old_stage_rank) in enumerate(
+            conn.execute(query.statement), start=1):
+        new_stage_rank = None
+
+        if active:
+            stage_rank += 1
+            new_stage_rank = stage_rank
+
+        if (rank, new_stage_rank) != (old_rank, old_stage_rank):
+            changes.append({'_id': team_id, '_rank': rank, '_stage_rank': new_stage_rank})
+
+    if changes:
+        table = Team.__table__
+        values = {'rank': bindparam('_rank'), 'stage_rank': bindparam('_stage_rank')}
+
+        if version is not None:
+            values['version'] = version
+
+        stmt = table.update().where(table.c.id == bindparam('_id')).values(**values)
+        conn.execute(stmt, changes)
+
+    return len(changes)
+
+
+def _move_team(conn, stage: int, team_id: int, version: int=None) -> int:
+    '''
+    Move a team whose scores changed to its new rank, shifting the teams in between by one, on the
+    basis that every other team is still in its stored order.
+
+    :return: The number of teams that were updated, or None if the stored ranks can't be relied
+        on, e.g. a team hasn't been ranked yet.
+    '''
+    count, consistent = conn.execute(_STORED_RANKS).fetchone()
+
+    if not consistent:
+        return None
+
+    row = conn.execute(text('SELECT active, rank FROM team WHERE id = :id AND is_practice = 0'),
+                       {'id': team_id}).fetchone()
+
+    # practice teams aren't ranked
+    if row is None:
+        return 0
+
+    active, old_rank = row
+    key = _stored_key(conn, stage, _TEAM_SCORES_BY_ID, id=team_id)
+
+    # the position among the other teams, whose ranks skip the team's own
+    low, high = 0, count - 1
+
+    while low < high:
+        middle = (low + high) // 2
+        rank = middle + 1 if middle + 1 < old_rank else middle + 2
+
+        if _stored_key(conn, stage, _TEAM_SCORES_BY_RANK, rank=rank) < key:
+            low = middle + 1
+        else:
+            high = middle
+
+    new_rank = low + 1
+
+    if new_rank == old_rank:
+        return 0
+
+    if new_rank < old_rank:
+        first, last, step = new_rank, old_rank - 1, 1
+    else:
+        first, last, step = old_rank + 1, new_rank, -1
+
+    params = {'first': first, 'last': last, 'step': step, 'id': team_id, 'rank': new_rank,
+              'version': version}
+    stamp = ', version = :version' if version is not None else ''
+
+    # passing a team only moves its stage rank if both are active
+    shifted = conn.execute(text(
+        'UPDATE team SET rank = rank + :step, stage_rank = stage_rank + (CASE WHEN active THEN '
+        ':step ELSE 0 END) * {:d}{!s} WHERE is_practice = 0 AND rank BETWEEN :first AND :last'
+        .format(1 if active else 0, stamp)), params).rowcount
+
+    conn.execute(text(
+        'UPDATE team SET rank = :rank, stage_rank = CASE WHEN active THEN (SELECT count(*) + 1 '
+        'FROM team WHERE is_practice = 0 AND active AND rank < :rank AND id != :id) END{!s} '
+        'WHERE id = :id'.format(stamp)), params)
+
+    return shifted + 1
+
+
+def _stored_key(conn, stage: int, query, **params) -> tuple:
+    rows = conn.execute(query, dict(params, stage=stage)).fetchall()
+    team = _RankedTeam(rows[0][0])
+
+    for _, score_stage, attempt_no, points in rows:
+        if score_stage is not None:
+            team.points[(score_stage, attempt_no)] = points
+
+    return rank_key(team, stage)
+
+
+class _RankedTeam:
+    '''
+    The parts of a team used by `rank_key`, read from rows rather than loaded as a model.
+    '''
+
+    def __init__(self, number: int):
+        self.number = number
+        # (stage, attempt number) -> points
+        self.points = {}
+
+    def stage_scores(self, stage: int) -> list:
+        return [self.points.get((stage, attempt_no))
+                for attempt_no in range(1, stage_attempts(stage) + 1)]
+
+
+def stage_cutoff(stage: int):
+    '''
+    Get the number of teams that qualify for a stage in the configured competition format.
+
+    :return: The number of teams, or None if every active team goes through.
+    '''
+    app_type = app.config['LEGO_APP_TYPE']
+    cutoffs = app.config.get('LEGO_STAGE_CUTOFFS', {}).get(app_type, STAGE_CUTOFFS[app_type])
+
+    return cutoffs[stage]
+
+
+def qualify_teams(conn, stage: int, version: int=None) -> int:
+    '''
+    Knock out the active teams ranked below the cutoff for a stage, see `stage_cutoff`, in a single
+    UPDATE on their stored `stage_rank`. Run before the teams are ranked for the new stage, so
+    teams qualify on their results so far.
+
+    :param conn: The connection to use. Pass `db.session.connection()` to knock the teams out
+        within the current transaction.
+    :param version: The state version to stamp on the teams knocked out, see `Team.version`.
+
+    :return: The number of teams knocked out.
+    '''
+    cutoff = stage_cutoff(stage)
+
+    if cutoff is None:
+        return 0
+
+    table = Team.__table__
+    values = {'active': False}
+
+    if version is not None:
+        values['version'] = version
+
+    # the same as setting `active = stage_rank <= cutoff`, but only writing the teams knocked out
+    stmt = table.update() \
+        .where(table.c.active == True) \
+        .where(table.c.is_practice == False) \
+        .where(table.c.stage_rank > cutoff) \
+        .values(**values)
+
+    return conn.execute(stmt).rowcount
+
+
+def _affects_ranking(session, obj) -> bool:
+    if obj in session.new or obj in session.deleted:
+        return True
+
+    if isinstance(obj, Score):
+        return session.is_modified(obj)
+
+    attrs = inspect(obj).attrs
+    return any(attrs[c].history.has_changes() for c in RANKED_COLUMNS)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_ranks_after_flush(session, flush_context):
+    '''
+    Keep the stored ranks up to date within the same transaction as any change to a score.
+
+    Runs after the flush so the new scores are already in the database. Ranks of teams already
+    loaded in the session are only refreshed once the transaction is committed. `models.state`
+    registers its listener first, so the version has already been incremented for this change.
+    Unless a team itself changed, only the teams whose scores changed are passed on to be moved.
+    '''
+    changed = set()
+    rank_all = False
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, (Score, Team)) or not _affects_ranking(session, obj):
+            continue
+
+        if isinstance(obj, Score) and obj.team_id is not None:
+            changed.add(obj.team_id)
+        else:
+            rank_all = True
+
+    if changed or rank_all:
+        conn = session.connection()
+        update_ranks(conn, version=State.current_version(conn),
+                     changed=None if rank_all else changed)
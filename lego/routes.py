@@ -4,20 +4,29 @@
 # This is essentially the controllers for the application in terms of MVC, but all in one.
 # -------------------------------------------------------------------------------------------------
 
-from functools import cmp_to_key
+from functools import wraps
+import hashlib
+import hmac
 import os
 import re
+import time
 import unicodedata
 
-from flask import render_template, flash, redirect, request, url_for, g, abort, make_response
+from flask import render_template, flash, redirect, request, session, url_for, g, abort, \
+    make_response, jsonify, stream_with_context
 from flask_login import login_user, logout_user, current_user, login_required
-from sqlalchemy  import asc
+from sqlalchemy  import asc, or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import subqueryload
 
 from lego import app, db, lm
-from lego.forms import LoginForm, ScoreRoundForm, EditTeamForm, NewTeamForm, EditTeamScoreForm, ResetTeamScoreForm, StageForm, generate_manage_active_teams_form
-from lego.models import User, Team
-import lego.util as util
+import lego.export as export
+from lego.forms import LoginForm, EditTeamForm, NewTeamForm, EditTeamScoreForm, ResetTeamScoreForm, StageForm, generate_manage_active_teams_form
+from lego.events import format_event
+from lego.models import User, Team, Score, State
+from lego.models.score import NoAttemptsLeft, score_key, score_keys, score_label, stage_attempts
+from lego.stage import STAGES
+from lego.storage import WriteTimeout
 
 
 @app.before_request
@@ -36,6 +45,14 @@ def override_url_for():
     return dict(url_for=dated_url_for)
 
 
+@app.context_processor
+def inject_stage_attempts():
+    '''
+    Make the number of attempts at each stage available to templates, for the score columns.
+    '''
+    return dict(stage_attempts=stage_attempts)
+
+
 def dated_url_for(endpoint, **values):
     '''
     Append a cache buster to static assets.
@@ -56,17 +73,94 @@ def dated_url_for(endpoint, **values):
 @app.after_request
 def after_request(response):
     '''
-    Log all requests.
+    Log all requests, with how long they took and how many queries they ran.
     '''
-    app.logger.info('%s %s %s %s %s',
+    state = g.get('_metrics') or {}
+    duration = time.perf_counter() - state['start'] if 'start' in state else 0.0
+
+    app.logger.info('%s %s %s %s %s %.1fms %s queries',
                     request.remote_addr,
                     request.method,
                     request.scheme,
                     request.full_path,
-                    response.status)
+                    response.status,
+                    duration * 1000,
+                    state.get('queries', 0),
+                    # kept as separate fields in the JSON log
+                    extra={
+                        'remote_addr': request.remote_addr,
+                        'method': request.method,
+                        'path': request.full_path,
+                        'status': response.status_code,
+                        'duration_ms': round(duration * 1000, 1),
+                        'queries': state.get('queries', 0),
+                    })
     return response
 
 
+def cached_page(view):
+    '''
+    Serve a public page from the page cache if nothing has changed since it was last rendered.
+
+    Pages are cached against the state version, stage, application type, view and its arguments
+    and the kind of user, as the navigation differs for judges and admins. The same details make
+    up the page's ETag so a browser that already has the page is answered with a 304 before any
+    other query or rendering. Pages with flashed messages are never cached.
+    '''
+    @wraps(view)
+    def wrapper(**kwargs):
+        version = State.current_version()
+
+        # rendered into the page so live updates know which version is being shown
+        g.state_version = version
+
+        if version is None or session.get('_flashes'):
+            return view(**kwargs)
+
+        key = (version, app.load_stage(), app.config['LEGO_APP_TYPE'], request.endpoint,
+               tuple(sorted(kwargs.items())), _user_role())
+        etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            page = app.page_cache.get(key)
+
+            if page is None:
+                page = view(**kwargs)
+
+                # redirects etc. are passed through
+                if not isinstance(page, str):
+                    return page
+
+                app.page_cache.set(key, page)
+
+            response = make_response(page)
+
+        response.set_etag(etag)
+
+        # allow browsers and a local proxy to reuse the page for a moment, pages for logged in
+        # users have different navigation so must not be shared
+        visibility = 'private' if current_user.is_authenticated else 'public'
+        response.headers['Cache-Control'] = '{!s}, max-age={:d}' \
+            .format(visibility, app.config.get('LEGO_PAGE_MAX_AGE', 2))
+        response.headers['Vary'] = 'Cookie'
+
+        return response
+
+    return wrapper
+
+
+def _user_role() -> str:
+    if not current_user.is_authenticated:
+        return None
+
+    if current_user.is_admin:
+        return 'admin'
+
+    return 'judge' if current_user.is_judge else 'user'
+
+
 @app.template_filter('slugify')
 def slugify(value: str):
     '''
@@ -152,6 +246,7 @@ def logout():
 
 @app.route('/')
 @app.route('/home')
+@cached_page
 def home():
     '''
     Home page.
@@ -160,11 +255,11 @@ def home():
     return render_template('home.html', title='Home', teams=teams)
 
 @app.route('/top_ten')
+@cached_page
 def top_ten():
-    teams = Team.query.filter_by(is_practice=False).all()
-    teams = sorted(teams, key=cmp_to_key(util.compare_teams))
-    teams = teams[0:10]
     stage = app.load_stage()
+    teams = Team.query.filter_by(is_practice=False).options(subqueryload(Team.scores)) \
+        .order_by(Team.rank).limit(10).all()
     params = {
         'title': 'Scoreboard',
         'stage': stage,
@@ -172,8 +267,7 @@ def top_ten():
     }
 
     template = 'top_ten.html'
-    stages = ('round_1', 'round_2', 'quarter_final', 'semi_final', 'final')
-    for i, s in enumerate(stages):
+    for i, s in enumerate(STAGES):
         if stage >= i:
             params[s] = True
 
@@ -181,16 +275,17 @@ def top_ten():
 
 @app.route('/scoreboard/', defaults={'offset': 0})
 @app.route('/scoreboard/<int:offset>')
+@cached_page
 def scoreboard(offset):
-    teams = Team.query.filter_by(active=True, is_practice=False).all()
-    teams = sorted(teams, key=cmp_to_key(util.compare_teams))
     stage = app.load_stage()
+    query = scoreboard_query()
     params = {
         'title': 'Scoreboard',
         'stage': stage,
         'offset': offset,
-        'end': len(teams)
+        'end': query.count()
     }
+    query = query.options(subqueryload(Team.scores)).order_by(Team.stage_rank)
 
     if app.config['LEGO_APP_TYPE'] in ('bristol', 'uk'):
         template = 'scoreboard_{!s}.html'.format(app.config['LEGO_APP_TYPE'])
@@ -198,13 +293,13 @@ def scoreboard(offset):
         raise Exception('Unsupported value for LEGO_APP_TYPE: {!s}' \
                         .format(app.config['LEGO_APP_TYPE']))
 
-    stages = ('round_1', 'round_2', 'quarter_final', 'semi_final', 'final')
-    for i, s in enumerate(stages):
+    for i, s in enumerate(STAGES):
         if stage >= i:
             params[s] = True
 
     if stage == 0:
         if app.config['LEGO_APP_TYPE'] == 'bristol':
+            teams = query.all()
             quotient = len(teams) // 3
             remainder = len(teams) % 3
 
@@ -227,13 +322,16 @@ def scoreboard(offset):
 
             return render_template(template, **params)
         else:
-            params['teams'] = teams[offset:offset + 10]
+            # only the page being shown is loaded
+            params['teams'] = query.offset(offset).limit(10).all()
             return render_template(template, **params)
 
     # force offset to 0 if we refreshed in the middle of a cycle
     if params['offset'] != 0:
         return redirect(url_for('scoreboard'))
 
+    teams = query.all()
+
     if app.config['LEGO_APP_TYPE'] == 'bristol':
         params['first'] = teams
     else:
@@ -243,6 +341,226 @@ def scoreboard(offset):
     return render_template(template, **params)
 
 
+def scoreboard_query():
+    '''
+    Query for the teams shown on the scoreboard, i.e. the active teams ordered by `stage_rank`.
+    '''
+    return Team.query.filter_by(active=True, is_practice=False)
+
+
+@app.route('/api/leaderboard')
+def api_leaderboard():
+    '''
+    The scoreboard as JSON for display clients.
+
+    Takes the optional query parameters:
+    - `offset`: The number of ranks to skip. Defaults to 0.
+    - `limit`: The maximum number of ranks to return. Defaults to all of them.
+    - `since`: A version previously returned by this endpoint. Only the teams that changed since
+      that version are returned, along with the numbers of the teams no longer on the scoreboard, or
+      moved out of the ranks asked for, in `removed`. Returns 204 with an empty body if nothing changed. If teams were deleted or the
+      stage changed since then, the whole scoreboard is returned instead, without `removed`.
+
+    The scores are in the order given by `columns`, which depends on the stage.
+    '''
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', None, type=int)
+    since = request.args.get('since', None, type=int)
+
+    if offset < 0 or (limit is not None and limit < 0):
+        return abort(400)
+
+    state = db.session.query(State.version, State.reset_version).filter_by(id=1).first()
+    version, reset_version = state if state is not None else (None, None)
+    stage = app.load_stage()
+
+    if since is not None and version is not None:
+        if since == version:
+            return app.response_class(status=204)
+
+        # the database was recreated, or teams were deleted or the stage changed, since the client
+        # last asked, which the changed teams alone can't show, so it needs everything again
+        if since > version or since < reset_version:
+            since = None
+
+    # ranks rather than OFFSET so both full and partial responses use the stage_rank index and
+    # give the same window
+    query = scoreboard_query().filter(Team.stage_rank > offset)
+
+    if limit is not None:
+        query = query.filter(Team.stage_rank <= offset + limit)
+
+    if since is not None:
+        query = query.filter(Team.version > since)
+
+    teams = query.with_entities(Team.id, Team.stage_rank, Team.number, Team.name) \
+        .order_by(Team.stage_rank).all()
+
+    # the same scores as the scoreboard page shows for the stage, read in one query by team and
+    # stage rather than through each team's scores
+    keys = [(s, a) for s, a in score_keys() if s <= stage]
+    points = {}
+
+    if teams:
+        scores = db.session.query(Score.team_id, Score.stage, Score.attempt_no, Score.points) \
+            .filter(Score.team_id.in_([team[0] for team in teams]), Score.stage <= stage)
+        points = {(team_id, s, a): p for team_id, s, a, p in scores}
+
+    columns = [score_key(s, a) for s, a in keys]
+    rows = []
+
+    for team_id, *details in teams:
+        row = details + [points.get((team_id, s, a)) for s, a in keys]
+
+        if stage == 0:
+            row.append(max([p or 0 for p in row[3:]], default=0))
+
+        rows.append(row)
+
+    if stage == 0:
+        columns.append('highest_score')
+
+    data = {
+        'version': version,
+        'stage': stage,
+        'offset': offset,
+        'total': scoreboard_query().count(),
+        'columns': ['rank', 'number', 'name'] + columns,
+        'rows': rows,
+    }
+
+    if since is not None:
+        # teams moved out of the window are stamped by the ranking, as when they are knocked out
+        outside = or_(Team.active == False, Team.stage_rank <= offset)
+
+        if limit is not None:
+            outside = or_(outside, Team.stage_rank > offset + limit)
+
+        removed = Team.query.with_entities(Team.number) \
+            .filter(Team.is_practice == False, Team.version > since, outside) \
+            .order_by(Team.number)
+        data['removed'] = [number for number, in removed]
+
+    return jsonify(data)
+
+
+@app.route('/api/rules')
+def api_rules():
+    '''
+    The current version of the missions compiled for scoring, so the score sheet can calculate the
+    score as it is filled in. See `scoring.ScoringPlan.to_dict`.
+    '''
+    ruleset = app.missions.get()
+    data = ruleset.plan.to_dict()
+    data['version'] = ruleset.version
+
+    response = jsonify(data)
+    response.set_etag(ruleset.version)
+    # always revalidated as the missions can be reloaded at any time, unchanged rules are a 304
+    response.headers['Cache-Control'] = 'no-cache'
+
+    return response.make_conditional(request)
+
+
+@app.route('/metrics')
+def metrics():
+    '''
+    Request metrics in the Prometheus text format.
+
+    Available to admins, or to a scraper sending `Authorization: Bearer <LEGO_METRICS_TOKEN>` if
+    that is configured.
+    '''
+    token = app.config.get('LEGO_METRICS_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    authorised = token and hmac.compare_digest(auth.encode('utf-8'),
+                                               'Bearer {!s}'.format(token).encode('utf-8'))
+
+    if not authorised:
+        if not current_user.is_authenticated:
+            return lm.unauthorized()
+
+        if not current_user.is_admin:
+            return abort(403)
+
+    cache = app.page_cache.stats()
+    counters = [
+        ('lego_page_cache_hits_total', 'Pages served from the page cache.', cache['hits']),
+        ('lego_page_cache_misses_total', 'Pages rendered because they weren\'t cached.',
+         cache['misses']),
+    ]
+    gauges = [
+        ('lego_page_cache_size', 'Pages currently in the page cache.', cache['size']),
+        ('lego_stream_clients', 'Open scoreboard streams.', app.score_events.clients),
+    ]
+
+    response = make_response(app.metrics.render(gauges, counters))
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+
+    return response
+
+
+@app.route('/scoreboard/stream')
+def scoreboard_stream():
+    '''
+    Server-Sent Events stream of changes to the scores and stage for the public pages.
+
+    An event with the current version and stage is sent on connection and then again whenever
+    either changes. Comments are sent in between to keep the connection open and notice clients
+    that have gone. If too many streams are open the client is turned away with a 503 and falls
+    back to polling.
+    '''
+    events = app.score_events
+    keepalive = app.config.get('LEGO_STREAM_KEEPALIVE', 15)
+
+    def stream():
+        yield 'retry: 5000\n\n'
+
+        current = events.latest()
+
+        if current is not None:
+            yield format_event(*current)
+
+        while True:
+            latest = events.wait(current, keepalive)
+
+            if latest == current:
+                yield ': keepalive\n\n'
+            else:
+                current = latest
+                yield format_event(*current)
+
+    if not events.connect():
+        response = app.response_class(status=503)
+        response.headers['Retry-After'] = '30'
+        return response
+
+    # released here unless the response was made, which releases it once it is closed
+    streaming = False
+
+    try:
+        version = State.current_version()
+        stage = app.load_stage()
+
+        # the stream doesn't need the database, so don't hold a connection for its lifetime
+        db.session.remove()
+
+        if version is not None:
+            events.publish(version, stage)
+
+        response = app.response_class(stream(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # stop a reverse proxy from buffering the events
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.call_on_close(events.disconnect)
+        streaming = True
+
+        return response
+    finally:
+        if not streaming:
+            events.disconnect()
+
+
 @app.route('/judges/')
 @app.route('/judges')
 @login_required
@@ -250,8 +568,8 @@ def judges_home():
     if not (current_user.is_judge or current_user.is_admin):
         return abort(403)
 
-    teams = Team.query.filter_by(is_practice=False).all()
-    teams = sorted(teams, key=cmp_to_key(util.compare_teams))
+    teams = Team.query.filter_by(is_practice=False).options(subqueryload(Team.scores)) \
+        .order_by(Team.rank).all()
 
     show_round_2 = app.config['LEGO_APP_TYPE'] == 'uk'
 
@@ -262,50 +580,41 @@ def judges_home():
 @app.route('/judges/export')
 @login_required
 def judges_export():
-    if not(current_user.is_judge or current_user.is_admin):
-        return abort(403)
-
-    teams = Team.query.filter_by(is_practice=False).all()
-    teams = sorted(teams, key=cmp_to_key(util.compare_teams))
-
-    headers = ['Rank', 'Number', 'Name', 'Round 1 - Attempt 1', 'Round 1 - Attempt 2',
-               'Round 1 - Attempt 3', 'Round 1 - Best', 'Round 2', 'Quarter Final', 'Semi Final',
-               'Final']
-    columns = ['number', 'name', 'attempt_1', 'attempt_2', 'attempt_3', 'best_attempt', 'round_2',
-               'quarter', 'semi', 'final']
+    '''
+    Download the teams and their scores.
 
-    csv_parts = []
-    csv_parts.append(','.join(headers))
+    Takes the optional query parameters:
+    - `format`: `csv` (the default) or `jsonl` for JSON Lines.
+    - `breakdowns`: If `1`, include the points scored for each mission of each score.
 
-    for i, t in enumerate(teams, start=1):
-        row = [str(i)]
+    The file is streamed as it is generated so it starts downloading straight away.
+    '''
+    if not(current_user.is_judge or current_user.is_admin):
+        return abort(403)
 
-        for c in columns:
-            x = getattr(t, c)
+    fmt = request.args.get('format', 'csv')
+    breakdowns = request.args.get('breakdowns') == '1'
 
-            if x is None:
-                x = ''
+    if fmt not in export.FORMATS:
+        return abort(400)
 
-            x = str(x)
-            row.append(x)
+    rows = export.export_rows(breakdowns)
 
-        csv_parts.append(','.join(row))
+    if fmt == 'csv':
+        lines = export.iter_csv(rows, breakdowns)
+    else:
+        lines = export.iter_jsonl(rows)
 
-    resp = make_response('\n'.join(csv_parts))
+    resp = app.response_class(stream_with_context(lines), mimetype=export.FORMATS[fmt])
 
-    resp.headers['Content-Type'] = 'text/csv'
-    resp.headers['Content-Disposition'] = 'attachment; filename="teams.csv"'
+    resp.headers['Content-Disposition'] = 'attachment; filename="teams.{!s}"'.format(fmt)
     resp.headers['Content-Transfer-Encoding'] = 'binary'
-    resp.headers['Accept-Ranges'] = 'bytes'
     resp.headers['Cache-Control'] = 'private'
     resp.headers['Pragma'] = 'private'
     # the exact date doesn't matter here as long as it's in the past so it
     # expires immediately and a browser won't try and cache it
     resp.headers['Expires'] = 'Mon, 26 Jul 1997 05:00:00 GMT'
 
-    app.logger.info(resp)
-    app.logger.info(resp.headers)
-
     return resp
 
 
@@ -315,27 +624,34 @@ def judges_score_round():
     if not (current_user.is_judge or current_user.is_admin):
         return abort(403)
 
-    form = ScoreRoundForm()
+    form = app.missions.form()
 
-    teams = Team.query.filter_by(active=True).order_by('number').all()
+    teams = db.session.query(Team.id, Team.name).filter_by(active=True).order_by(Team.number)
     form.team.choices = [('', '--Select team--')]
-    form.team.choices += [(str(t.id), t.name) for t in teams]
+    form.team.choices += [(str(team_id), name) for team_id, name in teams]
 
     if form.validate_on_submit():
         team_id = form.team.data
         team = Team.query.get(team_id)
+        # always recalculated here, the score sheet's total is only checked against it
         score = form.points_scored()
 
-        if form.confirm.data == '1':
+        # the score sheet calculates the score as it is filled in so can submit straight away,
+        # unless its total is out of date, e.g. the missions changed since it was loaded
+        if form.confirm.data == '1' and form.score.data not in (None, score[0]):
+            flash('The score was recalculated as {!s}, please check it and submit again.'
+                  .format(score[0]))
+        elif form.confirm.data == '1' and not team.is_practice:
             try:
-                team.set_score(score)
-            except Exception as exc:
+                app.writer.submit(_set_score, team.id, score, form.ruleset)
+            except (NoAttemptsLeft, WriteTimeout) as exc:
                 flash(str(exc))
+            except Exception as e:
+                app.logger.exception(e)
+                flash('An unknown error occurred. See the logs for more information')
             else:
-                db.session.commit()
-
-                flash('Submitted for team: {!s}, score: {!s}.' \
-                      .format(team.name, score[0]))
+                flash('Submitted for team: {!s}, score: {!s}, rank: {!s}.' \
+                      .format(team.name, score[0], app.leaderboard.rank(team.id)))
 
                 return redirect(url_for('judges_score_round'))
 
@@ -360,6 +676,22 @@ def judges_score_round():
 
     return render_template('judges/score_round.html', title='Score Round', form=form)
 
+
+# score changes, run by `app.writer` so judges submitting at the same time don't wait on each
+# other's commits
+
+def _set_score(team_id: int, score: tuple, ruleset: str):
+    Team.query.get(team_id).set_score(score, ruleset)
+
+
+def _edit_score(team_id: int, key: str, score: int):
+    Team.query.get(team_id).edit_round_score(key, score)
+
+
+def _reset_score(team_id: int, key: str):
+    Team.query.get(team_id).reset_round_score(key)
+
+
 @app.route('/admin/team')
 @login_required
 def admin_team():
@@ -443,15 +775,17 @@ def admin_team_score_edit(id: int):
 
     team = Team.query.filter_by(id=id).first()
     form = EditTeamScoreForm()
+    form.stage.choices = [(score_key(*key), score_label(*key)) for key in score_keys()]
 
     if form.validate_on_submit():
         try:
-            team.edit_round_score(form.stage.data, form.score.data)
-            db.session.commit()
+            app.writer.submit(_edit_score, team.id, form.stage.data, form.score.data)
+
+        except WriteTimeout as exc:
+            flash(str(exc))
 
         except Exception as e:
             app.logger.exception(e)
-            db.session.rollback()
             flash('An unknown error occurred. See the logs for more information')
 
         else:
@@ -474,15 +808,17 @@ def admin_team_score_reset(id: int):
 
     team = Team.query.filter_by(id=id).first()
     form = ResetTeamScoreForm()
+    form.stage.choices = [(score_key(*key), score_label(*key)) for key in score_keys()]
 
     if form.validate_on_submit():
         try:
-            team.reset_round_score(form.stage.data)
-            db.session.commit()
+            app.writer.submit(_reset_score, team.id, form.stage.data)
+
+        except WriteTimeout as exc:
+            flash(str(exc))
 
         except Exception as e:
             app.logger.exception(e)
-            db.session.rollback()
             flash('An unknown error occurred. See the logs for more information')
 
         else:
@@ -512,7 +848,6 @@ def admin_stage():
 
     if form.validate_on_submit():
         new_stage = int(form.stage.data)
-        cur_file_path = os.path.dirname(os.path.abspath(__file__))
 
         if new_stage <= stage:
             flash('Unable to go back a stage.')
@@ -520,10 +855,8 @@ def admin_stage():
         elif app.config['LEGO_APP_TYPE'] == 'bristol' and new_stage == 1:
             flash('Round 2 only available during UK Final.')
         else:
-            set_active_teams(new_stage)
-
-            with open(os.path.join(cur_file_path, 'tmp', '.stage'), 'w') as fh:
-                fh.write(str(new_stage))
+            # knocks out the teams that didn't qualify and ranks the rest in the same commit
+            app.stage.set(new_stage, qualify=True)
 
             flash('Stage updated to: {!s}'.format(stages[int(new_stage)]))
             return redirect(url_for('admin_stage'))
@@ -532,41 +865,6 @@ def admin_stage():
                            current_stage=current_stage)
 
 
-def set_active_teams(stage):
-    '''
-    Helper for setting the active teams after a stage has been moved forward.
-    '''
-    teams = Team.query.filter_by(active=True, is_practice=False).all()
-    teams = sorted(teams, key=cmp_to_key(util.compare_teams))
-
-    if app.config['LEGO_APP_TYPE'] == 'bristol':
-        for i, team in enumerate(teams):
-            if stage == 2 and i >= 6:
-                team.active = False
-
-            if stage == 3 and i >= 4:
-                team.active = False
-
-            if stage == 4 and i >= 2:
-                team.active = False
-
-    elif app.config['LEGO_APP_TYPE'] == 'uk':
-        for i, team in enumerate(teams):
-            if stage == 1 and i >= 12:
-                team.active = False
-
-            if stage == 2 and i >= 8:
-                team.active = False
-
-            if stage == 3 and i >= 4:
-                team.active = False
-
-            if stage == 4 and i >= 2:
-                team.active = False
-
-    db.session.commit()
-
-
 @app.route('/admin/manage_active_teams', methods=['GET', 'POST'])
 def admin_manage_active_teams():
     '''
@@ -586,3 +884,17 @@ def admin_manage_active_teams():
 
     return render_template('admin/manage_active_teams.html', title='Manage Active Teams',
                            form=form)
+
+
+@app.route('/admin/queries')
+@login_required
+def admin_queries():
+    '''
+    For finding slow pages and N+1 queries, when query inspection is enabled.
+    '''
+    if not current_user.is_admin:
+        return abort(403)
+
+    return render_template('admin/queries.html', title='Query Inspection',
+                           enabled=app.config.get('LEGO_QUERY_INSPECTION', False),
+                           inspector=app.query_inspector)
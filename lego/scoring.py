@@ -0,0 +1,215 @@
+# -------------------------------------------------------------------------------------------------
+# Scoring of a round from the missions in `missions.json`.
+#
+# The missions are compiled once into a flat plan: a slot for each field that carries points or
+# gates its mission, and the bonus rules declared alongside the missions. Scoring a submission is
+# then a single pass over the slots using the submitted form data, rather than walking the form's
+# fields for each mission.
+#
+# A mission scores the sum of its checkboxes and choices, or nothing if any of its yes/no fields
+# is unchecked. Each bonus rule adds its points for each of its missions that scored, as long as
+# the form field it requires is checked. The total is never less than 0.
+# -------------------------------------------------------------------------------------------------
+
+from collections import namedtuple, OrderedDict
+import json
+import os
+
+
+__all__ = ['BONUS_KEY', 'BonusRule', 'ScoringPlan', 'Slot', 'compile_missions', 'compile_plan',
+           'field_name', 'load_missions', 'split_missions']
+
+# the key in the missions file for the bonus rules, every other key is a mission
+BONUS_KEY = 'bonuses'
+
+# the kinds of slot
+CHECKBOX = 'checkbox'
+CHOICE = 'choice'
+GATE = 'gate'
+
+# the values a yes/no field is unchecked for, as `wtforms.BooleanField`
+FALSE_VALUES = ('false', '')
+
+# a field that affects the score of a mission
+# - kind: CHECKBOX scores `points` if submitted, CHOICE scores the submitted value or `default`,
+#   GATE scores the mission nothing unless submitted
+# - mission: the index of the mission in the plan
+# - requires: the name of a field that must be checked for this one to count, as if it wasn't
+#   submitted otherwise, or None. The score sheet disables the field until then
+Slot = namedtuple('Slot', ('name', 'kind', 'mission', 'points', 'default', 'requires'))
+
+# points added for each of `missions` (indexes) that scored, if the form field `requires` is
+# checked
+BonusRule = namedtuple('BonusRule', ('points', 'requires', 'missions'))
+
+
+def load_missions(path: str=None) -> (OrderedDict, list):
+    '''
+    Load the missions file.
+
+    :param path: The path to the missions file. Defaults to `lego/missions.json`.
+
+    :return: An ordered dict of mission name to its list of tasks, in the order they are scored,
+        and the list of bonus rules as declared.
+    '''
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'missions.json')
+
+    with open(path) as fh:
+        return split_missions(json.load(fh))
+
+
+def split_missions(data: dict) -> (OrderedDict, list):
+    '''
+    Split the parsed contents of a missions file into the missions and the bonus rules, see
+    `load_missions`.
+    '''
+    data = dict(data)
+    bonuses = data.pop(BONUS_KEY, [])
+    # json objects aren't ordered, so the missions are sorted by name
+    missions = OrderedDict(sorted(data.items()))
+
+    return missions, bonuses
+
+
+def field_name(mission: str, task_no: int, prefix: str='missions') -> str:
+    '''
+    Get the name of the form field for a task, as generated by `score_round_form.parse_json`.
+    '''
+    return '{!s}-{!s}-{:d}'.format(prefix, mission, task_no)
+
+
+def compile_missions(path: str=None) -> 'ScoringPlan':
+    '''
+    Compile the missions file into a scoring plan.
+
+    :param path: The path to the missions file. Defaults to `lego/missions.json`.
+
+    :raises ValueError: If a task has an unknown type or a bonus rule names an unknown mission.
+    '''
+    return compile_plan(*load_missions(path))
+
+
+def compile_plan(missions: OrderedDict, bonuses: list) -> 'ScoringPlan':
+    '''
+    Compile missions and bonus rules, as returned by `load_missions`, into a scoring plan.
+
+    :raises ValueError: If a task has an unknown type or requirement, or a bonus rule names an
+        unknown mission.
+    '''
+    names = list(missions)
+    slots = []
+
+    for index, (mission, tasks) in enumerate(missions.items()):
+        for task_no, task in enumerate(tasks):
+            name = field_name(mission, task_no)
+            type_ = task['type']
+            requires = task.get('requires')
+
+            if requires is not None:
+                if requires not in range(len(tasks)) or \
+                        tasks[requires]['type'] not in ('BooleanField', 'CheckboxField'):
+                    raise ValueError('Task {:d} of {!s} requires {!s}, which isn\'t a checkbox'
+                                     .format(task_no, mission, requires))
+
+                requires = field_name(mission, requires)
+
+            if type_ == 'StringField':
+                # text only
+                continue
+            elif type_ == 'BooleanField':
+                slots.append(Slot(name, GATE, index, 0, None, requires))
+            elif type_ == 'CheckboxField':
+                slots.append(Slot(name, CHECKBOX, index, int(task['value']), None, requires))
+            elif type_ in ('RadioField', 'SelectField'):
+                slots.append(Slot(name, CHOICE, index, 0, int(task.get('default', 0)), requires))
+            else:
+                raise ValueError('Unknown type {!s} for task {:d} of {!s}'
+                                 .format(type_, task_no, mission))
+
+    rules = []
+
+    for rule in bonuses:
+        included = rule.get('missions', names)
+        excluded = rule.get('exclude', [])
+        unknown = [m for m in list(included) + list(excluded) if m not in missions]
+
+        if unknown:
+            raise ValueError('Unknown mission(s) in bonus rule: {!s}'.format(', '.join(unknown)))
+
+        indexes = tuple(names.index(m) for m in included if m not in excluded)
+        rules.append(BonusRule(int(rule['points']), rule.get('requires'), indexes))
+
+    return ScoringPlan(names, slots, rules)
+
+
+class ScoringPlan:
+    '''
+    The compiled missions, see `compile_missions`.
+
+    :param missions: The mission names, in the order they are scored.
+    :param slots: The `Slot` for each field that affects the score.
+    :param bonuses: The `BonusRule`s.
+    '''
+
+    def __init__(self, missions: list, slots: list, bonuses: list):
+        self.missions = missions
+        self.slots = slots
+        self.bonuses = bonuses
+
+    def evaluate(self, formdata) -> (int, OrderedDict):
+        '''
+        Score a submission.
+
+        :param formdata: The submitted form, e.g. `request.form`. Anything with `get`.
+
+        :return: The total score and an ordered dict of the points scored for each mission.
+
+        :raises ValueError: If a choice isn't a number.
+        '''
+        scores = [0] * len(self.missions)
+        gated = [False] * len(self.missions)
+
+        for name, kind, mission, points, default, requires in self.slots:
+            value = formdata.get(name)
+
+            if requires is not None and not _checked(formdata.get(requires)):
+                value = None
+
+            if kind == CHECKBOX:
+                if value is not None:
+                    scores[mission] += points
+            elif kind == CHOICE:
+                scores[mission] += int(default if value is None else value)
+            elif not _checked(value):
+                gated[mission] = True
+
+        for mission, is_gated in enumerate(gated):
+            if is_gated:
+                scores[mission] = 0
+
+        bonus = 0
+
+        for points, requires, missions in self.bonuses:
+            if requires is None or _checked(formdata.get(requires)):
+                bonus += points * sum(1 for m in missions if scores[m] > 0)
+
+        total = max(0, sum(scores) + bonus)
+
+        return total, OrderedDict(zip(self.missions, scores))
+
+    def to_dict(self) -> OrderedDict:
+        '''
+        The plan as JSON serialisable data, for the score sheet to calculate the score as it is
+        filled in. See `static/score_sheet.js`.
+        '''
+        return OrderedDict([
+            ('missions', self.missions),
+            ('slots', [slot._asdict() for slot in self.slots]),
+            ('bonuses', [bonus._asdict() for bonus in self.bonuses]),
+            ('false_values', FALSE_VALUES),
+        ])
+
+
+def _checked(value: str) -> bool:
+    return value is not None and value not in FALSE_VALUES
@@ -0,0 +1,115 @@
+# -------------------------------------------------------------------------------------------------
+# The current stage.
+#
+# The stage is stored on the `state` row in the database, so moving to a new stage, knocking out
+# the teams that didn't qualify and ranking the rest for it are all committed together, and every
+# process sees the new stage as soon as it is committed. It is read on almost every request, and
+# several times by some, so it is read once per application context (i.e. per request or CLI
+# command) and kept on `flask.g`, which also means a request never sees the stage change part way
+# through.
+# -------------------------------------------------------------------------------------------------
+
+from flask import g
+from sqlalchemy import text
+
+
+__all__ = ['STAGES', 'StageService']
+
+# the internal names of the stages, indexed by stage
+STAGES = ('round_1', 'round_2', 'quarter_final', 'semi_final', 'final')
+
+
+class StageService:
+    '''
+    Reads and changes the current stage, calling any listeners when it changes.
+    '''
+
+    def __init__(self):
+        self._listeners = []
+
+        # the last stage read by this process, to notice changes made by other processes
+        self._last = None
+
+    def get(self) -> int:
+        '''
+        Get the current stage.
+
+        :return: An integer representing the current stage:
+            - 0: First round
+            - 1: Second round
+            - 2: Quarter final
+            - 3: Semi final
+            - 4: Final
+        '''
+        stage = g.get('lego_stage')
+
+        if stage is None:
+            stage = self._load()
+            g.lego_stage = stage
+            self._seen(stage)
+
+        return stage
+
+    def set(self, stage: int, qualify: bool=False):
+        '''
+        Move to a new stage, rank the teams for it and notify any listeners, in a single commit of
+        the session.
+
+        :param stage: The new stage. Must be an integer in the range 0-4.
+        :param qualify: Knock out the active teams that didn't qualify for the new stage, by their
+            rank at the current stage. See `ranking.qualify_teams`.
+        '''
+        # imported here as the models need the application
+        from lego import db
+        from lego.models import State
+        from lego.ranking import qualify_teams, update_ranks
+
+        if stage < 0 or stage >= len(STAGES):
+            msg = 'Invalid value for stage: {!s}. Must be an integer in the range 0-4.'
+            raise ValueError(msg.format(stage))
+
+        try:
+            conn = db.session.connection()
+            version = State.bump(conn, reset=True)
+            conn.execute(text('UPDATE state SET stage = :stage WHERE id = 1'), {'stage': stage})
+
+            if qualify:
+                qualify_teams(conn, stage, version)
+
+            update_ranks(conn, stage, version)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        g.lego_stage = stage
+        self._seen(stage)
+
+    def invalidate(self):
+        '''
+        Force the stage to be read from the database on the next call to `get`, e.g. after it was
+        changed with SQL.
+        '''
+        g.pop('lego_stage', None)
+
+    def subscribe(self, listener):
+        '''
+        Register a function to be called with the new stage whenever the stage changes.
+        '''
+        self._listeners.append(listener)
+
+    def _load(self) -> int:
+        from lego import db
+
+        # not autoflushed, as this is called while flushing to rank the teams
+        stage = db.session.execute(text('SELECT stage FROM state WHERE id = 1')).scalar()
+
+        # the first round until `flask init` has created the state row
+        return stage or 0
+
+    def _seen(self, stage: int):
+        previous, self._last = self._last, stage
+
+        if previous is not None and stage != previous:
+            for listener in self._listeners:
+                listener(stage)
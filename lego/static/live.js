@@ -0,0 +1,53 @@
+// Reload the public pages when the scores or stage change.
+//
+// The page listens to the stream given by `data-stream` on the `#live-updates` script element and
+// reloads as soon as it is told the state version differs from the one it was rendered at
+// (`data-version`). Browsers without EventSource, or whose stream keeps failing, e.g. because the
+// server is turning away streams, fall back to reloading every few seconds. This is cheap as
+// unchanged pages are answered with a 304.
+(function () {
+    'use strict';
+
+    var POLL_INTERVAL = 5000,
+        MAX_FAILURES = 3,
+        script = document.getElementById('live-updates'),
+        version = parseInt(script.getAttribute('data-version'), 10),
+        failures = 0,
+        source;
+
+    function poll() {
+        setTimeout(function () {
+            location.reload();
+        }, POLL_INTERVAL);
+    }
+
+    if (!window.EventSource) {
+        poll();
+        return;
+    }
+
+    source = new EventSource(script.getAttribute('data-stream'));
+
+    source.addEventListener('scores', function (e) {
+        var data = JSON.parse(e.data);
+
+        failures = 0;
+
+        // the page wasn't rendered at a known version so take the first event as the baseline
+        if (isNaN(version)) {
+            version = data.version;
+        } else if (data.version !== version) {
+            source.close();
+            location.reload();
+        }
+    });
+
+    source.onerror = function () {
+        failures += 1;
+
+        if (source.readyState === EventSource.CLOSED || failures >= MAX_FAILURES) {
+            source.close();
+            poll();
+        }
+    };
+}());
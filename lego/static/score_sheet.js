@@ -0,0 +1,98 @@
+// Calculate the score on the score sheet as it is filled in.
+//
+// The compiled missions are fetched from `data-rules` on the `#score-sheet` script element and
+// evaluated the same way as `ScoringPlan.evaluate` on the server, against the fields the browser
+// would submit. Fields that require another to be checked first, e.g. the M01 flags, are disabled
+// until it is, so they aren't submitted. With the total shown the score can be submitted straight
+// away, the server recalculates it and asks the judge to check it again if it differs. Without
+// this script the score is calculated by the server before it can be submitted.
+(function ($) {
+    'use strict';
+
+    var script = document.getElementById('score-sheet'),
+        form = document.forms.score_round,
+        rules;
+
+    function checked(value) {
+        return value !== null && rules.false_values.indexOf(value) === -1;
+    }
+
+    function applyRequirements() {
+        rules.slots.forEach(function (slot) {
+            var required;
+
+            if (slot.requires === null) {
+                return;
+            }
+
+            required = document.getElementsByName(slot.requires)[0];
+
+            $(document.getElementsByName(slot.name)).prop('disabled', !required.checked);
+        });
+    }
+
+    function evaluate(data) {
+        var scores = rules.missions.map(function () { return 0; }),
+            gated = scores.map(function () { return false; }),
+            total = 0;
+
+        rules.slots.forEach(function (slot) {
+            var value = data.get(slot.name);
+
+            if (slot.requires !== null && !checked(data.get(slot.requires))) {
+                value = null;
+            }
+
+            if (slot.kind === 'checkbox') {
+                if (value !== null) {
+                    scores[slot.mission] += slot.points;
+                }
+            } else if (slot.kind === 'choice') {
+                scores[slot.mission] += parseInt(value === null ? slot.default : value, 10);
+            } else if (!checked(value)) {
+                gated[slot.mission] = true;
+            }
+        });
+
+        scores = scores.map(function (score, i) { return gated[i] ? 0 : score; });
+
+        rules.bonuses.forEach(function (bonus) {
+            if (bonus.requires === null || checked(data.get(bonus.requires))) {
+                bonus.missions.forEach(function (i) {
+                    if (scores[i] > 0) {
+                        total += bonus.points;
+                    }
+                });
+            }
+        });
+
+        scores.forEach(function (score) { total += score; });
+
+        return Math.max(0, total);
+    }
+
+    function update() {
+        applyRequirements();
+        form.elements.score.value = evaluate(new FormData(form));
+    }
+
+    $(form).find('.calc-score').click(function () {
+        form.elements.confirm.value = '0';
+    });
+
+    $(form).find('.submit-score').click(function () {
+        form.elements.confirm.value = '1';
+    });
+
+    if (!window.FormData || !FormData.prototype.get) {
+        return;
+    }
+
+    $.getJSON(script.getAttribute('data-rules'), function (data) {
+        rules = data;
+
+        $(form).find('.score-total, .submit-score').prop('hidden', false);
+        $(form).on('input change', update);
+        update();
+    });
+}(jQuery));
@@ -0,0 +1,285 @@
+# -------------------------------------------------------------------------------------------------
+# SQLite settings and the single writer for scores.
+#
+# Every connection is put in WAL mode, so the displays reading the scoreboard never wait for a
+# judge's commit and a commit never waits for them. Writers still take turns, so rather than each
+# judge's request waiting on the database lock, scores are written by one thread per process that
+# commits whatever has been submitted since its last commit in a single transaction. A busy
+# timeout covers the writes that don't go through it, e.g. the CLI or other processes.
+#
+# The WAL is normally checkpointed by SQLite as it grows, but a checkpoint can't finish while a
+# display is reading, so the writer also checkpoints periodically while scores are being written.
+#
+# The sqlite3 module only starts a transaction before an INSERT, UPDATE or DELETE, so a savepoint
+# started first, e.g. by `Team.set_score`, would start one of its own that is committed as soon as
+# the savepoint is released. A transaction is started before any such savepoint instead.
+# -------------------------------------------------------------------------------------------------
+
+from concurrent.futures import Future, TimeoutError
+import queue
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event, text
+
+from lego import app, db
+
+
+__all__ = ['SYNCHRONOUS', 'WriteQueue', 'WriteTimeout', 'configure_sqlite']
+
+# the values of `LEGO_SQLITE_SYNCHRONOUS`
+SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# put on the queue to stop the writer
+_STOP = object()
+
+
+def configure_sqlite(engine):
+    '''
+    Set the pragmas from the configuration on every new connection to a SQLite database.
+    '''
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+
+        synchronous = app.config.get('LEGO_SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+
+        if synchronous not in SYNCHRONOUS:
+            raise ValueError('Invalid value for LEGO_SQLITE_SYNCHRONOUS: {!s}'.format(synchronous))
+
+        cursor = dbapi_connection.cursor()
+
+        try:
+            # first, so switching to WAL waits for any other connection
+            cursor.execute('PRAGMA busy_timeout = {:d}'
+                           .format(int(app.config.get('LEGO_SQLITE_BUSY_TIMEOUT', 5000))))
+
+            if app.config.get('LEGO_SQLITE_WAL', True):
+                cursor.execute('PRAGMA journal_mode = WAL')
+
+            cursor.execute('PRAGMA synchronous = {!s}'.format(synchronous))
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, 'savepoint')
+    def _begin_before_savepoint(conn, name):
+        if conn.dialect.name == 'sqlite' and not conn.connection.in_transaction:
+            conn.execute(text('BEGIN'))
+
+
+class WriteTimeout(Exception):
+    '''
+    Raised when a write wasn't committed by the writer in time.
+
+    :param started: Whether the writer had started the write, in which case it may still be
+        committed. Otherwise it was cancelled and never will be.
+    '''
+
+    def __init__(self, started: bool):
+        if started:
+            msg = 'The database is busy. This may still be saved, check before trying again.'
+        else:
+            msg = 'The database is busy and this was not saved. Please try again.'
+
+        super().__init__(msg)
+        self.started = started
+
+
+class WriteQueue:
+    '''
+    Runs writes to the database one at a time on a single thread, committing the writes submitted
+    while it was busy together.
+
+    A write is a function run in the writer's own application context and session, so it must load
+    anything it changes rather than use objects from the caller's session, and should only return
+    plain values as its session is closed once it is committed. If it raises, nothing
+    it did is committed and the exception is raised to the caller. The writes committed alongside
+    it are run again on their own.
+
+    :param max_batch: The maximum number of writes to commit together.
+    :param checkpoint_interval: The minimum number of seconds between checkpoints of the WAL, or 0
+        to leave them to SQLite.
+    :param enabled: If False, writes are run and committed by the thread submitting them, e.g. for
+        the CLI.
+    :param timeout: The number of seconds to wait for a write to be committed before giving up
+        with `WriteTimeout`, or None to wait forever.
+    '''
+
+    def __init__(self, max_batch: int=32, checkpoint_interval: float=60.0, enabled: bool=True,
+                 timeout: float=30.0):
+        self.max_batch = max_batch
+        self.checkpoint_interval = checkpoint_interval
+        self.enabled = enabled
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._commits = 0
+        self._writes = 0
+
+    @property
+    def stats(self) -> dict:
+        '''
+        The number of commits made by the writer and the number of writes they included.
+        '''
+        return {'commits': self._commits, 'writes': self._writes}
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Run a write and wait for it to be committed.
+
+        :return: Whatever `func` returned.
+
+        :raises WriteTimeout: If it wasn't committed within `timeout` seconds.
+        '''
+        if threading.current_thread() is self._thread:
+            # submitted by another write, so part of its batch
+            return func(*args, **kwargs)
+
+        if not self.enabled:
+            return self._run_inline(func, args, kwargs)
+
+        future = Future()
+        self._start()
+        self._queue.put((func, args, kwargs, future))
+
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # only possible if the writer hasn't taken it off the queue yet
+            cancelled = future.cancel()
+            app.logger.error('Write timed out after %ss, %s: %r', self.timeout,
+                             'cancelled' if cancelled else 'still running', func)
+            raise WriteTimeout(not cancelled) from None
+
+    def stop(self, timeout: float=5.0):
+        '''
+        Commit the writes already submitted and stop the writer.
+        '''
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def checkpoint(self) -> tuple:
+        '''
+        Copy what it can of the WAL back into the database without waiting for readers.
+
+        :return: The (busy, WAL frames, frames checkpointed) row returned by SQLite.
+        '''
+        with db.engine.connect() as conn:
+            return tuple(conn.execute(text('PRAGMA wal_checkpoint(PASSIVE)')).fetchone())
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None and not self._thread.is_alive():
+                # the writes it left on the queue are picked up by the new one
+                app.logger.error('The writer thread stopped unexpectedly, restarting it')
+                self._thread = None
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        last_checkpoint = time.monotonic()
+        written = False
+
+        while True:
+            try:
+                job = self._queue.get(timeout=self.checkpoint_interval or None)
+            except queue.Empty:
+                job = None
+
+            if job is _STOP:
+                break
+
+            if job is not None:
+                batch = [job]
+                stop = False
+
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    if job is _STOP:
+                        stop = True
+                        break
+
+                    batch.append(job)
+
+                # leaving out the writes whose callers have given up waiting, see `submit`
+                batch = [job for job in batch if job[3].set_running_or_notify_cancel()]
+
+                try:
+                    with app.app_context():
+                        try:
+                            self._commit(batch)
+                        finally:
+                            db.session.remove()
+                except Exception as exc:
+                    # e.g. the rollback failed, so the callers aren't left waiting
+                    app.logger.exception(exc)
+
+                    for _, _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(exc)
+
+                written = True
+
+                if stop:
+                    break
+
+            if written and self.checkpoint_interval and \
+                    time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                try:
+                    with app.app_context():
+                        self.checkpoint()
+                except Exception as exc:
+                    app.logger.exception(exc)
+
+                last_checkpoint = time.monotonic()
+                written = False
+
+    def _commit(self, batch: list):
+        if not batch:
+            return
+
+        try:
+            results = [func(*args, **kwargs) for func, args, kwargs, _ in batch]
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+
+            if len(batch) == 1:
+                batch[0][3].set_exception(exc)
+                return
+
+            # find the write that failed by committing each on its own
+            for job in batch:
+                self._commit([job])
+
+            return
+
+        self._commits += 1
+        self._writes += len(batch)
+
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _run_inline(self, func, args: tuple, kwargs: dict):
+        try:
+            result = func(*args, **kwargs)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return result
@@ -0,0 +1,238 @@
+# -------------------------------------------------------------------------------------------------
+# Bulk import of teams.
+#
+# The whole file is parsed and checked before anything is written, and every problem is reported
+# at once rather than stopping at the first. The teams are then written with one multi-row insert
+# (and update, when replacing existing teams) in a single transaction, so an import either adds
+# every team or none of them. Existing teams can swap names, as each team renamed is first given
+# a temporary name.
+#
+# Files either have one `number, name` pair per line, or are CSV with a header row naming the
+# `number` and `name` columns, e.g. as exported from a spreadsheet.
+# -------------------------------------------------------------------------------------------------
+
+from collections import namedtuple
+import csv
+
+from sqlalchemy import bindparam
+
+from lego import db
+from lego.models import State, Team
+from lego.ranking import update_ranks
+
+
+__all__ = ['ImportResult', 'InvalidTeams', 'TeamRecord', 'import_teams', 'parse_teams']
+
+# the longest name the team table allows
+MAX_NAME_LENGTH = Team.__table__.c.name.type.length
+
+# a team read from a file, with the line it was read from for error messages
+TeamRecord = namedtuple('TeamRecord', ('line', 'number', 'name'))
+
+# the number of teams added and updated by an import
+ImportResult = namedtuple('ImportResult', ('added', 'updated'))
+
+
+class InvalidTeams(Exception):
+    '''
+    Raised when a file of teams can't be imported.
+
+    :param errors: A list of (line number, message) tuples, one for each problem found.
+    '''
+
+    def __init__(self, errors: list):
+        super().__init__('{:d} problem(s) found with the teams'.format(len(errors)))
+        self.errors = errors
+
+
+def parse_teams(lines) -> list:
+    '''
+    Parse and check a file of teams.
+
+    :param lines: An iterable of lines, e.g. an open file.
+
+    :return: A list of `TeamRecord`s.
+
+    :raises InvalidTeams: If any line is invalid or any number or name is repeated.
+    '''
+    records = []
+    errors = []
+    rows = _rows(lines, errors)
+
+    for line_no, number, name in rows:
+        try:
+            number = int(number.strip())
+        except ValueError:
+            errors.append((line_no, 'Invalid number: {!s}'.format(number.strip())))
+            continue
+
+        name = name.strip()
+
+        if number <= 0:
+            errors.append((line_no, 'Invalid number: {!s}. Must be greater than 0.'.format(number)))
+        elif not name:
+            errors.append((line_no, 'Missing name for team {!s}.'.format(number)))
+        elif len(name) > MAX_NAME_LENGTH:
+            errors.append((line_no, 'Name is longer than {:d} characters: {!s}'
+                                    .format(MAX_NAME_LENGTH, name)))
+        else:
+            records.append(TeamRecord(line_no, number, name))
+
+    errors.extend(_duplicates(records, 'number'))
+    errors.extend(_duplicates(records, 'name'))
+
+    if errors:
+        raise InvalidTeams(sorted(errors))
+
+    return records
+
+
+def import_teams(records: list, upsert: bool=False) -> ImportResult:
+    '''
+    Add teams to the current transaction. Nothing is written if any team conflicts with one that
+    already exists. The caller commits.
+
+    :param records: The teams to add, from `parse_teams`.
+    :param upsert: Rename existing teams with the same number rather than treating them as
+        conflicts. A name can be taken from another existing team that is renamed too.
+
+    :return: The number of teams added and updated.
+
+    :raises InvalidTeams: If any team conflicts with an existing team.
+    '''
+    existing = db.session.query(Team.id, Team.number, Team.name).all()
+    ids_by_number = {number: team_id for team_id, number, _ in existing}
+    numbers_by_name = {name: number for _, number, name in existing}
+
+    # the existing teams given a new name, whose current names are free to be taken
+    renamed = {r.number for r in records if r.number in ids_by_number} if upsert else set()
+
+    errors = []
+    inserts = []
+    updates = []
+
+    for record in records:
+        team_id = ids_by_number.get(record.number)
+        name_owner = numbers_by_name.get(record.name)
+
+        if team_id is not None and not upsert:
+            errors.append((record.line, 'Team {!s} already exists.'.format(record.number)))
+        elif name_owner is not None and name_owner != record.number \
+                and name_owner not in renamed:
+            errors.append((record.line, 'The name {!s} is already used by team {!s}.'
+                                        .format(record.name, name_owner)))
+        elif team_id is not None:
+            updates.append({'_id': team_id, '_name': record.name})
+        else:
+            inserts.append({'number': record.number, 'name': record.name})
+
+    if errors:
+        raise InvalidTeams(errors)
+
+    if not inserts and not updates:
+        return ImportResult(0, 0)
+
+    # bulk statements skip the session's flush listeners, so do their work here: a new version
+    # stamped on every team written and the ranks brought up to date
+    conn = db.session.connection()
+    version = State.bump(conn)
+    table = Team.__table__
+
+    if updates:
+        # names must be unique after each row is written, so a team can't take the name of
+        # another until that team has been moved out of the way, to a name made from its id that
+        # can't be typed or read from a file. New teams are added after, for the same reason
+        stmt = table.update() \
+            .where(table.c.id == bindparam('_id')) \
+            .values(name=bindparam('_temp'))
+        conn.execute(stmt, [{'_id': row['_id'], '_temp': '\0{:d}'.format(row['_id'])}
+                            for row in updates])
+
+        stmt = table.update() \
+            .where(table.c.id == bindparam('_id')) \
+            .values(name=bindparam('_name'), version=version)
+        conn.execute(stmt, updates)
+
+    if inserts:
+        for row in inserts:
+            row['version'] = version
+
+        conn.execute(table.insert(), inserts)
+
+    update_ranks(conn, version=version)
+
+    return ImportResult(len(inserts), len(updates))
+
+
+def _rows(lines, errors: list):
+    '''
+    Generate (line number, number, name) for each non-empty line, skipping any header row.
+    '''
+    lines = iter(lines)
+    first = None
+
+    for first_no, line in enumerate(lines, start=1):
+        # spreadsheets often save CSV with a byte order mark
+        line = line.lstrip('\ufeff')
+
+        if line.strip():
+            first = line
+            break
+
+    if first is None:
+        return
+
+    cells = [c.strip().lower() for c in next(csv.reader([first]))]
+
+    if 'number' in cells and 'name' in cells:
+        number_col = cells.index('number')
+        name_col = cells.index('name')
+        width = max(number_col, name_col) + 1
+        reader = csv.reader(lines)
+
+        for row in reader:
+            line_no = first_no + reader.line_num
+
+            if not any(cell.strip() for cell in row):
+                continue
+
+            if len(row) < width:
+                errors.append((line_no, 'Expected a number and a name: {!s}'.format(','.join(row))))
+                continue
+
+            yield line_no, row[number_col], row[name_col]
+
+        return
+
+    # no header, so each line is `number, name` with everything after the first comma the name
+    yield from _split_line(first_no, first, errors)
+
+    for line_no, line in enumerate(lines, start=first_no + 1):
+        if line.strip():
+            yield from _split_line(line_no, line, errors)
+
+
+def _split_line(line_no: int, line: str, errors: list):
+    parts = line.split(',', 1)
+
+    if len(parts) != 2:
+        errors.append((line_no, 'Expected a number and a name: {!s}'.format(line.strip())))
+        return
+
+    yield line_no, parts[0], parts[1]
+
+
+def _duplicates(records: list, field: str) -> list:
+    first_lines = {}
+    errors = []
+
+    for record in records:
+        value = getattr(record, field)
+
+        if value in first_lines:
+            errors.append((record.line, 'Duplicate {!s} {!s}, first used on line {:d}.'
+                                        .format(field, value, first_lines[value])))
+        else:
+            first_lines[value] = record.line
+
+    return errors
@@ -2,37 +2,52 @@
 # Utility functions that don't depend on any application speific code.
 # -------------------------------------------------------------------------------------------------
 
+import ast
+import atexit
+from collections import OrderedDict
+import json
 import logging
 from logging import Formatter
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueListener, RotatingFileHandler
+import logging.handlers
 import os
+import queue
 
 
-__all__ = ['create_log_handler', 'load_stage', 'compare_teams']
+__all__ = ['create_log_handler', 'JsonFormatter', 'QueueHandler', 'queue_logging',
+           'set_log_levels', 'load_stage', 'compare_teams', 'parse_breakdown']
 
 # 1 MiB
 MB = 1024 * 1024
 
-def create_log_handler(name, level=logging.DEBUG, size=MB, count=5) -> RotatingFileHandler:
+def create_log_handler(name, level=logging.DEBUG, size=MB, count=5,
+                       structured=True) -> RotatingFileHandler:
     '''
     Create a rotating log file handler for use by the application.
 
+    The handler writes to the file on the thread that calls it, so should be passed to
+    `queue_logging` rather than added to a logger directly.
+
     :param name: A string representing the name of the log file without the file extension, e.g.
         'example'.
     :param level: The log level. Should be one of the levels defined by `logging` or the integer
         alternative. Defaults to debug.
     :param size: The maximum size of the log file in bytes. Defaults to 1 MiB.
     :param count: The maximum number of log files to keep. Defaults to 5.
+    :param structured: Write each record as a JSON object on its own line rather than as text.
+        Defaults to True.
 
     :return: The logging handler.
     '''
-    logging.basicConfig(level=level)
     log_dir = os.path.join(os.path.dirname(__file__), 'logs')
     log_file = '{!s}.log'.format(name)
     log_path = os.path.join(log_dir, log_file)
 
-    formatter = Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s '
-                          '[in %(pathname)s:%(lineno)d]')
+    if structured:
+        formatter = JsonFormatter()
+    else:
+        formatter = Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s '
+                              '[in %(pathname)s:%(lineno)d]')
 
     fh = RotatingFileHandler(log_path, 'a', size, count)
     fh.setLevel(level)
@@ -41,9 +56,105 @@ def create_log_handler(name, level=logging.DEBUG, size=MB, count=5) -> RotatingF
     return fh
 
 
-def load_stage() -> int:
+class JsonFormatter(Formatter):
+    '''
+    Formats each record as a single line JSON object, so the logs can be searched and loaded by
+    other tools without parsing the message.
+
+    Any attributes added to a record with `extra` that can be written as JSON are included.
+    '''
+
+    # attributes every record has, which are either included under other names or left out
+    RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) \
+        | {'message', 'asctime'}
+
+    def format(self, record) -> str:
+        data = OrderedDict()
+        data['time'] = self.formatTime(record)
+        data['logger'] = record.name
+        data['level'] = record.levelname
+        data['message'] = record.getMessage()
+        data['module'] = record.module
+        data['line'] = record.lineno
+        data['thread'] = record.threadName
+
+        for key, value in vars(record).items():
+            if key not in self.RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+
+        if record.stack_info:
+            data['stack'] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, default=str)
+
+    def formatTime(self, record, datefmt=None) -> str:
+        return super().formatTime(record, datefmt or '%Y-%m-%dT%H:%M:%S') \
+            + '.{:03d}'.format(int(record.msecs))
+
+
+class QueueHandler(logging.handlers.QueueHandler):
     '''
-    Load the current stage.
+    Puts records on a queue for a `QueueListener` to write on its own thread.
+
+    The standard handler formats each record before queueing it, which would leave the formatting
+    on the calling thread. Only the message is merged with its arguments here, as the arguments may
+    change or, for database objects, not be safe to use from another thread; the rest of the
+    formatting is done by the listener.
+    '''
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+
+        return record
+
+
+def queue_logging(logger: logging.Logger, *handlers) -> QueueListener:
+    '''
+    Send a logger's records to handlers on a background thread, so a request only has to put each
+    record on a queue and never waits for the disk, including while a log file is rotated.
+
+    The listener is stopped when the process exits, writing any records still queued.
+
+    :param logger: The logger to send records from.
+    :param handlers: The handlers to send records to. Each handler's level is respected.
+
+    :return: The started listener.
+    '''
+    records = queue.Queue()
+    logger.addHandler(QueueHandler(records))
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
+
+
+def set_log_levels(levels: dict):
+    '''
+    Set the level of each logger, e.g. `{'lego': 'INFO', 'lego.queries': 'WARNING'}`.
+
+    :param levels: A dict of logger name to level, as a name or the integer alternative.
+
+    :raises ValueError: If a level isn't valid.
+    '''
+    for name, level in levels.items():
+        if isinstance(level, str):
+            level = level.upper()
+
+        logging.getLogger(name).setLevel(level)
+
+
+def load_stage(path: str=None) -> int:
+    '''
+    Load the stage from the file it was kept in before it was stored in the database, see
+    `migrations.add_state_stage`. Use `app.load_stage` for the current stage.
+
+    :param path: The path to the stage file. Defaults to `lego/tmp/.stage`.
 
     :return: An integer representing the current stage:
         - 0: First round
@@ -52,10 +163,11 @@ def load_stage() -> int:
         - 3: Semi final
         - 4: Final
     '''
-    cur_path = os.path.dirname(os.path.abspath(__file__))
-    stage_path = os.path.join(cur_path, 'tmp', '.stage')
+    if path is None:
+        cur_path = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(cur_path, 'tmp', '.stage')
 
-    with open(stage_path) as fh:
+    with open(path) as fh:
         stage = int(fh.read().strip())
 
     if stage < 0 or stage > 4:
@@ -76,3 +188,38 @@ def compare_teams(team_1, team_2) -> int:
         return -1
 
     return 0
+
+
+def parse_breakdown(breakdown: str) -> OrderedDict:
+    '''
+    Parse a score breakdown as stored on a score, see `Score.breakdown`.
+
+    Breakdowns are stored as a JSON object of the points scored for each mission. Those stored by
+    earlier versions, before `migrations.add_mission_scores` is run, are the `repr` of an ordered
+    dict, so are parsed as Python literals rather than evaluated.
+
+    :param breakdown: The stored breakdown. May be None or empty if there is no score.
+
+    :return: An ordered dict of mission name to points scored.
+
+    :raises ValueError: If the breakdown isn't in the expected format.
+    '''
+    if not breakdown:
+        return OrderedDict()
+
+    if breakdown.startswith('{'):
+        try:
+            return json.loads(breakdown, object_pairs_hook=OrderedDict)
+        except ValueError:
+            # a plain dict's repr
+            pass
+
+    prefix = 'OrderedDict('
+
+    if breakdown.startswith(prefix) and breakdown.endswith(')'):
+        breakdown = breakdown[len(prefix):-1] or '[]'
+
+    try:
+        return OrderedDict(ast.literal_eval(breakdown))
+    except (SyntaxError, TypeError, ValueError) as exc:
+        raise ValueError('Invalid breakdown: {!r}'.format(breakdown)) from exc
@@ -0,0 +1,15 @@
+# -------------------------------------------------------------------------------------------------
+# WSGI entry point for serving the application with several worker processes, e.g. with gunicorn
+# from the repository root:
+#
+#     gunicorn --config gunicorn.conf.py lego.wsgi:app
+#
+# Each worker imports the application itself and keeps its own stage, leaderboard and page cache,
+# which are kept up to date with the changes made by the other workers through the version and
+# stage in the `state` table, see `lego.stage` and `lego.leaderboard`.
+# -------------------------------------------------------------------------------------------------
+
+from lego import app
+
+
+__all__ = ['app']
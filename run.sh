@@ -1,6 +1,14 @@
 #! /usr/bin/env bash
 # -----------------------------------------------------------------------------
 # Run flask application on any public IP address, on port 5000
+#
+# Uses a worker process per core with gunicorn if it is installed, see
+# gunicorn.conf.py, otherwise a single process with flask run.
 # -----------------------------------------------------------------------------
 export FLASK_APP="`pwd`/lego/__init__.py"
+
+if command -v gunicorn > /dev/null; then
+    exec gunicorn --config gunicorn.conf.py lego.wsgi:app
+fi
+
 flask run --host=0.0.0.0 --port=5000 --no-debugger --with-threads --no-reload
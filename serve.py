@@ -0,0 +1,48 @@
+# -------------------------------------------------------------------------------------------------
+# Serve the application with gevent.
+#
+# Every display holds a scoreboard stream open for as long as it is shown. With `flask run` each of
+# those costs a thread, here each costs a greenlet so hundreds of displays are cheap. `run.sh`
+# does the same with gunicorn's gevent workers, see `gunicorn.conf.py`, this is for where gunicorn
+# can't be used, e.g. Windows. gevent is optional, install it with `pip install gevent` and run
+# from the repository root:
+#
+#     python serve.py --host 0.0.0.0 --port 5000
+#
+# This lives outside the `lego` package as gevent has to patch the standard library before the
+# application is imported.
+# -------------------------------------------------------------------------------------------------
+
+# gevent has to patch the standard library before anything else imports it
+try:
+    from gevent import monkey
+except ImportError:
+    monkey = None
+else:
+    monkey.patch_all()
+
+import click
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True,
+              help='The interface to bind to, use 0.0.0.0 for all interfaces.')
+@click.option('--port', default=5000, show_default=True, help='The port to bind to.')
+def serve(host: str, port: int):
+    '''
+    Run the application on gevent's WSGI server.
+    '''
+    if monkey is None:
+        raise click.ClickException('gevent is not installed. Install it with `pip install gevent` '
+                                   'or use `flask run --with-threads` instead.')
+
+    from gevent.pywsgi import WSGIServer
+
+    from lego import app
+
+    click.echo('Serving on http://{!s}:{:d}'.format(host, port))
+    WSGIServer((host, port), app).serve_forever()
+
+
+if __name__ == '__main__':
+    serve()
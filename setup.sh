@@ -25,11 +25,8 @@ if [[ ! -f "./lego/tmp/app.db" ]]; then
     flask init 
 fi
 
-# Create stage file if it is missing
-if [[ ! -f "./lego/tmp/.stage" ]]; then
-    echo "Creating stage file..."
-    echo 0 > ./lego/tmp/.stage
-fi
+# Bring a database created by an earlier version up to date
+flask migrate
 
-# Add teams
-flask add-teams ./teams.txt
+# Add teams, renaming any that were already added so the script can be run again
+flask add-teams --upsert ./teams.txt
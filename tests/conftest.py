@@ -0,0 +1,23 @@
+# -------------------------------------------------------------------------------------------------
+# Configuration for the tests.
+#
+# The application reads its settings from `lego/config.py` when it is imported, so a test
+# configuration is put in its place first. It uses an in-memory database and the writer thread is
+# disabled, so the tests never touch the application's own data.
+# -------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+config = types.ModuleType('lego.config')
+config.SECRET_KEY = 'test'
+config.WTF_CSRF_ENABLED = False
+config.SQLALCHEMY_TRACK_MODIFICATIONS = False
+config.SQLALCHEMY_DATABASE_URI = 'sqlite://'
+config.LEGO_APP_TYPE = 'uk'
+config.LEGO_WRITE_QUEUE = False
+config.LEGO_LOG_LEVELS = {'lego': 'WARNING'}
+sys.modules['lego.config'] = config
@@ -0,0 +1,111 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the per-mission scores and the questions asked of them, see `lego.analytics`.
+# -------------------------------------------------------------------------------------------------
+
+import json
+
+import pytest
+
+from lego import app, db
+from lego.analytics import mission_stats, teams_scoring
+from lego.models import MissionScore, State, Team
+import lego.util as util
+
+
+@pytest.fixture
+def teams():
+    '''
+    Two teams and the practice team with scores in the first round, and one in the second.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+
+        for number, name in ((-1, 'Practice'), (1, 'Robots'), (2, 'Drones')):
+            db.session.add(Team(number=number, name=name, is_practice=number < 0))
+
+        db.session.commit()
+        app.stage.invalidate()
+
+        practice, robots, drones = Team.query.order_by(Team.number).all()
+        practice._add_score(0, 1, 50, json.dumps({'M01': 50, 'M02': 0}))
+        robots._add_score(0, 1, 20, json.dumps({'M01': 20, 'M02': 0}))
+        robots._add_score(0, 2, 50, json.dumps({'M01': 20, 'M02': 30}))
+        drones._add_score(0, 1, 0, json.dumps({'M01': 0, 'M02': 0}))
+        drones._add_score(1, 1, 40, json.dumps({'M01': 40}))
+        db.session.commit()
+
+    yield
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        app.leaderboard.invalidate()
+
+
+def test_mission_stats(teams):
+    with app.app_context():
+        stats = mission_stats()
+
+    assert [(s.stage, s.mission, s.scores, s.successes, s.max) for s in stats] == [
+        (0, 'M01', 3, 2, 20),
+        (0, 'M02', 3, 1, 30),
+        (1, 'M01', 1, 1, 40),
+    ]
+    assert stats[0].success_rate == pytest.approx(2 / 3)
+    assert stats[0].mean == pytest.approx(40 / 3)
+
+
+def test_mission_stats_filtered(teams):
+    with app.app_context():
+        assert [(s.stage, s.mission) for s in mission_stats(mission='M01')] == [(0, 'M01'),
+                                                                                 (1, 'M01')]
+        assert [(s.stage, s.mission) for s in mission_stats(1)] == [(1, 'M01')]
+
+
+def test_teams_scoring(teams):
+    with app.app_context():
+        assert teams_scoring('M01') == [(1, 'Robots', 'attempt_1', 20),
+                                        (1, 'Robots', 'attempt_2', 20),
+                                        (2, 'Drones', 'round_2', 40)]
+        assert teams_scoring('M02', 0) == [(1, 'Robots', 'attempt_2', 30)]
+        assert teams_scoring('M01', 2) == []
+
+
+def test_set_score_adds_mission_rows(teams):
+    with app.app_context():
+        team = Team.query.filter_by(number=1).one()
+        team.set_score((60, json.dumps({'M01': 20, 'M02': 40})))
+        db.session.commit()
+
+        score = team.get_score(0, 3)
+
+        assert sorted((row.mission, row.points, row.team_id, row.stage)
+                      for row in score.mission_scores) == [('M01', 20, team.id, 0),
+                                                           ('M02', 40, team.id, 0)]
+
+
+def test_reset_removes_mission_rows(teams):
+    with app.app_context():
+        team = Team.query.filter_by(number=1).one()
+        team.reset_round_score('attempt_2')
+        db.session.commit()
+
+        assert MissionScore.query.filter_by(team_id=team.id).count() == 2
+        assert [row[3] for row in teams_scoring('M02')] == []
+
+
+@pytest.mark.parametrize('breakdown', [
+    '{"M01": 20, "M02": 0}',
+    "OrderedDict([('M01', 20), ('M02', 0)])",
+    "{'M01': 20, 'M02': 0}",
+])
+def test_parse_breakdown(breakdown):
+    assert list(util.parse_breakdown(breakdown).items()) == [('M01', 20), ('M02', 0)]
+
+
+def test_parse_breakdown_is_not_evaluated():
+    assert util.parse_breakdown(None) == {}
+
+    with pytest.raises(ValueError):
+        util.parse_breakdown("OrderedDict(__import__('os').listdir('.'))")
@@ -0,0 +1,146 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the leaderboard API.
+# -------------------------------------------------------------------------------------------------
+
+import json
+
+import pytest
+
+from lego import app, db
+from lego.models import Score, State, Team
+
+
+@pytest.fixture
+def client():
+    '''
+    A test client for an empty database with three teams in the first round.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.commit()
+
+        for number in (1, 2, 3):
+            db.session.add(Team(number=number, name='Team {:d}'.format(number)))
+
+        db.session.commit()
+        app.stage.invalidate()
+        app.leaderboard.invalidate()
+
+    yield app.test_client()
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        app.leaderboard.invalidate()
+
+
+def add_score(number: int, points: int):
+    with app.app_context():
+        team = Team.query.filter_by(number=number).one()
+        team.scores.append(Score(stage=0, attempt_no=len(team.scores) + 1, points=points))
+        db.session.commit()
+
+
+def leaderboard(client, since: int=None, **query):
+    if since is not None:
+        query['since'] = since
+
+    response = client.get('/api/leaderboard', query_string=query)
+
+    if response.status_code == 204:
+        return None
+
+    assert response.status_code == 200
+    return json.loads(response.get_data(as_text=True))
+
+
+def numbers(data: dict) -> list:
+    return [row[1] for row in data['rows']]
+
+
+def test_since_returns_only_the_changes(client):
+    version = leaderboard(client)['version']
+    # already first, so no other team's rank moves
+    add_score(1, 100)
+
+    data = leaderboard(client, version)
+
+    assert data['version'] > version
+    assert numbers(data) == [1]
+    assert data['removed'] == []
+
+
+def test_since_the_latest_version_is_no_content(client):
+    version = leaderboard(client)['version']
+
+    assert leaderboard(client, version) is None
+
+
+def test_since_reports_inactive_teams_as_removed(client):
+    version = leaderboard(client)['version']
+
+    with app.app_context():
+        Team.query.filter_by(number=3).one().active = False
+        db.session.commit()
+
+    data = leaderboard(client, version)
+
+    assert 3 not in numbers(data)
+    assert data['removed'] == [3]
+
+
+def test_since_reports_teams_moved_out_of_the_window_as_removed(client):
+    data = leaderboard(client, limit=2)
+    assert numbers(data) == [1, 2]
+
+    add_score(3, 100)
+
+    data = leaderboard(client, data['version'], limit=2)
+
+    assert [row[:2] for row in data['rows']] == [[1, 3], [2, 1]]
+    assert data['removed'] == [2]
+
+    # and out of the window before it
+    data = leaderboard(client, offset=1)
+    assert numbers(data) == [1, 2]
+
+    add_score(2, 200)
+
+    data = leaderboard(client, data['version'], offset=1)
+
+    assert [row[:2] for row in data['rows']] == [[2, 3], [3, 1]]
+    assert data['removed'] == [2]
+
+
+def test_since_before_a_deletion_returns_everything(client):
+    version = leaderboard(client)['version']
+
+    with app.app_context():
+        db.session.delete(Team.query.filter_by(number=3).one())
+        db.session.commit()
+
+    data = leaderboard(client, version)
+
+    assert sorted(numbers(data)) == [1, 2]
+    assert 'removed' not in data
+
+
+def test_since_before_a_stage_change_returns_everything(client):
+    version = leaderboard(client)['version']
+
+    with app.app_context():
+        app.stage.set(1)
+
+    data = leaderboard(client, version)
+
+    assert data['stage'] == 1
+    assert sorted(numbers(data)) == [1, 2, 3]
+    assert 'removed' not in data
+
+    # later changes are sent on their own again
+    with app.app_context():
+        Team.query.filter_by(number=3).one().name = 'Renamed'
+        db.session.commit()
+
+    assert numbers(leaderboard(client, data['version'])) == [3]
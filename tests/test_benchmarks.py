@@ -0,0 +1,65 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the benchmark suite, see `benchmarks`.
+# -------------------------------------------------------------------------------------------------
+
+import io
+import json
+
+from click.testing import CliRunner
+
+from benchmarks.compare import compare, load_results, main as compare_main
+from benchmarks.suite import BENCHMARKS, run_benchmarks
+from lego import app, db
+
+
+def results_file(results: list) -> io.StringIO:
+    return io.StringIO(json.dumps({'results': [{'name': name, 'size': size, 'seconds': seconds}
+                                               for name, size, seconds in results]}))
+
+
+def test_compare():
+    baseline = load_results(results_file([('sort', 20, 1.0), ('sort', 200, 1.0),
+                                          ('render', 20, 1.0), ('parse', None, 1.0),
+                                          ('gone', 20, 1.0)]))
+    results = load_results(results_file([('sort', 20, 1.1), ('sort', 200, 1.5),
+                                         ('render', 20, 0.5), ('parse', None, 1.0),
+                                         ('added', 20, 1.0)]))
+
+    assert [(name, size, status) for name, size, _, _, _, status
+            in compare(baseline, results, 0.2)] == [
+        ('parse', None, 'ok'),
+        ('added', 20, 'new'),
+        ('gone', 20, 'missing'),
+        ('render', 20, 'faster'),
+        ('sort', 20, 'ok'),
+        ('sort', 200, 'REGRESSION'),
+    ]
+
+
+def test_compare_fails_on_regressions(tmpdir):
+    baseline = tmpdir.join('baseline.json')
+    baseline.write(results_file([('sort', 20, 1.0)]).getvalue())
+    results = tmpdir.join('results.json')
+    results.write(results_file([('sort', 20, 2.0)]).getvalue())
+
+    result = CliRunner().invoke(compare_main, [str(baseline), str(results)])
+
+    assert result.exit_code == 1
+    assert 'REGRESSION' in result.output
+
+    assert CliRunner().invoke(compare_main, [str(baseline), str(baseline)]).exit_code == 0
+
+
+def test_every_benchmark_runs():
+    with app.app_context():
+        try:
+            results = run_benchmarks([5, 10], 1, 1, 0)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+    sized = sum(1 for _, _, _, is_sized in BENCHMARKS if is_sized)
+
+    # the benchmarks that don't depend on the number of teams only run at the first size
+    assert len(results) == len(BENCHMARKS) + sized
+    assert all(result['seconds'] > 0 for result in results)
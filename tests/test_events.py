@@ -0,0 +1,116 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the live score events streamed to the public pages.
+# -------------------------------------------------------------------------------------------------
+
+import threading
+
+import pytest
+
+from lego import app, db
+from lego.events import ScoreEvents, format_event
+from lego.models import State
+
+
+@pytest.fixture
+def events(monkeypatch):
+    '''
+    Score events of their own, allowing two streams, for an empty database in the first round.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=3, stage=0))
+        db.session.commit()
+        app.stage.invalidate()
+
+    # the poller only checks once in a test
+    events = ScoreEvents(poll_interval=3600, max_clients=2)
+    monkeypatch.setattr(app, 'score_events', events)
+    monkeypatch.setitem(app.config, 'LEGO_STREAM_KEEPALIVE', 0.01)
+
+    yield events
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def test_format_event():
+    assert format_event(12, 2) == 'id: 12\nevent: scores\ndata: {"version":12,"stage":2}\n\n'
+
+
+def test_wait_returns_once_published():
+    events = ScoreEvents()
+    events.publish(1, 0)
+
+    threading.Timer(0.05, events.publish, (2, 0)).start()
+
+    assert events.wait((1, 0), 5) == (2, 0)
+    # or the same pair if nothing changed in time
+    assert events.wait((2, 0), 0.01) == (2, 0)
+
+
+def test_limit_threads():
+    events = ScoreEvents(max_clients=500, reserved_threads=4)
+
+    # e.g. a gthread worker with 8 threads keeps 4 for the other pages
+    events.limit_threads(8)
+
+    assert events.max_clients == 4
+
+    events.limit_threads(2)
+
+    assert events.max_clients == 0
+
+    events = ScoreEvents(max_clients=2)
+    events.limit_threads(100)
+
+    assert events.max_clients == 2
+
+
+def test_stream(events):
+    response = app.test_client().get('/scoreboard/stream', buffered=False)
+    chunks = iter(response.response)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert events.clients == 1
+
+    assert next(chunks) == b'retry: 5000\n\n'
+    assert next(chunks) == format_event(3, 0).encode('utf-8')
+    assert next(chunks) == b': keepalive\n\n'
+
+    events.publish(4, 1)
+
+    assert format_event(4, 1).encode('utf-8') in (next(chunks), next(chunks))
+
+    response.close()
+
+    assert events.clients == 0
+
+
+def test_streams_over_the_limit_are_turned_away(events):
+    client = app.test_client()
+    open_streams = [client.get('/scoreboard/stream', buffered=False) for _ in range(2)]
+
+    response = client.get('/scoreboard/stream', buffered=False)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+    assert events.clients == 2
+
+    for stream in open_streams:
+        stream.close()
+
+    assert events.clients == 0
+
+
+def test_failed_streams_are_released(events, monkeypatch):
+    def fail():
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(State, 'current_version', fail)
+
+    response = app.test_client().get('/scoreboard/stream', buffered=False)
+
+    assert response.status_code == 500
+    assert events.clients == 0
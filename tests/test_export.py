@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the export of the teams and their scores.
+# -------------------------------------------------------------------------------------------------
+
+import csv
+import json
+
+import pytest
+
+from lego import app, db
+import lego.export as export
+from lego.models import Score, State, Team, User
+
+
+@pytest.fixture
+def teams(monkeypatch):
+    '''
+    Five teams in the first round, read from the database two at a time, and a judge.
+    '''
+    monkeypatch.setattr(export, 'BATCH_SIZE', 2)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.add(User(username='judge', password=b'', is_judge=True))
+        db.session.add(Team(number=-1, name='Practice', is_practice=True))
+
+        for number in range(1, 6):
+            db.session.add(Team(number=number, name='Team "{:d}", the robots'.format(number)))
+
+        db.session.commit()
+        app.stage.invalidate()
+
+        # team 3 ranks first, then 5
+        mission = export.mission_names()[0]
+        team = Team.query.filter_by(number=3).one()
+        team.scores.append(Score(stage=0, attempt_no=2, points=40,
+                                 breakdown=json.dumps({mission: 40})))
+        team.scores.append(Score(stage=0, attempt_no=3, points=0))
+        team = Team.query.filter_by(number=5).one()
+        team.scores.append(Score(stage=0, attempt_no=1, points=20))
+        db.session.commit()
+
+    yield
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def export_rows(breakdowns: bool=False) -> list:
+    with app.app_context():
+        return list(export.export_rows(breakdowns))
+
+
+def test_rows_are_in_rank_order(teams):
+    rows = export_rows()
+
+    assert [(row['rank'], row['number']) for row in rows] == [(1, 3), (2, 5), (3, 1), (4, 2),
+                                                              (5, 4)]
+    assert [rows[0][key] for key in ('attempt_1', 'attempt_2', 'attempt_3', 'best_attempt')] \
+        == [None, 40, 0, 40]
+    assert rows[2]['best_attempt'] is None
+
+
+def test_rows_with_breakdowns(teams):
+    row = export_rows(breakdowns=True)[0]
+
+    with app.app_context():
+        mission = export.mission_names()[0]
+
+    assert row['attempt_2_breakdown'] == {mission: 40}
+    assert row['attempt_1_breakdown'] == {}
+
+
+def test_csv(teams):
+    with app.app_context():
+        lines = list(export.iter_csv(export_rows()))
+        header = [header for _, header in export.columns()]
+
+    rows = list(csv.reader(lines))
+
+    # a line at a time, quoted by the csv module
+    assert len(lines) == 6
+    assert rows[0] == header
+    assert rows[1][:7] == ['1', '3', 'Team "3", the robots', '', '40', '0', '40']
+
+
+def test_csv_with_breakdowns(teams):
+    with app.app_context():
+        rows = list(csv.reader(export.iter_csv(export_rows(True), True)))
+        header = 'Round 1 - Attempt 2 - {!s}'.format(export.mission_names()[0])
+
+    assert rows[1][rows[0].index(header)] == '40'
+
+
+def test_jsonl(teams):
+    rows = [json.loads(line) for line in export.iter_jsonl(export_rows())]
+
+    assert [row['number'] for row in rows] == [3, 5, 1, 2, 4]
+
+
+def test_download(teams):
+    client = app.test_client()
+
+    assert client.get('/judges/export').status_code in (302, 401)
+
+    with app.app_context():
+        user_id = str(User.query.filter_by(username='judge').one().id)
+
+    # as Flask-Login keeps a logged in user, under the key of older and newer versions
+    with client.session_transaction() as session:
+        session['user_id'] = session['_user_id'] = user_id
+        session['_fresh'] = True
+
+    response = client.get('/judges/export?format=jsonl', buffered=False)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="teams.jsonl"'
+    # streamed rather than sent with a length
+    assert 'Content-Length' not in response.headers
+
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['number'] for row in rows] == [3, 5, 1, 2, 4]
@@ -0,0 +1,69 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for query inspection.
+# -------------------------------------------------------------------------------------------------
+
+from lego.inspection import QueryInspector, statement_shape
+
+
+def inspector() -> QueryInspector:
+    return QueryInspector(max_queries=5, max_time=0.1, max_repeats=3, max_request_time=1.0)
+
+
+def distinct(count: int, seconds: float=0.001) -> list:
+    return [('SELECT * FROM table_{:d}'.format(n), seconds, 'routes.py:1 in index')
+            for n in range(count)]
+
+
+def test_within_budget_is_not_reported():
+    queries = inspector()
+
+    assert queries.check('GET', '/', 0.5, distinct(5)) is None
+    assert queries.reports() == []
+
+
+def test_too_many_queries():
+    report = inspector().check('GET', '/', 0.5, distinct(6))
+
+    assert report['problems'] == ['6 queries, budget is 5']
+
+
+def test_too_long_in_queries():
+    report = inspector().check('GET', '/', 0.5, distinct(2, 0.06))
+
+    assert report['problems'] == ['120.0ms in queries, budget is 100.0ms']
+    assert report['query_time'] == 0.12
+
+
+def test_too_long_in_total():
+    report = inspector().check('GET', '/', 1.5, distinct(1))
+
+    assert report['problems'] == ['1500.0ms in total, budget is 1000.0ms']
+
+
+def test_repeated_statement():
+    statements = [('SELECT * FROM score WHERE team_id = ?', 0.001, 'routes.py:10 in scores')] * 3
+    statements.append(('SELECT * FROM score WHERE team_id = ?', 0.001, 'routes.py:20 in team'))
+    statements.append(('SELECT * FROM team', 0.001, 'routes.py:5 in scores'))
+
+    report = inspector().check('GET', '/scores', 0.5, statements)
+
+    assert report['problems'] == ['Same statement run 4 times, possible N+1, from '
+                                  'routes.py:10 in scores, routes.py:20 in team']
+    assert [(group['count'], dict(group['origins'])) for group in report['groups']] == [
+        (4, {'routes.py:10 in scores': 3, 'routes.py:20 in team': 1}),
+        (1, {'routes.py:5 in scores': 1}),
+    ]
+
+
+def test_reports_most_recent_first():
+    queries = inspector()
+    queries.check('GET', '/first', 2.0, [])
+    queries.check('GET', '/second', 2.0, [])
+
+    assert [report['path'] for report in queries.reports()] == ['/second', '/first']
+
+
+def test_statement_shape():
+    assert statement_shape('SELECT *\n  FROM team WHERE id IN (?, ?,?)') == \
+        statement_shape('SELECT * FROM team WHERE id IN (?, ?)') == \
+        'SELECT * FROM team WHERE id IN (?, ...)'
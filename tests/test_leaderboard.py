@@ -0,0 +1,171 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the in-memory leaderboard.
+# -------------------------------------------------------------------------------------------------
+
+import random
+
+import pytest
+from sqlalchemy import text
+
+from lego import app, db
+from lego.leaderboard import IndexedSkipList
+from lego.models import State, Team
+from lego.models.score import NoAttemptsLeft
+
+
+@pytest.fixture
+def teams():
+    '''
+    Three teams with no scores in the first round, and the leaderboard built for them.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.commit()
+
+        for number in (1, 2, 3):
+            db.session.add(Team(number=number, name='Team {:d}'.format(number)))
+
+        db.session.commit()
+        app.stage.invalidate()
+        app.leaderboard.rebuild(0)
+        # reads in the test only see the changes applied as they commit, as the leaderboard is
+        # only synced from the database once per application context
+        app.leaderboard.sync()
+
+        yield {team.number: team for team in Team.query.all()}
+
+        db.session.remove()
+        db.drop_all()
+        app.leaderboard.invalidate()
+
+
+def test_changes_are_applied_on_commit(teams):
+    version = app.leaderboard._version
+    teams[3].set_score((100, ''))
+
+    # not even as the score's savepoint is released
+    assert app.leaderboard.rank(teams[3].id) == 3
+    assert app.leaderboard._version == version
+
+    db.session.commit()
+
+    assert app.leaderboard.rank(teams[3].id) == 1
+    assert app.leaderboard._version == State.current_version()
+
+
+def test_changes_are_discarded_on_rollback(teams):
+    teams[3].set_score((100, ''))
+    db.session.rollback()
+
+    assert app.leaderboard.rank(teams[3].id) == 3
+
+
+def test_savepoint_rollback_only_discards_its_own_changes(teams):
+    teams[3].set_score((100, ''))
+
+    with pytest.raises(ValueError):
+        with db.session.begin_nested():
+            teams[2].set_score((200, ''))
+            raise ValueError()
+
+    db.session.commit()
+
+    assert app.leaderboard.page(1, 4) == [teams[3].id, teams[1].id, teams[2].id]
+    assert app.leaderboard._version == State.current_version()
+
+
+def commit_elsewhere(*statements, **params):
+    '''
+    Commit a change the way another process would, moving the state version on but without the
+    listeners of this one applying it to the leaderboard.
+    '''
+    db.session.execute(text('UPDATE state SET version = version + 1 WHERE id = 1'))
+
+    for statement in statements:
+        db.session.execute(text(statement), params)
+
+    db.session.commit()
+
+
+def test_sync_reloads_teams_changed_elsewhere(teams):
+    commit_elsewhere('INSERT INTO score (team_id, stage, attempt_no, points) '
+                     'VALUES (:id, 0, 1, 100)',
+                     'UPDATE team SET version = (SELECT version FROM state WHERE id = 1) '
+                     'WHERE id = :id', id=teams[3].id)
+
+    # only checked once per request
+    assert app.leaderboard.rank(teams[3].id) == 3
+
+    with app.app_context():
+        assert app.leaderboard.rank(teams[3].id) == 1
+        assert app.leaderboard._version == State.current_version()
+        assert app.leaderboard.check_consistency() == []
+
+
+def test_sync_rebuilds_when_teams_are_removed(teams):
+    commit_elsewhere('DELETE FROM team WHERE id = :id', id=teams[1].id)
+
+    with app.app_context():
+        assert app.leaderboard.page(1, 4) == [teams[2].id, teams[3].id]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_skip_list_matches_a_sorted_list(seed):
+    rng = random.Random(seed)
+    # small, so the list has to grow past the size it was made for
+    keys = IndexedSkipList(expected_size=16)
+    expected = []
+
+    for _ in range(500):
+        key = rng.randrange(200)
+
+        if key in expected:
+            keys.remove(key)
+            expected.remove(key)
+        else:
+            keys.insert(key)
+            expected.append(key)
+            expected.sort()
+
+        assert len(keys) == len(expected)
+
+    assert list(keys) == expected
+    assert [keys.index(key) for key in expected] == list(range(len(expected)))
+    assert [keys[i] for i in range(len(expected))] == expected
+    assert keys[-1] == expected[-1]
+    assert list(keys.islice(10, 20)) == expected[10:20]
+
+    missing = next(key for key in range(200) if key not in expected)
+
+    with pytest.raises(KeyError):
+        keys.index(missing)
+
+    with pytest.raises(KeyError):
+        keys.remove(missing)
+
+
+def test_ranks_match_the_database(teams):
+    rng = random.Random(0)
+
+    for number in range(4, 21):
+        db.session.add(Team(number=number, name='Team {:d}'.format(number),
+                            active=number % 5 != 0))
+
+    db.session.commit()
+
+    for _ in range(40):
+        team = rng.choice(Team.query.all())
+
+        try:
+            team.set_score((rng.choice((0, 10, 20, 30)), ''))
+        except NoAttemptsLeft:
+            pass
+
+        db.session.commit()
+
+    assert app.leaderboard.check_consistency() == []
+
+    for team in Team.query.all():
+        assert app.leaderboard.rank(team.id) == team.rank
+        assert app.leaderboard.rank(team.id, active=True) == team.stage_rank
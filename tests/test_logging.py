@@ -0,0 +1,82 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the queued, structured logging, see `util.queue_logging`.
+# -------------------------------------------------------------------------------------------------
+
+import atexit
+import json
+import logging
+import sys
+import threading
+
+import lego.util as util
+
+
+class Records(logging.Handler):
+    '''
+    Keeps the records it handles, with the thread that handled them.
+    '''
+
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record, threading.current_thread()))
+
+
+def test_json_formatter():
+    formatter = util.JsonFormatter()
+    record = logging.LogRecord('lego', logging.WARNING, __file__, 10, 'Team %s scored %d',
+                               ('Robots', 40), None)
+    record.team = 3
+    record._private = 'hidden'
+
+    data = json.loads(formatter.format(record))
+
+    assert data['logger'] == 'lego'
+    assert data['level'] == 'WARNING'
+    assert data['message'] == 'Team Robots scored 40'
+    assert data['line'] == 10
+    assert data['team'] == 3
+    assert '_private' not in data
+    assert 'args' not in data
+
+
+def test_json_formatter_exceptions():
+    formatter = util.JsonFormatter()
+
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logging.makeLogRecord({'msg': 'failed', 'exc_info': sys.exc_info()})
+
+    assert 'ValueError: boom' in json.loads(formatter.format(record))['exception']
+
+
+def test_records_are_written_on_another_thread():
+    logger = logging.getLogger('lego.tests.queue')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    everything = Records()
+    warnings = Records(logging.WARNING)
+
+    listener = util.queue_logging(logger, everything, warnings)
+
+    try:
+        # arguments are merged with the message before the record is queued
+        team = ['Robots']
+        logger.info('Added %s', team)
+        team.append('changed')
+        logger.warning('Removed %s', 'Drones')
+    finally:
+        # stopped here to wait for the records, rather than as the tests exit
+        listener.stop()
+        atexit.unregister(listener.stop)
+
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+
+    assert [r.getMessage() for r, _ in everything.records] == ["Added ['Robots']",
+                                                               'Removed Drones']
+    assert [r.getMessage() for r, _ in warnings.records] == ['Removed Drones']
+    assert all(thread is not threading.current_thread() for _, thread in everything.records)
@@ -0,0 +1,63 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the request metrics served at `/metrics`.
+# -------------------------------------------------------------------------------------------------
+
+from lego import app
+from lego.metrics import RequestMetrics, Summary
+
+
+def test_summary_quantiles_use_the_nearest_rank():
+    summary = Summary(window=100)
+
+    for value in range(200, 0, -1):
+        summary.observe(value)
+
+    # only the most recent 100 observations, 100 down to 1, are in the window
+    assert summary.quantiles() == [(0.5, 51), (0.95, 96), (0.99, 100)]
+    assert (summary.count, summary.total) == (200, sum(range(1, 201)))
+
+
+def test_render():
+    metrics = RequestMetrics(window=10)
+
+    for duration in (0.1, 0.2, 0.3):
+        metrics.observe('index', 200, duration, 2, 0.01, 0.05)
+
+    metrics.observe('index', 404, 0.4, 1, 0.01, 0.0)
+
+    lines = metrics.render(gauges=[('lego_open', 'Open.', 3)],
+                           counters=[('lego_hits_total', 'Hits.', 7)]).splitlines()
+
+    assert '# TYPE lego_request_duration_seconds summary' in lines
+    assert 'lego_request_duration_seconds{endpoint="index",quantile="0.5"} 0.3' in lines
+    assert 'lego_request_duration_seconds{endpoint="index",quantile="0.99"} 0.4' in lines
+    assert 'lego_request_duration_seconds_count{endpoint="index"} 4' in lines
+    assert 'lego_request_queries_sum{endpoint="index"} 7.0' in lines
+
+    assert '# TYPE lego_responses_total counter' in lines
+    assert 'lego_responses_total{endpoint="index",status="200"} 3' in lines
+    assert 'lego_responses_total{endpoint="index",status="404"} 1' in lines
+
+    assert lines[-6:] == [
+        '# HELP lego_hits_total Hits.',
+        '# TYPE lego_hits_total counter',
+        'lego_hits_total 7',
+        '# HELP lego_open Open.',
+        '# TYPE lego_open gauge',
+        'lego_open 3',
+    ]
+
+
+def test_metrics_route(monkeypatch):
+    monkeypatch.setitem(app.config, 'LEGO_METRICS_TOKEN', 'secret')
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code in (302, 401)
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    lines = response.get_data(as_text=True).splitlines()
+
+    assert response.status_code == 200
+    assert '# TYPE lego_page_cache_hits_total counter' in lines
+    assert '# TYPE lego_page_cache_misses_total counter' in lines
+    assert '# TYPE lego_page_cache_size gauge' in lines
@@ -0,0 +1,142 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for upgrading databases created by earlier versions of the application.
+# -------------------------------------------------------------------------------------------------
+
+import json
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from lego import db
+import lego.migrations as migrations
+import lego.util as util
+
+
+# the schema created by `flask init` before any migrations existed
+BASELINE_SCHEMA = '''
+CREATE TABLE user (
+    id INTEGER NOT NULL,
+    username VARCHAR(80) NOT NULL,
+    password VARCHAR(80) NOT NULL,
+    is_judge BOOLEAN NOT NULL,
+    is_admin BOOLEAN NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_user_username ON user (username);
+CREATE TABLE team (
+    id INTEGER NOT NULL,
+    number INTEGER NOT NULL,
+    name VARCHAR(80) NOT NULL,
+    active BOOLEAN NOT NULL,
+    is_practice BOOLEAN NOT NULL,
+    attempt_1 INTEGER,
+    attempt_1_breakdown VARCHAR,
+    attempt_2 INTEGER,
+    attempt_2_breakdown VARCHAR,
+    attempt_3 INTEGER,
+    attempt_3_breakdown VARCHAR,
+    round_2 INTEGER,
+    round_2_breakdown VARCHAR,
+    quarter INTEGER,
+    quarter_breakdown VARCHAR,
+    semi INTEGER,
+    semi_breakdown VARCHAR,
+    final INTEGER,
+    final_breakdown VARCHAR,
+    PRIMARY KEY (id),
+    UNIQUE (number)
+);
+CREATE UNIQUE INDEX ix_team_name ON team (name);
+'''
+
+# (number, name, active, is_practice, attempt_1, attempt_1_breakdown, attempt_2, round_2, quarter)
+BASELINE_TEAMS = [
+    (1, 'Team 1', 1, 0, 100, "OrderedDict([('M01', 20), ('M02', 80)])", 50, 40, 30),
+    (2, 'Team 2', 1, 0, 120, None, None, 90, 10),
+    (3, 'Team 3', 0, 0, 200, None, 10, None, None),
+    (-1, 'Practice', 1, 1, 70, None, None, None, None),
+]
+
+# the original, as `baseline_db` replaces it
+util_load_stage = util.load_stage
+
+
+@pytest.fixture
+def baseline_db(tmpdir, monkeypatch):
+    '''
+    A database with the baseline schema and a few teams, and a stage file at the quarter final.
+    '''
+    path = str(tmpdir.join('app.db'))
+    stage_path = str(tmpdir.join('.stage'))
+
+    with open(stage_path, 'w') as fh:
+        fh.write('2')
+
+    monkeypatch.setattr(util, 'load_stage', lambda path=None: util_load_stage(stage_path))
+
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO team (number, name, active, is_practice, attempt_1, '
+                     'attempt_1_breakdown, attempt_2, round_2, quarter) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', BASELINE_TEAMS)
+    conn.commit()
+    conn.close()
+
+    engine = create_engine('sqlite:///' + path)
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_baseline_to_head(baseline_db):
+    applied = migrations.upgrade(baseline_db)
+
+    assert applied == [func.__name__ for func in migrations.MIGRATIONS]
+
+    with baseline_db.connect() as conn:
+        assert migrations.current_version(conn) == len(migrations.MIGRATIONS)
+        assert conn.execute(text('SELECT stage FROM state')).scalar() == 2
+        # clients of the leaderboard API from before the upgrade are sent everything
+        reset_version, version = conn.execute(text('SELECT reset_version, version FROM state')) \
+            .fetchone()
+        assert reset_version == version
+
+        scores = conn.execute(text('SELECT t.number, s.stage, s.attempt_no, s.points, '
+                                   's.breakdown FROM score s JOIN team t ON t.id = s.team_id '
+                                   'WHERE t.number = 1 ORDER BY s.stage, s.attempt_no'))
+        assert [tuple(row) for row in scores] == [
+            (1, 0, 1, 100, json.dumps({'M01': 20, 'M02': 80})),
+            (1, 0, 2, 50, None),
+            (1, 1, 1, 40, None),
+            (1, 2, 1, 30, None),
+        ]
+
+        missions = conn.execute(text('SELECT mission, points FROM mission_score '
+                                     'ORDER BY mission'))
+        assert [tuple(row) for row in missions] == [('M01', 20), ('M02', 80)]
+
+        # ranked for the quarter final, inactive teams are only in `rank`
+        ranks = conn.execute(text('SELECT number, rank, stage_rank FROM team '
+                                  'WHERE is_practice = 0 ORDER BY rank'))
+        assert [tuple(row) for row in ranks] == [(1, 1, 1), (2, 2, 2), (3, 3, None)]
+
+
+def test_upgraded_schema_matches_models(baseline_db):
+    migrations.upgrade(baseline_db)
+
+    with baseline_db.connect() as conn:
+        for table in db.metadata.sorted_tables:
+            rows = conn.execute(text('PRAGMA table_info({!s})'.format(table.name)))
+            columns = {row[1] for row in rows}
+
+            # older SQLite versions can't drop the old score columns, which are left unused
+            if sqlite3.sqlite_version_info < (3, 35, 0):
+                assert set(table.columns.keys()) <= columns
+            else:
+                assert columns == set(table.columns.keys())
+
+
+def test_upgrade_is_a_no_op_when_up_to_date(baseline_db):
+    migrations.upgrade(baseline_db)
+
+    assert migrations.upgrade(baseline_db) == []
@@ -0,0 +1,130 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for reloading the missions when `missions.json` changes, see `mission_registry`.
+# -------------------------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+
+import pytest
+
+from lego import app, db
+from lego.mission_registry import MissionRegistry
+from lego.models import State, Team
+
+
+@pytest.fixture
+def missions(tmpdir):
+    '''
+    A copy of the missions file and a registry checking it on every call.
+    '''
+    path = tmpdir.join('missions.json')
+
+    with open(app.missions.path, 'rb') as fh:
+        path.write_binary(fh.read())
+
+    return path, MissionRegistry(str(path), check_interval=0)
+
+
+def edit(path, points: str):
+    '''
+    Change the points of the first task, keeping the modification time ahead of the last check.
+    '''
+    data = json.loads(path.read_text('utf-8'))
+    data[next(iter(data))][0]['value'] = points
+    path.write_text(json.dumps(data), 'utf-8')
+
+    st = os.stat(str(path))
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+
+
+def test_version_is_a_hash_of_the_file(missions):
+    path, registry = missions
+
+    ruleset = registry.get()
+
+    assert ruleset.version == hashlib.sha1(path.read_binary()).hexdigest()[:12]
+    assert ruleset.missions
+    assert registry.get() is ruleset
+
+
+def test_reloaded_when_the_file_changes(missions):
+    path, registry = missions
+    ruleset = registry.get()
+
+    edit(path, '25')
+
+    reloaded = registry.get()
+
+    assert reloaded.version != ruleset.version
+    assert reloaded.form_class is not ruleset.form_class
+
+    # touched with the same contents, the compiled version is kept
+    os.utime(str(path), ns=(0, 0))
+
+    assert registry.get() is reloaded
+
+
+def test_invalid_file_keeps_the_previous_version(missions):
+    path, registry = missions
+    ruleset = registry.get()
+
+    path.write_text('{"M01 - Elevated Places": [', 'utf-8')
+    registry.invalidate()
+
+    assert registry.get() is ruleset
+
+    with pytest.raises(ValueError):
+        MissionRegistry(str(path)).get()
+
+
+def test_checked_at_most_once_per_interval(missions):
+    path, _ = missions
+    registry = MissionRegistry(str(path), check_interval=3600)
+    ruleset = registry.get()
+
+    edit(path, '25')
+
+    assert registry.get() is ruleset
+
+    registry.invalidate()
+
+    assert registry.get() is not ruleset
+
+
+def test_rules_are_revalidated():
+    client = app.test_client()
+    version = app.missions.get().version
+
+    response = client.get('/api/rules')
+    data = json.loads(response.get_data(as_text=True))
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert data['version'] == version
+
+    response = client.get('/api/rules', headers={'If-None-Match': response.headers['ETag']})
+
+    assert response.status_code == 304
+
+
+def test_scores_record_their_ruleset():
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.add(Team(number=1, name='Robots'))
+        db.session.commit()
+        app.stage.invalidate()
+
+        try:
+            team = Team.query.filter_by(number=1).one()
+            team.set_score((40, None), 'abcdef012345')
+            team.set_score((20, None))
+            db.session.commit()
+
+            assert [(score.points, score.ruleset) for score in team.scores] \
+                == [(40, 'abcdef012345'), (20, None)]
+        finally:
+            db.session.remove()
+            db.drop_all()
+            app.leaderboard.invalidate()
@@ -0,0 +1,128 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the public scoreboard pages.
+# -------------------------------------------------------------------------------------------------
+
+import re
+
+import pytest
+
+from lego import app, db
+from lego.cache import PageCache
+from lego.models import Score, State, Team
+
+
+# the number of teams, more than a page of the scoreboard
+TEAMS = 12
+
+
+@pytest.fixture
+def client():
+    '''
+    A test client for teams in the first round, ranked in reverse order of their numbers.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.commit()
+
+        for number in range(1, TEAMS + 1):
+            team = Team(number=number, name='Robots {:02d}'.format(number))
+            team.scores.append(Score(stage=0, attempt_no=1, points=number * 10))
+            db.session.add(team)
+
+        db.session.commit()
+        app.stage.invalidate()
+        app.leaderboard.invalidate()
+        app.page_cache.clear()
+
+    yield app.test_client()
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        app.leaderboard.invalidate()
+        app.page_cache.clear()
+
+
+def shown(response) -> list:
+    '''
+    The numbers of the teams on a page, in the order they are shown.
+    '''
+    assert response.status_code == 200
+    return [int(n) for n in re.findall(r'Robots (\d+)', response.get_data(as_text=True))]
+
+
+def test_scoreboard_pages(client):
+    assert shown(client.get('/scoreboard/')) == list(range(TEAMS, 2, -1))
+    assert shown(client.get('/scoreboard/10')) == [2, 1]
+
+
+def test_top_ten(client):
+    assert shown(client.get('/top_ten')) == list(range(TEAMS, 2, -1))
+
+
+def test_scoreboard_only_shows_active_teams(client):
+    with app.app_context():
+        Team.query.filter_by(number=TEAMS).one().active = False
+        db.session.commit()
+
+    assert shown(client.get('/scoreboard/')) == list(range(TEAMS - 1, 1, -1))
+
+
+def test_page_cache_evicts_the_least_recently_used_page():
+    cache = PageCache(max_size=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    cache.get('a')
+    cache.set('c', 'C')
+
+    assert [cache.get(key) for key in ('a', 'b', 'c')] == ['A', None, 'C']
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2}
+
+
+def test_pages_are_cached_until_a_score_changes(client):
+    shown(client.get('/scoreboard/'))
+    hits = app.page_cache.stats()['hits']
+
+    assert shown(client.get('/scoreboard/')) == list(range(TEAMS, 2, -1))
+    assert app.page_cache.stats()['hits'] == hits + 1
+
+    with app.app_context():
+        team = Team.query.filter_by(number=1).one()
+        team.set_score((500, ''))
+        db.session.commit()
+
+    assert shown(client.get('/scoreboard/')) == [1] + list(range(TEAMS, 3, -1))
+    assert app.page_cache.stats()['hits'] == hits + 1
+
+
+def test_unchanged_pages_are_not_modified(client):
+    response = client.get('/top_ten')
+    etag = response.headers['ETag']
+
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+
+    stats = app.page_cache.stats()
+    response = client.get('/top_ten', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+    # answered before looking in the cache
+    assert app.page_cache.stats() == stats
+
+    # a page whose arguments differ has a tag of its own
+    assert client.get('/scoreboard/10', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_changed_pages_are_sent_again(client):
+    etag = client.get('/top_ten').headers['ETag']
+
+    with app.app_context():
+        Team.query.filter_by(number=1).one().set_score((500, ''))
+        db.session.commit()
+
+    response = client.get('/top_ten', headers={'If-None-Match': etag})
+
+    assert shown(response)[0] == 1
+    assert response.headers['ETag'] != etag
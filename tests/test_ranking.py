@@ -0,0 +1,149 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the ranking of teams.
+#
+# The ranks stored on the teams are moved one team at a time as scores are submitted, so they are
+# checked against ranking every team again, and the different ways of ordering the teams against
+# each other.
+# -------------------------------------------------------------------------------------------------
+
+from functools import cmp_to_key
+import random
+
+import pytest
+
+from lego import app, db, util
+from lego.models import State, Team
+from lego.models.score import NoAttemptsLeft
+from lego.ranking import rank_key, rank_order, sort_teams, update_ranks
+
+
+# the number of teams ranked, some of which are practice teams or inactive
+TEAMS = 30
+
+
+@pytest.fixture
+def teams():
+    '''
+    Teams with no scores in the first round.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.commit()
+
+        for number in range(1, TEAMS + 1):
+            db.session.add(Team(number=number, name='Team {:d}'.format(number),
+                                is_practice=number % 10 == 0, active=number % 7 != 0))
+
+        db.session.commit()
+        app.stage.invalidate()
+        app.stage.set(0)
+
+        yield
+
+        db.session.remove()
+        db.drop_all()
+
+
+class Scores:
+    '''
+    A team's number and points by stage, with None for each attempt not made.
+    '''
+
+    def __init__(self, number: int, *stages):
+        self.number = number
+        self.stages = stages
+
+    def stage_scores(self, stage: int) -> list:
+        return list(self.stages[stage]) if stage < len(self.stages) else [None]
+
+
+def ranked_numbers(teams: list, stage: int) -> list:
+    with app.app_context():
+        return [team.number for team in sorted(teams, key=lambda t: rank_key(t, stage))]
+
+
+def test_rank_key_compares_best_attempts_first():
+    teams = [Scores(1, (10, 50, None)), Scores(2, (50, 20, None)), Scores(3, (50, 10, 30))]
+
+    assert ranked_numbers(teams, 0) == [3, 2, 1]
+
+
+def test_rank_key_compares_later_stages_first():
+    teams = [Scores(1, (90, None, None), (10,)), Scores(2, (10, None, None), (20,))]
+
+    assert ranked_numbers(teams, 0) == [1, 2]
+    assert ranked_numbers(teams, 1) == [2, 1]
+
+
+def test_rank_key_only_counts_zero_as_a_score_in_the_first_round():
+    # a 0 in round 2 ranks the same as no attempt, leaving the lower number first
+    teams = [Scores(2, (10, None, None), (0,)), Scores(1, (10, None, None), (None,))]
+    assert ranked_numbers(teams, 1) == [1, 2]
+
+    # whereas in the first round it beats no attempt
+    teams = [Scores(2, (0, None, None)), Scores(1, (None, None, None))]
+    assert ranked_numbers(teams, 0) == [2, 1]
+
+
+def ranked_teams() -> list:
+    db.session.expire_all()
+    return Team.query.filter_by(is_practice=False).all()
+
+
+def assert_stored_ranks(stage: int):
+    expected = sort_teams(ranked_teams(), stage)
+
+    assert [t.rank for t in expected] == list(range(1, len(expected) + 1))
+    assert [t.stage_rank for t in expected if t.active] == \
+        list(range(1, sum(t.active for t in expected) + 1))
+    assert all(t.stage_rank is None for t in expected if not t.active)
+
+    # nothing is left for ranking every team again to move
+    assert update_ranks(db.session.connection(), stage) == 0
+
+
+def submit_scores(rng: random.Random, count: int):
+    for _ in range(count):
+        team = rng.choice(Team.query.all())
+
+        # few distinct scores, so teams often tie
+        try:
+            team.set_score((rng.choice((0, 10, 20, 30, 40)), ''))
+        except NoAttemptsLeft:
+            pass
+
+        db.session.commit()
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_stored_ranks_match_ranking_every_team(teams, seed):
+    rng = random.Random(seed)
+
+    submit_scores(rng, 40)
+    assert_stored_ranks(0)
+
+    # an edited score moves the team too
+    for score in rng.sample([s for t in ranked_teams() for s in t.scores], 5):
+        score.points = rng.choice((0, 50))
+        db.session.commit()
+
+    assert_stored_ranks(0)
+
+    app.stage.set(1)
+    assert_stored_ranks(1)
+
+    submit_scores(rng, 20)
+    assert_stored_ranks(1)
+
+
+def test_orders_agree(teams):
+    submit_scores(random.Random(0), 40)
+    app.stage.set(1)
+    submit_scores(random.Random(1), 20)
+
+    teams = ranked_teams()
+    expected = sorted(teams, key=cmp_to_key(util.compare_teams))
+
+    assert sort_teams(teams, 1) == expected
+    assert Team.query.filter_by(is_practice=False).order_by(*rank_order(1)).all() == expected
@@ -0,0 +1,115 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for scoring a round from the judges' score sheet in a single POST.
+# -------------------------------------------------------------------------------------------------
+
+import pytest
+
+from lego import app, db
+from lego.models import State, Team, User
+
+
+@pytest.fixture
+def client():
+    '''
+    A test client logged in as a judge, for a team and the practice team in the first round.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.add(User(username='judge', password=b'', is_judge=True))
+        db.session.add(Team(number=-1, name='Practice', is_practice=True))
+        db.session.add(Team(number=1, name='Robots'))
+        db.session.commit()
+        app.stage.invalidate()
+
+        user_id = str(User.query.filter_by(username='judge').one().id)
+
+    client = app.test_client()
+
+    # as Flask-Login keeps a logged in user, under the key of older and newer versions
+    with client.session_transaction() as session:
+        session['user_id'] = session['_user_id'] = user_id
+        session['_fresh'] = True
+
+    yield client
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        app.leaderboard.invalidate()
+
+
+def team_id(number: int) -> str:
+    with app.app_context():
+        return str(Team.query.filter_by(number=number).one().id)
+
+
+def scores(number: int) -> list:
+    with app.app_context():
+        return [(score.points, score.ruleset)
+                for score in Team.query.filter_by(number=number).one().scores]
+
+
+def sheet(number: int, **data) -> dict:
+    '''
+    A score sheet with the first task of the first mission done.
+    '''
+    with app.app_context():
+        ruleset = app.missions.get()
+        mission = next(iter(ruleset.missions))
+        data.setdefault('missions-{!s}-0'.format(mission), ruleset.missions[mission][0]['value'])
+
+    data['team'] = team_id(number)
+    return data
+
+
+def points(data: dict) -> int:
+    with app.app_context():
+        return app.missions.get().plan.evaluate(data)[0]
+
+
+def test_submitted_in_one_post(client):
+    data = sheet(1, confirm='1')
+    data['score'] = str(points(data))
+
+    response = client.post('/judges/score_round', data=data)
+
+    assert response.status_code == 302
+    assert scores(1) == [(points(data), app.missions.get().version)]
+
+
+def test_out_of_date_totals_are_recalculated(client):
+    data = sheet(1, confirm='1')
+    data['score'] = str(points(data) + 1)
+
+    response = client.post('/judges/score_round', data=data)
+
+    assert response.status_code == 200
+    assert 'recalculated as {:d}'.format(points(data)) in response.get_data(as_text=True)
+    assert scores(1) == []
+
+
+def test_calculated_then_confirmed(client):
+    data = sheet(1)
+
+    response = client.post('/judges/score_round', data=data)
+
+    assert response.status_code == 200
+    assert 'Score: {:d}'.format(points(data)) in response.get_data(as_text=True)
+    assert scores(1) == []
+
+    data['confirm'] = '1'
+
+    assert client.post('/judges/score_round', data=data).status_code == 302
+    assert [total for total, _ in scores(1)] == [points(data)]
+
+
+def test_practice_attempts_are_not_saved(client):
+    data = sheet(-1, confirm='1')
+    data['score'] = str(points(data))
+
+    response = client.post('/judges/score_round', data=data)
+
+    assert response.status_code == 200
+    assert 'Practice attempt' in response.get_data(as_text=True)
+    assert scores(-1) == []
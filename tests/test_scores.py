@@ -0,0 +1,155 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the scores of each team, stored a row per attempt, see `models.score`.
+# -------------------------------------------------------------------------------------------------
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from lego import app, db
+from lego.models import Score, State, Team
+from lego.models.score import NoAttemptsLeft, parse_score_key, score_key, score_keys, score_label
+
+
+@pytest.fixture
+def team():
+    '''
+    A team without scores in the first round.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.add(Team(number=1, name='Robots'))
+        db.session.commit()
+        app.stage.invalidate()
+
+        yield Team.query.filter_by(number=1).one()
+
+        db.session.remove()
+        db.drop_all()
+        app.leaderboard.invalidate()
+
+
+@pytest.fixture
+def two_quarter_attempts(monkeypatch):
+    monkeypatch.setitem(app.config, 'LEGO_STAGE_ATTEMPTS', (3, 1, 2, 1, 1))
+
+
+@pytest.mark.parametrize('key, stage, attempt_no', [
+    ('attempt_1', 0, 1),
+    ('attempt_3', 0, 3),
+    ('round_2', 1, 1),
+    ('quarter', 2, 1),
+    ('final', 4, 1),
+])
+def test_score_keys(key, stage, attempt_no):
+    with app.app_context():
+        assert score_key(stage, attempt_no) == key
+        assert parse_score_key(key) == (stage, attempt_no)
+
+
+@pytest.mark.parametrize('key', ['attempt_4', 'attempt_0', 'attempt', 'quarter_2', 'semi_x',
+                                 'team'])
+def test_unknown_score_keys(key):
+    with app.app_context():
+        with pytest.raises(ValueError):
+            parse_score_key(key)
+
+
+def test_further_attempts(two_quarter_attempts):
+    with app.app_context():
+        assert parse_score_key('quarter_2') == (2, 2)
+        assert score_key(2, 2) == 'quarter_2'
+        assert score_label(2, 2) == 'Quarter Final - Attempt 2'
+        assert score_label(3, 1) == 'Semi Final'
+        assert len(score_keys()) == 8
+
+
+def test_stage_scores(team):
+    team.scores.append(Score(stage=0, attempt_no=2, points=40))
+    team.scores.append(Score(stage=2, attempt_no=1, points=10))
+    db.session.commit()
+
+    assert team.stage_scores(0) == [None, 40, None]
+    assert team.stage_scores(2) == [10]
+    assert team.best_score(0) == 40
+    assert team.best_score(1) is None
+    assert team.round_1_total == 40
+
+
+def test_edit_round_score(team):
+    team.edit_round_score('attempt_3', 30)
+    db.session.commit()
+
+    assert team.stage_scores(0) == [None, None, 30]
+
+    team.edit_round_score('attempt_3', 50)
+    team.edit_round_score('round_2', 20)
+    db.session.commit()
+
+    assert [(s.stage, s.attempt_no, s.points) for s in Score.query.order_by(Score.id)] \
+        == [(0, 3, 50), (1, 1, 20)]
+
+    team.reset_round_score('attempt_3')
+    db.session.commit()
+
+    assert team.stage_scores(0) == [None, None, None]
+    assert Score.query.count() == 1
+
+
+def test_scores_take_the_first_free_attempt(team):
+    team.edit_round_score('attempt_1', 10)
+    team.edit_round_score('attempt_3', 30)
+    db.session.commit()
+
+    team.set_score((20, None))
+    db.session.commit()
+
+    assert team.stage_scores(0) == [10, 20, 30]
+
+
+def test_one_score_per_attempt(team):
+    team.scores.append(Score(stage=0, attempt_no=1, points=10))
+    db.session.commit()
+
+    db.session.add(Score(team_id=team.id, stage=0, attempt_no=1, points=20))
+
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+    db.session.rollback()
+
+
+def test_no_attempts_left(team):
+    for points in (10, 20, 30):
+        team.set_score((points, None))
+
+    with pytest.raises(NoAttemptsLeft):
+        team.set_score((40, None))
+
+    db.session.commit()
+
+    assert team.stage_scores(0) == [10, 20, 30]
+
+
+def test_last_attempt_taken_elsewhere(team):
+    team.set_score((10, None))
+    team.set_score((20, None))
+    db.session.commit()
+
+    # the team's scores are already loaded, so only the database knows the last attempt was taken
+    assert len(team.scores) == 2
+    db.session.execute(text('INSERT INTO score (team_id, stage, attempt_no, points) '
+                            'VALUES (:team_id, 0, 3, 30)'), {'team_id': team.id})
+
+    team.name = 'Robots 2'
+
+    with pytest.raises(NoAttemptsLeft):
+        team.set_score((40, None))
+
+    # only the score was rolled back, the rest of the transaction is kept
+    db.session.commit()
+    db.session.expire_all()
+
+    assert team.name == 'Robots 2'
+    assert team.stage_scores(0) == [10, 20, 30]
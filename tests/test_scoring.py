@@ -0,0 +1,139 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the scoring plan compiled from `missions.json`.
+#
+# Rounds used to be scored by walking the fields of the score form. The compiled plan must score
+# every submission the same way, so it is checked against that walk, kept here, for random
+# submissions. Run after changing the missions or bonuses.
+# -------------------------------------------------------------------------------------------------
+
+from collections import OrderedDict
+import random
+
+import pytest
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField, StringField
+
+from lego import app
+import lego.scoring as scoring
+
+
+# the number of random submissions checked
+CASES = 1000
+
+
+def random_submission(missions: OrderedDict, rng: random.Random) -> MultiDict:
+    '''
+    Form data for a random submission of the score form.
+    '''
+    formdata = MultiDict({'team': '1'})
+
+    if rng.random() < 0.5:
+        formdata['small_home_zone'] = 'y'
+
+    for mission, tasks in missions.items():
+        for task_no, task in enumerate(tasks):
+            name = scoring.field_name(mission, task_no)
+
+            # fields are sometimes left out entirely, as when a browser doesn't send them
+            if rng.random() < 0.3:
+                continue
+
+            # the score sheet disables fields until the field they require is checked, so they
+            # aren't sent
+            if 'requires' in task:
+                if scoring.field_name(mission, task['requires']) not in formdata:
+                    continue
+
+            if task['type'] in ('BooleanField', 'CheckboxField'):
+                formdata[name] = 'y'
+            elif task['type'] in ('RadioField', 'SelectField'):
+                formdata[name] = rng.choice(task['choices'])['value']
+
+    return formdata
+
+
+def mission_score(mission) -> int:
+    '''
+    Score a mission of the score form by its fields, as it was scored before the missions were
+    compiled.
+    '''
+    score = 0
+
+    for task in mission.form:
+        if isinstance(task, StringField):
+            # strings do not carry any score
+            continue
+        elif isinstance(task, BooleanField):
+            if task.data is False:
+                return 0
+        else:
+            score += int(task.data)
+
+    return score
+
+
+def reference_score(form_class, formdata: MultiDict) -> (int, OrderedDict):
+    '''
+    Score a submission by walking the fields of the score form, with the bonuses the form used
+    before they were moved to `missions.json`.
+    '''
+    with app.test_request_context(method='POST', data=formdata):
+        form = form_class(formdata=formdata, meta={'csrf': False})
+        breakdown = OrderedDict()
+        bonus = 0
+
+        for mission_name, mission in form.missions.form._fields.items():
+            breakdown[mission_name] = mission_score(mission)
+
+            if form.small_home_zone.data is True and breakdown[mission_name] > 0:
+                if mission_name != 'M14 - Precision':
+                    bonus += 5
+
+                if mission_name == 'M02 - Crane (score all that apply)':
+                    bonus += 5
+
+    return max(0, sum(breakdown.values()) + bonus), breakdown
+
+
+@pytest.fixture
+def ruleset():
+    with app.app_context():
+        yield app.missions.get()
+
+
+def test_plan_matches_form_when_nothing_is_submitted(ruleset):
+    # only the team, as the form is always sent with it. Empty form data isn't processed by WTForms,
+    # so the fields would keep their defaults rather than be unchecked
+    formdata = MultiDict({'team': '1'})
+
+    # choices that count down score their default
+    total, breakdown = ruleset.plan.evaluate(formdata)
+
+    assert list(breakdown) == list(ruleset.missions)
+    assert reference_score(ruleset.form_class, formdata) == (total, breakdown)
+
+
+def test_plan_matches_form_when_every_task_is_done(ruleset):
+    formdata = MultiDict({'team': '1', 'small_home_zone': 'y'})
+
+    for mission, tasks in ruleset.missions.items():
+        for task_no, task in enumerate(tasks):
+            name = scoring.field_name(mission, task_no)
+
+            if task['type'] in ('BooleanField', 'CheckboxField'):
+                formdata[name] = 'y'
+            elif task['type'] in ('RadioField', 'SelectField'):
+                formdata[name] = task['choices'][-1]['value']
+
+    assert ruleset.plan.evaluate(formdata) == reference_score(ruleset.form_class, formdata)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_plan_matches_form_for_random_submissions(ruleset, seed):
+    rng = random.Random(seed)
+
+    for _ in range(CASES // 4):
+        formdata = random_submission(ruleset.missions, rng)
+
+        assert ruleset.plan.evaluate(formdata) == reference_score(ruleset.form_class, formdata), \
+            formdata.to_dict()
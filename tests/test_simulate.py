@@ -0,0 +1,65 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for `flask simulate`.
+# -------------------------------------------------------------------------------------------------
+
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+import pytest
+
+from lego import app, db
+from lego.cli import simulate
+from lego.models import State, Team
+
+
+@pytest.fixture
+def database():
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.add(Team(number=-1, name='Practice', is_practice=True))
+        db.session.commit()
+        app.stage.invalidate()
+
+    yield
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        app.leaderboard.invalidate()
+
+
+def run(*args) -> str:
+    result = CliRunner().invoke(simulate, ['--headless', '--seed', '1'] + list(args),
+                                obj=ScriptInfo(create_app=lambda *_: app))
+
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+@pytest.mark.parametrize('app_type, active', [('uk', 2), ('bristol', 2)])
+def test_simulate(database, app_type, active):
+    output = run('--teams', '20', '--app-type', app_type, '--keep-teams')
+
+    assert 'Complete!' in output
+    assert 'Set stage final' in output
+
+    with app.app_context():
+        teams = Team.query.filter_by(is_practice=False).all()
+
+        assert len(teams) == 20
+        assert sum(team.active for team in teams) == active
+        # everyone made their three attempts in the first round
+        assert all(len(team.stage_scores(0)) == 3 and None not in team.stage_scores(0)
+                   for team in teams)
+        assert app.load_stage() == 4
+        assert app.leaderboard.check_consistency() == []
+
+    # the format given is only used for the simulation
+    assert app.config['LEGO_APP_TYPE'] == 'uk'
+
+
+def test_simulate_removes_its_teams(database):
+    run('--teams', '5')
+
+    with app.app_context():
+        assert [team.number for team in Team.query.all()] == [-1]
@@ -0,0 +1,117 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the current stage.
+# -------------------------------------------------------------------------------------------------
+
+import pytest
+from sqlalchemy import text
+
+from lego import app, db
+from lego.models import Score, State, Team
+from lego.stage import StageService
+
+
+@pytest.fixture
+def stage():
+    '''
+    A stage service of its own, with the stage listeners it called, for an empty database in the
+    first round.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.commit()
+
+        service = StageService()
+        service.changes = []
+        service.subscribe(service.changes.append)
+
+        yield service
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_read_once_per_app_context(stage):
+    assert stage.get() == 0
+
+    # e.g. another process moving to the next stage
+    db.session.execute(text('UPDATE state SET stage = 2 WHERE id = 1'))
+    db.session.commit()
+
+    assert stage.get() == 0
+
+    with app.app_context():
+        assert stage.get() == 2
+
+    assert stage.changes == [2]
+
+
+def test_set_notifies_listeners(stage):
+    stage.get()
+    stage.set(1)
+
+    assert stage.get() == 1
+    assert State.query.get(1).stage == 1
+    assert stage.changes == [1]
+
+    # only once it changes
+    stage.set(1)
+
+    assert stage.changes == [1]
+
+
+def test_set_rejects_invalid_stages(stage):
+    with pytest.raises(ValueError):
+        stage.set(5)
+
+    assert stage.get() == 0
+    assert stage.changes == []
+
+
+def add_teams(count: int):
+    '''
+    Add teams with a score in the first round, ranked in order of their number, and the practice
+    team.
+    '''
+    db.session.add(Team(number=-1, name='Practice', is_practice=True))
+
+    for number in range(1, count + 1):
+        team = Team(number=number, name='Team {:d}'.format(number))
+        team.scores.append(Score(stage=0, attempt_no=1, points=10 * (count - number)))
+        db.session.add(team)
+
+    db.session.commit()
+
+
+def active_teams() -> list:
+    return [number for number, in db.session.query(Team.number)
+            .filter_by(active=True, is_practice=False).order_by(Team.number)]
+
+
+def test_qualify(stage):
+    add_teams(15)
+    # knocked out earlier, so stays out whatever its rank
+    Team.query.filter_by(number=2).one().active = False
+    db.session.commit()
+
+    stage.set(1, qualify=True)
+
+    # the uk format takes the best 12 active teams through to round 2
+    assert active_teams() == [1] + list(range(3, 14))
+    assert Team.query.filter_by(number=-1).one().active
+    assert {team.version for team in Team.query.filter(Team.number > 13)} \
+        == {State.query.get(1).version}
+
+    stage.set(2, qualify=True)
+
+    assert active_teams() == [1] + list(range(3, 10))
+    assert [team.stage_rank for team in Team.query.filter_by(active=True, is_practice=False)
+            .order_by(Team.number)] == list(range(1, 9))
+
+
+def test_set_without_qualifying(stage):
+    add_teams(15)
+
+    stage.set(1)
+
+    assert len(active_teams()) == 15
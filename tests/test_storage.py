@@ -0,0 +1,214 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the single writer that commits scores, see `storage.WriteQueue`.
+# -------------------------------------------------------------------------------------------------
+
+import threading
+
+import pytest
+
+from lego import app, db
+from lego.models import State, Team
+from lego.models.score import NoAttemptsLeft
+from lego.storage import WriteQueue, WriteTimeout, _STOP
+
+
+@pytest.fixture
+def writer():
+    '''
+    A writer of its own, leaving checkpoints to SQLite.
+    '''
+    writer = WriteQueue(checkpoint_interval=0, timeout=5)
+
+    yield writer
+
+    writer.stop()
+
+
+def submit_later(writer: WriteQueue, func, *args) -> list:
+    '''
+    Submit a write from another thread, returning a list that is given its result or exception.
+    '''
+    outcome = []
+
+    def run():
+        try:
+            outcome.append(writer.submit(func, *args))
+        except Exception as exc:
+            outcome.append(exc)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    outcome.append(thread)
+
+    return outcome
+
+
+def block_writer(writer: WriteQueue) -> (threading.Event, list):
+    '''
+    Keep the writer busy until the returned event is set, so the writes submitted meanwhile are
+    committed together.
+    '''
+    started = threading.Event()
+    release = threading.Event()
+
+    def wait():
+        started.set()
+        release.wait(5)
+        return 'first'
+
+    outcome = submit_later(writer, wait)
+    started.wait(5)
+
+    return release, outcome
+
+
+def submit_queued(writer: WriteQueue, func, *args) -> list:
+    '''
+    Submit a write from another thread while the writer is busy, waiting for it to be queued so
+    writes are queued in the order submitted.
+    '''
+    size = writer._queue.qsize()
+    outcome = submit_later(writer, func, *args)
+
+    while writer._queue.qsize() == size:
+        threading.Event().wait(0.001)
+
+    return outcome
+
+
+def finish(*outcomes):
+    for outcome in outcomes:
+        outcome[0].join(5)
+
+    return [outcome[1] for outcome in outcomes]
+
+
+def test_writes_are_run_on_the_writer_thread(writer):
+    assert writer.submit(lambda: threading.current_thread().name) == 'db-writer'
+    # and a write submitted by a write is part of its batch
+    assert writer.submit(lambda: writer.submit(lambda: threading.current_thread().name)) \
+        == 'db-writer'
+    assert writer.stats == {'commits': 2, 'writes': 2}
+
+
+def test_writes_submitted_together_are_committed_together(writer):
+    release, first = block_writer(writer)
+    later = [submit_queued(writer, lambda number=number: number) for number in range(3)]
+
+    release.set()
+
+    assert finish(first, *later) == ['first', 0, 1, 2]
+    assert writer.stats == {'commits': 2, 'writes': 4}
+
+
+def test_failing_writes_are_isolated(writer):
+    runs = []
+
+    def write(number):
+        runs.append(number)
+
+        if number == 1:
+            raise NoAttemptsLeft()
+
+        return number
+
+    release, first = block_writer(writer)
+    later = [submit_queued(writer, write, number) for number in range(3)]
+
+    release.set()
+    results = finish(first, *later)
+
+    assert results[:2] == ['first', 0]
+    assert isinstance(results[2], NoAttemptsLeft)
+    assert results[3] == 2
+    # run together until one failed, rolled back, then each run again on its own
+    assert runs == [0, 1, 0, 1, 2]
+    assert writer.stats == {'commits': 3, 'writes': 3}
+
+
+def test_timeout_before_the_write_started(writer):
+    runs = []
+    release, first = block_writer(writer)
+    writer.timeout = 0.05
+
+    with pytest.raises(WriteTimeout) as exc_info:
+        writer.submit(runs.append, 1)
+
+    release.set()
+    writer.timeout = 5
+
+    assert finish(first) == ['first']
+
+    writer.submit(runs.append, 2)
+
+    assert not exc_info.value.started
+    assert 'not saved' in str(exc_info.value)
+    # cancelled rather than written once the writer was free
+    assert runs == [2]
+
+
+def test_timeout_after_the_write_started(writer):
+    release = threading.Event()
+    runs = []
+
+    def write():
+        release.wait(5)
+        runs.append(1)
+
+    writer.timeout = 0.05
+
+    with pytest.raises(WriteTimeout) as exc_info:
+        writer.submit(write)
+
+    release.set()
+    writer.timeout = 5
+    writer.submit(runs.append, 2)
+
+    assert exc_info.value.started
+    # still committed, before the writes submitted after it
+    assert runs == [1, 2]
+    assert writer.stats == {'commits': 2, 'writes': 2}
+
+
+def test_writer_is_restarted(writer):
+    assert writer.submit(lambda: 1) == 1
+
+    # stopped without the queue knowing, as if the thread died
+    thread = writer._thread
+    writer._queue.put(_STOP)
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert writer.submit(lambda: 2) == 2
+    assert writer._thread is not thread
+
+
+def test_inline_writes_are_rolled_back():
+    writer = WriteQueue(enabled=False)
+
+    def rename(name):
+        Team.query.filter_by(number=1).one().name = name
+
+        if name == 'Drones':
+            raise NoAttemptsLeft()
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.add(Team(number=1, name='Robots'))
+        db.session.commit()
+
+        try:
+            with pytest.raises(NoAttemptsLeft):
+                writer.submit(rename, 'Drones')
+
+            assert Team.query.filter_by(number=1).one().name == 'Robots'
+
+            writer.submit(rename, 'Rovers')
+            db.session.remove()
+
+            assert Team.query.filter_by(number=1).one().name == 'Rovers'
+        finally:
+            db.session.remove()
+            db.drop_all()
+            app.leaderboard.invalidate()
@@ -0,0 +1,133 @@
+# -------------------------------------------------------------------------------------------------
+# Tests for the bulk import of teams, see `flask add-teams`.
+# -------------------------------------------------------------------------------------------------
+
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+import pytest
+
+from lego import app, db
+from lego.cli import reset_teams
+from lego.models import State, Team
+import lego.team_import as team_import
+
+
+@pytest.fixture
+def teams():
+    '''
+    An empty database with two teams.
+    '''
+    with app.app_context():
+        db.create_all()
+        db.session.add(State(id=1, version=0, stage=0))
+        db.session.add(Team(number=1, name='Alpha'))
+        db.session.add(Team(number=2, name='Beta'))
+        db.session.commit()
+
+        yield
+
+        db.session.remove()
+        db.drop_all()
+
+
+def names() -> dict:
+    db.session.expire_all()
+    return {team.number: team.name for team in Team.query.all()}
+
+
+def errors(lines: list) -> list:
+    with pytest.raises(team_import.InvalidTeams) as info:
+        team_import.parse_teams(lines)
+
+    return info.value.errors
+
+
+def test_parse_lines():
+    records = team_import.parse_teams(['1, Alpha\n', '\n', '2,Beta, the second\n'])
+
+    assert records == [(1, 1, 'Alpha'), (3, 2, 'Beta, the second')]
+
+
+def test_parse_csv_with_header():
+    records = team_import.parse_teams(['\ufeffName,Number\n', '"Alpha, A",1\n', 'Beta,2\n'])
+
+    assert records == [(2, 1, 'Alpha, A'), (3, 2, 'Beta')]
+
+
+def test_parse_reports_every_problem():
+    assert errors(['x, Alpha\n', '0, Beta\n', '3,\n', 'Gamma\n']) == [
+        (1, 'Invalid number: x'),
+        (2, 'Invalid number: 0. Must be greater than 0.'),
+        (3, 'Missing name for team 3.'),
+        (4, 'Expected a number and a name: Gamma'),
+    ]
+
+
+def test_parse_rejects_duplicate_numbers():
+    assert errors(['1, Alpha\n', '2, Beta\n', '1, Gamma\n']) == [
+        (3, 'Duplicate number 1, first used on line 1.'),
+    ]
+
+
+def test_parse_rejects_duplicate_names():
+    assert errors(['1, Alpha\n', '2, Alpha\n']) == [
+        (2, 'Duplicate name Alpha, first used on line 1.'),
+    ]
+
+
+def test_import_adds_teams(teams):
+    result = team_import.import_teams(team_import.parse_teams(['3, Gamma\n', '4, Delta\n']))
+    db.session.commit()
+
+    assert result == (2, 0)
+    assert names() == {1: 'Alpha', 2: 'Beta', 3: 'Gamma', 4: 'Delta'}
+    assert [t.rank for t in Team.query.order_by(Team.number)] == [1, 2, 3, 4]
+
+
+def test_import_rejects_existing_teams(teams):
+    records = team_import.parse_teams(['1, Gamma\n', '3, Beta\n', '4, Delta\n'])
+
+    with pytest.raises(team_import.InvalidTeams) as info:
+        team_import.import_teams(records)
+
+    assert info.value.errors == [
+        (1, 'Team 1 already exists.'),
+        (2, 'The name Beta is already used by team 2.'),
+    ]
+    db.session.rollback()
+    assert names() == {1: 'Alpha', 2: 'Beta'}
+
+
+def test_upsert_renames_teams(teams):
+    result = team_import.import_teams(team_import.parse_teams(['1, Gamma\n', '3, Delta\n']),
+                                      upsert=True)
+    db.session.commit()
+
+    assert result == (1, 1)
+    assert names() == {1: 'Gamma', 2: 'Beta', 3: 'Delta'}
+
+
+def test_upsert_swaps_names(teams):
+    result = team_import.import_teams(
+        team_import.parse_teams(['1, Beta\n', '2, Gamma\n', '3, Alpha\n']), upsert=True)
+    db.session.commit()
+
+    assert result == (1, 2)
+    assert names() == {1: 'Beta', 2: 'Gamma', 3: 'Alpha'}
+
+
+def test_upsert_rejects_names_of_teams_not_renamed(teams):
+    with pytest.raises(team_import.InvalidTeams) as info:
+        team_import.import_teams(team_import.parse_teams(['1, Beta\n']), upsert=True)
+
+    assert info.value.errors == [(1, 'The name Beta is already used by team 2.')]
+
+
+def test_reset_teams(teams):
+    db.session.add(Team(number=-1, name='Practice', is_practice=True))
+    db.session.commit()
+
+    result = CliRunner().invoke(reset_teams, ['--yes'], obj=ScriptInfo(create_app=lambda *_: app))
+
+    assert result.exit_code == 0, result.output
+    assert names() == {-1: 'Practice'}